@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""
+Summarizes the branch annotations that ASTRAL exports to freqQuad.csv with -t 16 or -t 32, and plots the relative
+quartet frequencies of the three topologies around every branch.
+
+freqQuad.csv has three lines per branch, one per topology (t1 is the main topology of the species tree), with the
+quartet as lists of taxa, the posterior (-t 16) or normalized quartet score (-t 32), the number of gene trees that
+support the topology and the effective number of gene trees. The file is read one branch at a time and written
+as one row per branch without the taxon lists. Only the three frequencies of every branch are kept for the plot.
+"""
+import argparse
+import importlib.util
+import math
+
+# Colors of the main topology and the two alternatives, as in the DiscoVista plots
+TOPOLOGY_COLORS = ['#d53e4f', '#1d91c0', '#41b6c4']
+TOPOLOGIES = ['t1', 't2', 't3']
+# Quartet groups around a branch: the two sides of the main topology, each split in two
+GROUP_COLUMNS = ['left_taxa', 'right_taxa', 'sister_taxa', 'other_taxa']
+OUTPUT_FORMATS = ['tsv', 'parquet']
+RECORD_BATCH_SIZE = 1024
+
+
+def summary_columns(annotation):
+    columns = ['node', 'effective_genes', 'f1', 'f2', 'f3', 'q1', 'q2', 'q3']
+    if annotation == 16:
+        columns += ['pp1', 'pp2', 'pp3']
+    return columns + ['main_topology_supported'] + GROUP_COLUMNS
+
+
+def group_sizes(quartet):
+    """
+    Returns the number of taxa in each of the four groups of a quartet written as {A}|{B}#{C}|{D}.
+    """
+    return [group.count(',') + 1 for half in quartet.split('#') for group in half.split('|')]
+
+
+def read_branches(handle):
+    """
+    Yields the node name and the (topology, quartet, value, support, effective genes) lines of every branch.
+    """
+    node = None
+    lines = []
+    for number, line in enumerate(handle, start=1):
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) < 6:
+            if line.strip():
+                raise ValueError(f'line {number} has {len(fields)} columns, expected 6')
+            continue
+        if fields[0] != node:
+            if lines:
+                yield node, lines
+            node, lines = fields[0], []
+        try:
+            lines.append((fields[1], fields[2], float(fields[3]), float(fields[4]), float(fields[5])))
+        except ValueError:
+            raise ValueError(f'line {number} has a value that is not a number')
+    if lines:
+        yield node, lines
+
+
+def summarize_branch(node, lines, annotation):
+    """
+    Returns the summary row of one branch, with the values of missing topologies as NaN.
+    """
+    by_topology = {topology: (quartet, value, support, genes) for topology, quartet, value, support, genes in lines}
+    effective_genes = max(genes for _, _, _, _, genes in lines)
+    row = {'node': node, 'effective_genes': effective_genes}
+    for index, topology in enumerate(TOPOLOGIES, start=1):
+        _, value, support, _ = by_topology.get(topology, (None, math.nan, math.nan, None))
+        row[f'f{index}'] = support
+        row[f'q{index}'] = support / effective_genes if effective_genes else math.nan
+        if annotation == 16:
+            row[f'pp{index}'] = value
+    alternatives = [row['q2'], row['q3']]
+    row['main_topology_supported'] = all(row['q1'] >= q for q in alternatives if not math.isnan(q))
+    main_quartet = by_topology.get('t1', lines[0][:2])[0]
+    row.update(zip(GROUP_COLUMNS, group_sizes(main_quartet)))
+    return row
+
+
+class TsvSummaryWriter:
+    def __init__(self, output_path, columns):
+        self.columns = columns
+        self.out = open(output_path, 'w')
+        self.out.write('\t'.join(columns) + '\n')
+
+    def write_batch(self, rows):
+        self.out.write(''.join('\t'.join(format_value(row[column]) for column in self.columns) + '\n'
+                               for row in rows))
+
+    def close(self):
+        self.out.close()
+
+
+class ParquetSummaryWriter:
+    """
+    Writes the summary to a Parquet file, one row group per batch. Needs the optional pyarrow package.
+    """
+
+    def __init__(self, output_path, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        types = {'node': pa.string(), 'main_topology_supported': pa.bool_()}
+        types.update((column, pa.int32()) for column in GROUP_COLUMNS)
+        self.schema = pa.schema([(column, types.get(column, pa.float64())) for column in columns])
+        self.writer = pq.ParquetWriter(output_path, self.schema)
+
+    def write_batch(self, rows):
+        arrays = [self.pa.array([row[field.name] for row in rows], type=field.type) for field in self.schema]
+        self.writer.write_batch(self.pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+SUMMARY_WRITERS = {'tsv': TsvSummaryWriter, 'parquet': ParquetSummaryWriter}
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return f'{value:.6g}'
+    return str(value)
+
+
+def summarize(handle, output_path, output_format='tsv', annotation=16, batch_size=RECORD_BATCH_SIZE):
+    """
+    Streams freqQuad.csv from handle and writes the summary table in batches of batch_size branches.
+
+    Returns:
+        tuple: The node names and the relative frequencies (q1, q2, q3) of every branch, for the plot.
+    """
+    nodes = []
+    frequencies = []
+    writer = SUMMARY_WRITERS[output_format](output_path, summary_columns(annotation))
+    try:
+        batch = []
+        for node, lines in read_branches(handle):
+            row = summarize_branch(node, lines, annotation)
+            nodes.append(node)
+            frequencies.append((row['q1'], row['q2'], row['q3']))
+            batch.append(row)
+            if len(batch) == batch_size:
+                writer.write_batch(batch)
+                batch = []
+        if batch:
+            writer.write_batch(batch)
+    finally:
+        writer.close()
+    return nodes, frequencies
+
+
+def plot_frequencies(nodes, frequencies, plot_path, plot_format='pdf'):
+    """
+    Draws the relative frequency of the three topologies around every branch as grouped bars, with the 1/3 line
+    of a polytomy.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    width = min(max(6.0, 0.35 * len(nodes)), 200.0)
+    fig = Figure(figsize=(width, 4.5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    positions = range(len(nodes))
+    bar_width = 0.27
+    for index, (topology, color) in enumerate(zip(TOPOLOGIES, TOPOLOGY_COLORS)):
+        ax.bar([position + (index - 1) * bar_width for position in positions],
+               [values[index] for values in frequencies], width=bar_width, color=color, edgecolor='black',
+               linewidth=0.3, label=topology)
+    ax.axhline(1 / 3, linestyle='--', linewidth=0.6, color='black')
+    ax.set_xticks(list(positions))
+    ax.set_xticklabels(nodes, rotation=90, fontsize=7)
+    ax.set_xlim(-0.6, len(nodes) - 0.4)
+    ax.set_ylim(0, 1)
+    ax.set_ylabel('relative freq.')
+    ax.legend(title='Topology', loc='upper right', fontsize=7)
+    fig.tight_layout()
+    fig.savefig(plot_path, format=plot_format)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize and plot the quartet frequencies of freqQuad.csv.')
+    parser.add_argument('--input', type=str, required=True, help='freqQuad.csv written by ASTRAL')
+    parser.add_argument('--annotation', type=int, choices=[16, 32], default=16,
+                        help='The -t option ASTRAL was run with: 16 (posteriors) or 32 (quartet scores)')
+    parser.add_argument('--output', type=str, required=True, help='Summary table, one row per branch')
+    parser.add_argument('--output-format', type=str, choices=OUTPUT_FORMATS, default='tsv',
+                        help='Format of the summary table (default: tsv)')
+    parser.add_argument('--plot', type=str, default=None, help='Plot of the relative quartet frequencies')
+    parser.add_argument('--plot-format', type=str, choices=['pdf', 'png', 'svg'], default='pdf',
+                        help='Format of the plot (default: pdf)')
+    args = parser.parse_args()
+    if args.output_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        parser.error('--output-format parquet needs the pyarrow package')
+
+    with open(args.input) as handle:
+        try:
+            nodes, frequencies = summarize(handle, args.output, args.output_format, args.annotation)
+        except ValueError as error:
+            parser.exit(1, f'Error: {error}\n')
+    if args.plot:
+        plot_frequencies(nodes, frequencies, args.plot, args.plot_format)
+    print(f'Summarized {len(nodes)} branches')
+
+
+if __name__ == '__main__':
+    main()
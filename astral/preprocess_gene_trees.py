@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+"""
+Prepares a file of gene trees for ASTRAL, reading it one tree at a time.
+
+- Branches with a support value (the label of an internal node) below a threshold are collapsed into polytomies.
+- Branch lengths and support values are left out, ASTRAL only uses the topology of the gene trees.
+- Identical unrooted topologies are counted and written once, with their count, to a table of unique topologies.
+  ASTRAL-III has no weights for input trees, so its input keeps every gene tree.
+- The taxon occupancy matrix lists per gene tree which taxa it contains.
+"""
+import argparse
+import re
+import sys
+
+# Newick tokens: quoted labels, comments, punctuation and unquoted labels
+TOKEN = re.compile(r"'(?:[^']|'')*'|\[[^\]]*\]|[(),:;]|[^\s()\[\]',:;]+")
+# Characters after which the end of a tree can be found, quotes and comments can hide a ';'
+TREE_END = re.compile(r"[;'\[\]]")
+CHUNK_SIZE = 1 << 20
+
+
+class GeneTree:
+    """
+    A rooted gene tree as arrays indexed by node, node 0 is the root and every child has a higher index than its
+    parent.
+    """
+
+    def __init__(self):
+        self.parents = [None]
+        self.children = [[]]
+        self.labels = [None]
+
+    def add_child(self, parent):
+        self.parents.append(parent)
+        self.children.append([])
+        self.labels.append(None)
+        node = len(self.parents) - 1
+        self.children[parent].append(node)
+        return node
+
+    def leaves(self):
+        return [node for node, children in enumerate(self.children) if not children and self.labels[node]]
+
+    def support(self, node):
+        try:
+            return float(self.labels[node])
+        except (TypeError, ValueError):
+            return None
+
+
+def unquote(label):
+    if label.startswith("'"):
+        return label[1:-1].replace("''", "'")
+    return label
+
+
+def quote(label):
+    if re.search(r"[\s()\[\]',:;]", label):
+        return "'" + label.replace("'", "''") + "'"
+    return label
+
+
+def parse_newick(text):
+    """
+    Parses one Newick tree, branch lengths and comments are dropped.
+
+    Raises:
+        ValueError: If the parentheses of the tree are not balanced.
+    """
+    tree = GeneTree()
+    current = 0
+    expect_length = False
+    for token in TOKEN.findall(text):
+        if token.startswith('['):
+            continue
+        if expect_length:
+            expect_length = False
+            continue
+        if token == '(':
+            current = tree.add_child(current)
+        elif token == ',':
+            if tree.parents[current] is None:
+                raise ValueError('unbalanced parentheses')
+            current = tree.add_child(tree.parents[current])
+        elif token == ')':
+            if tree.parents[current] is None:
+                raise ValueError('unbalanced parentheses')
+            current = tree.parents[current]
+        elif token == ':':
+            expect_length = True
+        elif token == ';':
+            break
+        else:
+            tree.labels[current] = unquote(token)
+    if current != 0:
+        raise ValueError('unbalanced parentheses')
+    return tree
+
+
+def read_trees(handle):
+    """
+    Yields the text of every tree of a Newick file, without the closing ';'. Trees may span lines.
+    """
+    buffer = ''
+    in_quote = in_comment = False
+    while True:
+        chunk = handle.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        start = len(buffer)
+        buffer += chunk
+        tree_start = 0
+        for match in TREE_END.finditer(buffer, start):
+            character = match.group()
+            if in_comment:
+                in_comment = character != ']'
+            elif character == "'":
+                in_quote = not in_quote
+            elif in_quote:
+                continue
+            elif character == '[':
+                in_comment = True
+            elif character == ';':
+                tree = buffer[tree_start:match.start()].strip()
+                if tree:
+                    yield tree
+                tree_start = match.end()
+        buffer = buffer[tree_start:]
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def collapse_branches(tree, min_support):
+    """
+    Collapses every internal branch with a support below min_support, its children move to its parent.
+
+    Returns:
+        int: The number of collapsed branches.
+    """
+    collapsed = 0
+    # children have higher indices than their parents, so a node is handled after all of its descendants
+    for node in range(len(tree.parents) - 1, 0, -1):
+        if not tree.children[node]:
+            continue
+        support = tree.support(node)
+        if support is None or support >= min_support:
+            continue
+        parent = tree.parents[node]
+        siblings = tree.children[parent]
+        position = siblings.index(node)
+        siblings[position:position + 1] = tree.children[node]
+        for child in tree.children[node]:
+            tree.parents[child] = parent
+        tree.children[node] = []
+        tree.labels[node] = None
+        collapsed += 1
+    return collapsed
+
+
+def write_topology(tree):
+    """
+    Returns the Newick string of the topology of the tree, keeping the order of the children.
+    """
+    out = []
+    stack = [0]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            out.append(item)
+            continue
+        children = tree.children[item]
+        if not children:
+            out.append(quote(tree.labels[item] or ''))
+            continue
+        out.append('(')
+        stack.append(')')
+        for index, child in enumerate(reversed(children)):
+            stack.append(child)
+            if index < len(children) - 1:
+                stack.append(',')
+    return ''.join(out) + ';'
+
+
+def canonical_topology(tree):
+    """
+    Returns a Newick string that is the same for all trees with the same unrooted topology: the tree is rooted at
+    its first taxon in sorted order, nodes with a single child are suppressed and children are sorted.
+    """
+    leaves = tree.leaves()
+    if not leaves:
+        return ';'
+    neighbours = [list(children) for children in tree.children]
+    for node, parent in enumerate(tree.parents):
+        if parent is not None:
+            neighbours[node].append(parent)
+    start = min(leaves, key=lambda leaf: tree.labels[leaf])
+    # order the nodes away from the first taxon
+    parent_of = {start: None}
+    order = [start]
+    for node in order:
+        for neighbour in neighbours[node]:
+            if neighbour not in parent_of:
+                parent_of[neighbour] = node
+                order.append(neighbour)
+    strings = {}
+    for node in reversed(order):
+        children = [strings[neighbour] for neighbour in neighbours[node] if parent_of.get(neighbour) == node]
+        if not children:
+            strings[node] = quote(tree.labels[node] or '')
+        elif len(children) == 1:
+            strings[node] = children[0]
+        else:
+            strings[node] = '(' + ','.join(sorted(children)) + ')'
+    return '(' + quote(tree.labels[start]) + ',' + strings[start] + ');'
+
+
+def preprocess(handle, output, min_support=None):
+    """
+    Streams the gene trees of handle, writes their (collapsed) topologies to output and collects the unique
+    topologies and the taxa of every tree.
+
+    Returns:
+        tuple: The unique topologies (dict canonical Newick -> count), the taxa in order of appearance, the taxa of
+        every tree as a bit set over those taxa, and the number of collapsed branches.
+    """
+    unique = {}
+    taxa = {}
+    occupancy = []
+    collapsed = 0
+    for number, text in enumerate(read_trees(handle), start=1):
+        try:
+            tree = parse_newick(text)
+        except ValueError as error:
+            sys.exit(f'Error: gene tree {number}: {error}')
+        if min_support is not None:
+            collapsed += collapse_branches(tree, min_support)
+        output.write(write_topology(tree) + '\n')
+        topology = canonical_topology(tree)
+        unique[topology] = unique.get(topology, 0) + 1
+        present = 0
+        for leaf in tree.leaves():
+            present |= 1 << taxa.setdefault(tree.labels[leaf], len(taxa))
+        occupancy.append(present)
+    return unique, list(taxa), occupancy, collapsed
+
+
+def write_unique(path, unique):
+    with open(path, 'w') as handle:
+        handle.write('count\ttopology\n')
+        for topology, count in sorted(unique.items(), key=lambda item: -item[1]):
+            handle.write(f'{count}\t{topology}\n')
+
+
+def write_occupancy(path, taxa, occupancy):
+    """
+    Writes the taxon occupancy matrix: a row per gene tree with 1 for every taxon it contains, and a last row with
+    the number of gene trees per taxon.
+    """
+    with open(path, 'w') as handle:
+        handle.write('\t'.join(['gene_tree'] + taxa) + '\n')
+        counts = [0] * len(taxa)
+        for number, present in enumerate(occupancy, start=1):
+            row = [(present >> index) & 1 for index in range(len(taxa))]
+            counts = [count + value for count, value in zip(counts, row)]
+            handle.write('\t'.join([str(number)] + [str(value) for value in row]) + '\n')
+        handle.write('\t'.join(['total'] + [str(count) for count in counts]) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Collapse poorly supported branches of gene trees, count unique '
+                                                 'topologies and report the taxon occupancy.')
+    parser.add_argument('--input', type=str, required=True, help='Newick file with the gene trees')
+    parser.add_argument('--output', type=str, required=True, help='Newick file of the topologies for ASTRAL')
+    parser.add_argument('--min-support', type=float, default=None,
+                        help='Collapse branches with a lower support, in the scale of the gene trees (e.g. 10 for '
+                             'bootstrap percentages)')
+    parser.add_argument('--unique', type=str, default=None, help='Table of the unique topologies and their counts')
+    parser.add_argument('--occupancy', type=str, default=None, help='Taxon occupancy matrix')
+    args = parser.parse_args()
+
+    with open(args.input) as handle, open(args.output, 'w') as output:
+        unique, taxa, occupancy, collapsed = preprocess(handle, output, args.min_support)
+    if args.unique:
+        write_unique(args.unique, unique)
+    if args.occupancy:
+        write_occupancy(args.occupancy, taxa, occupancy)
+    complete = (1 << len(taxa)) - 1
+    print(f'{len(occupancy)} gene trees, {len(unique)} unique topologies, {len(taxa)} taxa')
+    print(f'{sum(1 for present in occupancy if present != complete)} gene trees have missing taxa')
+    if args.min_support is not None:
+        print(f'{collapsed} branches with a support below {args.min_support:g} collapsed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Probes the version of a command line tool for the version_command of a Galaxy wrapper.
+
+Starting the tool can be slow (astral starts a JVM), so the version is cached per executable, keyed on its resolved
+path, modification time and size. A cache hit never starts the tool. On a miss the tool is started and its output is
+read one line at a time only until the version line shows up, after which the tool is stopped.
+
+The cache is a small JSON file in $TOOL_VERSION_CACHE, or in galaxytools/tool_versions.json below $XDG_CACHE_HOME
+(default ~/.cache). It is written atomically, so concurrent probes at worst both start the tool.
+"""
+import json
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+
+CACHE_ENV = 'TOOL_VERSION_CACHE'
+
+
+def default_cache_path():
+    if os.environ.get(CACHE_ENV):
+        return os.environ[CACHE_ENV]
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'galaxytools', 'tool_versions.json')
+
+
+def executable_key(executable):
+    """
+    Returns the cache key of an executable (path:mtime:size), or None if it is not found on the PATH.
+    """
+    path = shutil.which(executable)
+    if path is None:
+        return None
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    return f'{path}:{stat.st_mtime_ns}:{stat.st_size}'
+
+
+class VersionCache:
+    """
+    The versions of executables by executable_key, stored as a JSON object.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path) as handle:
+                versions = json.load(handle)
+        except (OSError, ValueError):
+            return {}
+        return versions if isinstance(versions, dict) else {}
+
+    def get(self, key):
+        return self._load().get(key)
+
+    def put(self, key, version):
+        versions = self._load()
+        versions[key] = version
+        directory = os.path.dirname(self.path) or '.'
+        try:
+            os.makedirs(directory, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(handle, 'w') as temp_file:
+                json.dump(versions, temp_file, indent=1, sort_keys=True)
+            os.replace(temp_path, self.path)
+        except OSError:
+            # a cache that cannot be written only costs the next probe its speed
+            pass
+
+
+def probe_version(command, pattern):
+    """
+    Runs command and scans its combined stdout and stderr line by line for pattern, whose first group is the
+    version. The command (and everything it started, e.g. the JVM of a wrapper script) is stopped once the version
+    is found.
+
+    Returns:
+        str: The version, or None if the output has no match.
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                               errors='replace', start_new_session=True)
+    try:
+        for line in process.stdout:
+            match = pattern.search(line)
+            if match:
+                return match.group(1)
+        return None
+    finally:
+        if process.poll() is None:
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+            except OSError:
+                pass
+        process.stdout.close()
+        process.wait()
+
+
+def get_version(executable, arguments, pattern, cache_path=None):
+    """
+    Returns the version of executable from the cache, or probes it by running it with arguments and caches it.
+
+    Raises:
+        FileNotFoundError: If the executable is not found on the PATH.
+    """
+    key = executable_key(executable)
+    if key is None:
+        raise FileNotFoundError(f'{executable} not found on the PATH')
+    cache = VersionCache(cache_path or default_cache_path())
+    version = cache.get(key)
+    if version is None:
+        version = probe_version([executable] + list(arguments), pattern)
+        if version is not None:
+            cache.put(key, version)
+    return version
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Measures the isotopic envelopes of protein_calculator: the FFT envelopes of a synthetic proteome calculated in one
+batch, against a naive convolution of the isotope distributions for a few proteins, and the envelope cache for a
+repeated batch.
+
+The tool directory can be given to compare two versions of the tool, e.g. a checkout of an older commit.
+
+Usage: python benchmarks/bench_isotopes.py [--proteins N] [--naive N] [--tool-dir DIR] [--output isotopes.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from synthetic_data import write_proteome
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PROTEIN_DIR = os.path.join(BENCHMARK_DIR, '..', 'protein_calculator')
+
+
+def naive_envelope(counts, elements, isotopes, threshold):
+    """
+    Returns the abundances of the envelope by convolving the isotope distribution of every atom, pruning the
+    distribution after every element to keep the convolution tractable.
+    """
+    import numpy as np
+    distribution = np.ones(1)
+    for element, count in zip(elements, counts):
+        atom = np.zeros(round(isotopes[element][-1][0] - isotopes[element][0][0]) + 1)
+        for mass, abundance in isotopes[element]:
+            atom[round(mass - isotopes[element][0][0])] = abundance
+        for _ in range(count):
+            distribution = np.convolve(distribution, atom)
+        distribution = distribution[:np.flatnonzero(distribution > 1e-12 * distribution.max())[-1] + 1]
+    return distribution[distribution >= threshold * distribution.max()] / distribution.max() * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the isotopic envelopes of protein_calculator.')
+    parser.add_argument('--proteins', type=int, default=20000, help='Number of proteins (default: 20000)')
+    parser.add_argument('--naive', type=int, default=20, help='Number of proteins convolved naively (default: 20)')
+    parser.add_argument('--tool-dir', type=str, default=PROTEIN_DIR, help='Directory of protein_calculator.py')
+    parser.add_argument('--output', type=str, default=None, help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.tool_dir))
+    import numpy as np
+    import Isotope_functions
+    from Calculate_protein_properties import composition_matrix, elemental_compositions
+    from references import isotopes
+    from Sequence_functions import read_fasta
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        fasta = os.path.join(work_dir, 'proteome.fasta')
+        residues = write_proteome(fasta, args.proteins)
+        sequences = [sequence for _, sequence in read_fasta(fasta)]
+    counts = elemental_compositions(composition_matrix(sequences))
+
+    start = time.perf_counter()
+    envelopes = Isotope_functions.isotopic_envelopes(counts)
+    fft_s = time.perf_counter() - start
+    start = time.perf_counter()
+    Isotope_functions.isotopic_envelopes(counts[:Isotope_functions.ENVELOPE_CACHE_SIZE])
+    cached_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    naive = [naive_envelope(row.tolist(), Isotope_functions.ELEMENTS, isotopes, Isotope_functions.DEFAULT_THRESHOLD)
+             for row in counts[:args.naive]]
+    naive_s = time.perf_counter() - start
+    # the FFT envelope may keep a peak more or less at the threshold
+    max_error = max(np.abs(np.array(envelope['abundances'][:len(reference)]) -
+                           reference[:len(envelope['abundances'])]).max()
+                    for envelope, reference in zip(envelopes, naive))
+
+    results = {
+        'python': sys.version.split()[0],
+        'tool_dir': os.path.abspath(args.tool_dir),
+        'proteins': args.proteins,
+        'residues': residues,
+        'fft_s': round(fft_s, 4),
+        'fft_us_per_protein': round(fft_s / args.proteins * 1e6, 2),
+        'cached_proteins': min(args.proteins, Isotope_functions.ENVELOPE_CACHE_SIZE),
+        'cached_s': round(cached_s, 4),
+        'naive_proteins': args.naive,
+        'naive_us_per_protein': round(naive_s / args.naive * 1e6, 2),
+        'max_abundance_error_percent': round(float(max_error), 6),
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
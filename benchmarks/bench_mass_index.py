@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Measures the mass index of protein_calculator: building it for a synthetic proteome, opening it again for a
+repeated query, and matching a batch of observed masses against it.
+
+The observed masses are masses of the index with Gaussian noise, so most of them match. The tool directory can be
+given to compare two versions of the tool, e.g. a checkout of an older commit.
+
+Usage: python benchmarks/bench_mass_index.py [--proteins N] [--queries N] [--digest ENZYME] [--tolerance-ppm PPM]
+                                             [--tool-dir DIR] [--output mass_index.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from synthetic_data import write_proteome
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PROTEIN_DIR = os.path.join(BENCHMARK_DIR, '..', 'protein_calculator')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the mass index of protein_calculator.')
+    parser.add_argument('--proteins', type=int, default=20000, help='Number of proteins (default: 20000)')
+    parser.add_argument('--queries', type=int, default=20000, help='Number of observed masses (default: 20000)')
+    parser.add_argument('--digest', type=str, default='trypsin',
+                        help='Enzyme of the indexed peptides, "none" for whole proteins only (default: trypsin)')
+    parser.add_argument('--tolerance-ppm', type=float, default=5.0, help='Mass tolerance in ppm (default: 5)')
+    parser.add_argument('--tool-dir', type=str, default=PROTEIN_DIR, help='Directory of protein_calculator.py')
+    parser.add_argument('--output', type=str, default=None, help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.tool_dir))
+    import numpy as np
+    from Digestion_functions import cleavage_rule
+    from Mass_index import open_mass_index, write_matches
+
+    digest_options = None
+    if args.digest != 'none':
+        digest_options = {'rule': cleavage_rule(args.digest), 'missed_cleavages': 2, 'min_length': 6,
+                          'max_length': 50}
+    with tempfile.TemporaryDirectory() as work_dir:
+        fasta = os.path.join(work_dir, 'proteome.fasta')
+        residues = write_proteome(fasta, args.proteins)
+        index_dir = os.path.join(work_dir, 'mass_index')
+
+        start = time.perf_counter()
+        index, _ = open_mass_index(index_dir, fasta, digest_options=digest_options)
+        build_s = time.perf_counter() - start
+        start = time.perf_counter()
+        index, built = open_mass_index(index_dir, fasta, digest_options=digest_options)
+        reuse_s = time.perf_counter() - start
+        assert not built
+
+        generator = np.random.default_rng(0)
+        masses = generator.choice(np.asarray(index.masses), args.queries) + generator.normal(0, 0.005, args.queries)
+        start = time.perf_counter()
+        lower, upper = index.search(masses, args.tolerance_ppm)
+        search_s = time.perf_counter() - start
+        start = time.perf_counter()
+        matched, matches = write_matches(index, masses, os.path.join(work_dir, 'matches.tsv'), args.tolerance_ppm)
+        write_s = time.perf_counter() - start
+        index_mb = sum(os.path.getsize(os.path.join(index.path, name)) for name in os.listdir(index.path)) / 2 ** 20
+
+    results = {
+        'python': sys.version.split()[0],
+        'tool_dir': os.path.abspath(args.tool_dir),
+        'proteins': args.proteins,
+        'residues': residues,
+        'digest': args.digest,
+        'entries': len(index),
+        'index_mb': round(index_mb, 1),
+        'build_s': round(build_s, 4),
+        'reuse_s': round(reuse_s, 4),
+        'queries': args.queries,
+        'tolerance_ppm': args.tolerance_ppm,
+        'search_s': round(search_s, 4),
+        'matched': matched,
+        'matches': matches,
+        'write_matches_s': round(write_s, 4),
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Measures the time process_input.py of the ENA consensus submission tool takes to parse a synthetic receipt and
+write the manifests of all its samples.
+
+The receipt has --samples samples spread over --studies studies, with one experiment per sample. The tool
+directory can be given to compare two versions of the tool, e.g. a checkout of an older commit.
+
+Usage: python benchmarks/bench_receipt.py [--tool-dir DIR] [--samples N] [--studies N] [--repeat N]
+                                          [--output receipt.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_data import MANIFEST_TEMPLATE, write_receipt
+
+TOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'consensus_sequence_ena_galaxy')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the receipt parsing and manifest generation.')
+    parser.add_argument('--tool-dir', type=str, default=TOOL_DIR, help='Directory of process_input.py')
+    parser.add_argument('--samples', type=int, default=100000, help='Number of samples (default: 100000)')
+    parser.add_argument('--studies', type=int, default=100, help='Number of studies (default: 100)')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs (default: 3)')
+    parser.add_argument('--output', type=str, default=None, help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    script = os.path.join(os.path.abspath(args.tool_dir), 'process_input.py')
+    results = {'python': sys.version.split()[0], 'tool_dir': os.path.abspath(args.tool_dir),
+               'samples': args.samples, 'studies': args.studies}
+    with tempfile.TemporaryDirectory() as work_dir:
+        receipt_path = os.path.join(work_dir, 'receipt.txt')
+        write_receipt(receipt_path, args.samples, args.studies)
+        fasta_list_path = os.path.join(work_dir, 'fasta.json')
+        with open(fasta_list_path, 'w') as handle:
+            json.dump([f'sample_{index}.fasta.gz' for index in range(args.samples)], handle)
+        template_path = os.path.join(work_dir, 'template.txt')
+        with open(template_path, 'w') as handle:
+            handle.write(MANIFEST_TEMPLATE)
+        manifests_dir = os.path.join(work_dir, 'manifests')
+        os.mkdir(manifests_dir)
+
+        command = [sys.executable, script, receipt_path, fasta_list_path, manifests_dir, template_path]
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            subprocess.run(command, cwd=work_dir, stdout=subprocess.DEVNULL, check=True)
+            timings.append(time.perf_counter() - start)
+        results['receipt_bytes'] = os.path.getsize(receipt_path)
+        results['total_s'] = round(statistics.median(timings), 4)
+        with open(os.path.join(work_dir, 'submit_list.tab')) as handle:
+            results['manifests'] = sum(1 for _ in handle)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
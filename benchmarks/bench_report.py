@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Measures the size and render time of the protein_calculator reports: the report of a single protein and the
+summary report of a batch of proteins.
+
+The tool directory can be given to compare two versions of the tool, e.g. a checkout of an older commit. The
+templates are copied into the working directory, as older versions of the tool load them from there.
+
+Usage: python benchmarks/bench_report.py [--tool-dir DIR] [--repeat N] [--proteins N] [--output report.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_data import random_protein, write_proteome
+
+TOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'protein_calculator')
+
+
+def run(command, cwd, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the protein_calculator reports.')
+    parser.add_argument('--tool-dir', type=str, default=TOOL_DIR, help='Directory of protein_calculator.py')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per measurement (default: 3)')
+    parser.add_argument('--proteins', type=int, default=5000,
+                        help='Number of proteins of the batch summary report (default: 5000)')
+    parser.add_argument('--output', type=str, default=None, help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    script = os.path.join(os.path.abspath(args.tool_dir), 'protein_calculator.py')
+    results = {'python': sys.version.split()[0], 'tool_dir': os.path.abspath(args.tool_dir)}
+    with tempfile.TemporaryDirectory() as work_dir:
+        shutil.copytree(os.path.join(args.tool_dir, 'templates'), os.path.join(work_dir, 'templates'))
+        sequence = random_protein(500, seed=1)
+        results['single_s'] = round(run([sys.executable, script, '--name', 'benchmark', '--sequence', sequence],
+                                        work_dir, args.repeat), 4)
+        results['single_report_bytes'] = os.path.getsize(os.path.join(work_dir, 'report.html'))
+
+        fasta_path = os.path.join(work_dir, 'proteins.fasta')
+        write_proteome(fasta_path, args.proteins)
+        help_text = subprocess.run([sys.executable, script, '--help'], capture_output=True, text=True).stdout
+        if '--summary' in help_text:
+            command = [sys.executable, script, '--fasta', fasta_path, '--workers', '1', '--summary', 'summary.html']
+            results['batch_summary_s'] = round(run(command, work_dir, args.repeat), 4)
+            results['batch_summary_bytes'] = os.path.getsize(os.path.join(work_dir, 'summary.html'))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Checks that validating and formatting a protein sequence scales linearly with its length, from 10^3 up to
+10^6 residues, for valid sequences and for sequences with scattered invalid characters.
+
+Usage: python benchmarks/bench_sequence_validation.py [--repeat N] [--max-length N] [--output validation.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'protein_calculator'))
+
+from Sequence_functions import check_protein_sequence, format_sequence  # noqa: E402
+from synthetic_data import random_protein  # noqa: E402
+
+
+def median_time(function, argument, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the protein sequence validator and formatter.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs per measurement (default: 5)')
+    parser.add_argument('--max-length', type=int, default=10 ** 6, help='Longest sequence (default: 10^6)')
+    parser.add_argument('--output', type=str, default=None, help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    lengths = []
+    length = 1000
+    while length <= args.max_length:
+        lengths.append(length)
+        length *= 10
+
+    results = []
+    for length in lengths:
+        valid = random_protein(length)
+        invalid = random_protein(length, invalid_fraction=0.001)
+        row = {
+            'length': length,
+            'check_valid_s': median_time(check_protein_sequence, valid, args.repeat),
+            'check_invalid_s': median_time(check_protein_sequence, invalid, args.repeat),
+            'format_s': median_time(format_sequence, valid, args.repeat),
+        }
+        # time per residue stays constant when the scaling is linear
+        for stage in ('check_valid', 'check_invalid', 'format'):
+            row[f'{stage}_ns_per_residue'] = round(row[f'{stage}_s'] / length * 1e9, 2)
+        results.append(row)
+        print('\t'.join(f'{key}={value:.6g}' for key, value in row.items()))
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump({'python': sys.version.split()[0], 'results': results}, handle, indent=2)
+            handle.write('\n')
+
+
+if __name__ == '__main__':
+    main()
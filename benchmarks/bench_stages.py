@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+"""
+Times the stages of protein_calculator and of process_input.py of the ENA consensus submission tool on synthetic
+inputs, and tracks their peak memory use.
+
+Every scenario runs main() of the tool in a fresh interpreter. Before main() is called, the functions listed in
+STAGES are wrapped with a timer in the modules that call them. The time of a stage excludes the time of the stages
+it calls, so the stage times add up to at most the total time and the rest is reported as "other". Generators are
+timed per item, which tells the stages of a streamed pipeline apart. The peak RSS is the maximum resident set size
+of the interpreter, including the imported modules.
+
+Scenarios:
+- protein_single_<length>: one protein of --protein-lengths residues, with its report and titration curve.
+- protein_batch_<proteins>: a multi-FASTA file of --proteomes proteins of 50-800 residues, results table only.
+- receipt_files_<samples>: a receipt of --samples samples, one manifest per sample from a list of FASTA files.
+- receipt_multi_<samples>: the same receipt with one multi-FASTA file that is split per sample.
+
+Results are written as JSON. With --baseline, the totals and peak RSS are compared with an earlier result file,
+e.g. of a checkout of an older commit given with --tool-root. Stages and scenarios the tools of --tool-root do
+not have are left out.
+
+Usage: python benchmarks/bench_stages.py [--tool-root DIR] [--protein-lengths N,..] [--proteomes N,..]
+                                         [--samples N,..] [--repeat N] [--data-dir DIR] [--output stages.json]
+                                         [--baseline old.json]
+"""
+import argparse
+import contextlib
+import importlib
+import inspect
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_data import (MANIFEST_TEMPLATE, random_protein, write_consensus_fasta, write_proteome,
+                            write_receipt)
+
+TOOL_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Per tool, the directory and main module, and per module the functions that are timed as stages
+TOOLS = {
+    'protein_calculator': ('protein_calculator', 'protein_calculator'),
+    'process_input': ('consensus_sequence_ena_galaxy', 'process_input'),
+}
+STAGES = {
+    'protein_calculator': {
+        'protein_calculator': ['normalize_sequence', 'check_protein_sequence', 'calculate_properties',
+                               'write_cached_titration_outputs', 'build_profile_plots', 'format_sequence',
+                               'render_report', 'run_batch', 'write_results'],
+        'Batch_functions': ['read_fasta', 'normalize_sequence', 'check_protein_sequence',
+                            'calculate_properties_batch', 'write_profiles', 'add_to_summary', 'write_results'],
+    },
+    'process_input': {
+        'process_input': ['load_yaml_section', 'load_receipt_data', 'load_checksums', 'write_manifests',
+                          'write_manifest', 'read_fasta_records', 'split_multi_fasta', 'drop_invalid_fasta'],
+    },
+}
+# Tools that have to offer a function for a scenario to run
+SCENARIO_REQUIREMENTS = {'receipt_multi': 'split_multi_fasta'}
+
+
+class StageTimer:
+    """
+    Accumulates the time and number of calls of the wrapped functions, excluding the time of nested stages.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        # [stage, start, time spent in nested stages] of the running stages
+        self.stack = []
+
+    def start(self, stage):
+        self.stack.append([stage, time.perf_counter(), 0.0])
+
+    def stop(self):
+        stage, start, nested = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + elapsed - nested
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def wrap(self, stage, function):
+        if inspect.isgeneratorfunction(function):
+            def timed_generator(*args, **kwargs):
+                self.calls[stage] = self.calls.get(stage, 0) + 1
+                iterator = function(*args, **kwargs)
+                while True:
+                    self.start(stage)
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        self.stop()
+                    yield item
+            return timed_generator
+
+        def timed(*args, **kwargs):
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+            self.start(stage)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.stop()
+        return timed
+
+
+def peak_rss_mb():
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_child(spec_path):
+    """
+    Runs one scenario in this interpreter, as described by the JSON file spec_path, and writes its result JSON.
+    """
+    with open(spec_path) as handle:
+        spec = json.load(handle)
+    tool_dir, module_name = TOOLS[spec['tool']]
+    sys.path.insert(0, os.path.join(spec['tool_root'], tool_dir))
+    os.chdir(spec['work_dir'])
+
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    result = {'import_s': round(time.perf_counter() - start, 4), 'import_rss_mb': peak_rss_mb()}
+    requirement = SCENARIO_REQUIREMENTS.get(spec['scenario'])
+    if requirement and not hasattr(module, requirement):
+        result['skipped'] = f'{module_name} has no {requirement}'
+    else:
+        timer = StageTimer()
+        for stage_module, stages in STAGES[spec['tool']].items():
+            target = sys.modules.get(stage_module)
+            for stage in stages:
+                if target is not None and callable(getattr(target, stage, None)):
+                    setattr(target, stage, timer.wrap(stage, getattr(target, stage)))
+        arguments = spec['arguments']
+        if spec.get('sequence_file'):
+            # sequences of 10^6 residues are too long for a command line argument of the child process
+            with open(spec['sequence_file']) as handle:
+                sequence = handle.read()
+            arguments = [sequence if argument == '@SEQUENCE@' else argument for argument in arguments]
+        sys.argv = [module.__file__] + arguments
+        start = time.perf_counter()
+        errors = io.StringIO()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+                contextlib.redirect_stderr(errors):
+            try:
+                module.main()
+            except SystemExit as error:
+                if error.code:
+                    lines = errors.getvalue().strip().splitlines()
+                    result['error'] = lines[-1] if lines else f'exit code {error.code}'
+            except Exception as error:
+                result['error'] = f'{type(error).__name__}: {(str(error).strip().splitlines() or [""])[0]}'
+        total = time.perf_counter() - start
+        stage_seconds = {stage: round(seconds, 4) for stage, seconds in
+                         sorted(timer.seconds.items(), key=lambda item: -item[1])}
+        stage_seconds['other'] = round(total - sum(timer.seconds.values()), 4)
+        result.update(total_s=round(total, 4), stages_s=stage_seconds, calls=timer.calls)
+    result['peak_rss_mb'] = peak_rss_mb()
+    with open(spec['result_path'], 'w') as handle:
+        json.dump(result, handle)
+
+
+def run_scenario(spec, work_dir, repeat):
+    """
+    Runs a scenario repeat times, each in a fresh interpreter and an empty working directory.
+
+    Returns:
+        dict: The run with the median total time.
+    """
+    runs = []
+    for index in range(repeat):
+        run_dir = os.path.join(work_dir, f'{spec["name"]}_{index}')
+        os.makedirs(run_dir)
+        if spec['tool'] == 'protein_calculator':
+            # older versions of the tool load the report templates from the working directory
+            templates = os.path.join(spec['tool_root'], 'protein_calculator', 'templates')
+            if os.path.isdir(templates):
+                shutil.copytree(templates, os.path.join(run_dir, 'templates'))
+        for directory in spec.get('directories', []):
+            os.makedirs(os.path.join(run_dir, directory))
+        child_spec = dict(spec, work_dir=run_dir, result_path=os.path.join(run_dir, 'result.json'))
+        spec_path = os.path.join(run_dir, 'spec.json')
+        with open(spec_path, 'w') as handle:
+            json.dump(child_spec, handle)
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', spec_path],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if process.returncode != 0:
+            return {'error': process.stderr.strip().splitlines()[-1] if process.stderr.strip() else
+                    f'exit code {process.returncode}'}
+        with open(child_spec['result_path']) as handle:
+            runs.append(json.load(handle))
+        shutil.rmtree(run_dir)
+        if 'skipped' in runs[-1]:
+            break
+    runs.sort(key=lambda run: run.get('total_s', 0))
+    return runs[len(runs) // 2]
+
+
+def write_text(path, text):
+    with open(path, 'w') as handle:
+        handle.write(text)
+
+
+def integer_list(text):
+    return [int(float(value)) for value in text.split(',') if value.strip()]
+
+
+def build_scenarios(args, data_dir):
+    """
+    Writes the synthetic inputs to data_dir, unless they are there from an earlier run, and yields the scenarios.
+    """
+    def data_path(name, writer):
+        path = os.path.join(data_dir, name)
+        if not os.path.exists(path):
+            writer(path + '.tmp')
+            os.replace(path + '.tmp', path)
+        return path
+
+    for length in args.protein_lengths:
+        sequence_file = data_path(f'protein_{length}.txt',
+                                  lambda path: write_text(path, random_protein(length, seed=length)))
+        yield {'name': f'protein_single_{length}', 'scenario': 'protein_single', 'tool': 'protein_calculator',
+               'size': length, 'sequence_file': sequence_file,
+               'arguments': ['--name', 'benchmark', '--sequence', '@SEQUENCE@']}
+    for proteins in args.proteomes:
+        fasta = data_path(f'proteome_{proteins}.fasta', lambda path: write_proteome(path, proteins))
+        yield {'name': f'protein_batch_{proteins}', 'scenario': 'protein_batch', 'tool': 'protein_calculator',
+               'size': proteins, 'arguments': ['--fasta', fasta, '--workers', '1', '--output', 'results.tsv']}
+    template = data_path('manifest_template.txt', lambda path: write_text(path, MANIFEST_TEMPLATE))
+    for samples in args.samples:
+        receipt = data_path(f'receipt_{samples}.txt', lambda path: write_receipt(path, samples, args.studies))
+        fasta_list = data_path(f'fasta_list_{samples}.json', lambda path: write_text(
+            path, json.dumps([f'sample_{index}.fasta.gz' for index in range(samples)])))
+        consensus = data_path(f'consensus_{samples}.fasta',
+                              lambda path: write_consensus_fasta(path, samples, args.genome_length))
+        yield {'name': f'receipt_files_{samples}', 'scenario': 'receipt_files', 'tool': 'process_input',
+               'size': samples, 'directories': ['manifests'],
+               'arguments': [receipt, fasta_list, 'manifests', template]}
+        yield {'name': f'receipt_multi_{samples}', 'scenario': 'receipt_multi', 'tool': 'process_input',
+               'size': samples, 'directories': ['manifests'],
+               'arguments': ['--receipt', receipt, '--multi-fasta', consensus, '--fasta-dir', 'fasta',
+                             '--manifests-dir', 'manifests', '--manifest-template', template]}
+
+
+def compare(results, baseline_path, threshold):
+    """
+    Prints the total time and peak RSS of every scenario next to those of the baseline result file.
+    """
+    with open(baseline_path) as handle:
+        baseline = {scenario['name']: scenario for scenario in json.load(handle)['scenarios']}
+    print(f'\nCompared with {baseline_path} (ratio new/baseline, flagged above {threshold:g}):')
+    print('\t'.join(['scenario', 'total_s', 'baseline_s', 'ratio', 'peak_rss_mb', 'baseline_mb', 'ratio']))
+    for scenario in results['scenarios']:
+        old = baseline.get(scenario['name'])
+        if not old or any('total_s' not in run or 'error' in run for run in (old, scenario)):
+            continue
+        time_ratio = scenario['total_s'] / old['total_s'] if old['total_s'] else float('nan')
+        rss_ratio = scenario['peak_rss_mb'] / old['peak_rss_mb'] if old['peak_rss_mb'] else float('nan')
+        flag = '  <- regression' if time_ratio > threshold or rss_ratio > threshold else ''
+        print(f'{scenario["name"]}\t{scenario["total_s"]:.4f}\t{old["total_s"]:.4f}\t{time_ratio:.2f}\t'
+              f'{scenario["peak_rss_mb"]:.1f}\t{old["peak_rss_mb"]:.1f}\t{rss_ratio:.2f}{flag}')
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == '--child':
+        run_child(sys.argv[2])
+        return
+
+    parser = argparse.ArgumentParser(description='Benchmark the stages of protein_calculator and the ENA receipt '
+                                                 'processing on synthetic inputs.')
+    parser.add_argument('--tool-root', type=str, default=TOOL_ROOT,
+                        help='Root of the repository with the tools to benchmark (default: this checkout)')
+    parser.add_argument('--protein-lengths', type=integer_list, default=[10, 10 ** 3, 10 ** 5, 10 ** 6],
+                        help='Lengths of the single proteins (default: 10,1000,100000,1000000)')
+    parser.add_argument('--proteomes', type=integer_list, default=[10 ** 3, 10 ** 4, 10 ** 5],
+                        help='Numbers of proteins of the batch runs, up to 1000000 (default: 1000,10000,100000)')
+    parser.add_argument('--samples', type=integer_list, default=[10 ** 3, 10 ** 5],
+                        help='Numbers of samples of the receipts (default: 1000,100000)')
+    parser.add_argument('--studies', type=int, default=100, help='Number of studies of the receipts (default: 100)')
+    parser.add_argument('--genome-length', type=int, default=1000,
+                        help='Length of the consensus sequences of the multi-FASTA scenario (default: 1000)')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Runs per scenario, the run with the median total is kept (default: 1)')
+    parser.add_argument('--data-dir', type=str, default=None,
+                        help='Directory of the synthetic inputs, kept and reused between runs (default: temporary)')
+    parser.add_argument('--output', type=str, default=None, help='JSON file to write the results to')
+    parser.add_argument('--baseline', type=str, default=None, help='Earlier result file to compare with')
+    parser.add_argument('--threshold', type=float, default=1.1,
+                        help='Ratio above which a difference with the baseline is flagged (default: 1.1)')
+    args = parser.parse_args()
+
+    tool_root = os.path.abspath(args.tool_root)
+    commit = subprocess.run(['git', '-C', tool_root, 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                            text=True).stdout.strip()
+    results = {'python': sys.version.split()[0], 'tool_root': tool_root, 'commit': commit or None, 'scenarios': []}
+    with tempfile.TemporaryDirectory() as work_dir:
+        data_dir = os.path.abspath(args.data_dir) if args.data_dir else os.path.join(work_dir, 'data')
+        os.makedirs(data_dir, exist_ok=True)
+        for spec in build_scenarios(args, data_dir):
+            spec['tool_root'] = tool_root
+            result = run_scenario(spec, work_dir, max(1, args.repeat))
+            scenario = {'name': spec['name'], 'size': spec['size'], **result}
+            results['scenarios'].append(scenario)
+            if 'total_s' in scenario and 'error' not in scenario:
+                top = ', '.join(f'{stage} {seconds:.3g}' for stage, seconds in list(scenario['stages_s'].items())[:3])
+                print(f'{spec["name"]}\t{scenario["total_s"]:.4f} s\t{scenario["peak_rss_mb"]:.1f} MB\t{top}',
+                      flush=True)
+            else:
+                print(f'{spec["name"]}\t{scenario.get("skipped") or scenario.get("error")}', flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+            handle.write('\n')
+    if args.baseline:
+        compare(results, args.baseline, args.threshold)
+
+
+if __name__ == '__main__':
+    main()
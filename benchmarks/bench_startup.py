@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Tracks the startup cost of protein_calculator: the import time of the modules it may load and the wall time
+of short invocations, each measured in a fresh interpreter.
+
+Usage: python benchmarks/bench_startup.py [--repeat N] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+TOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'protein_calculator')
+SCRIPT = os.path.join(TOOL_DIR, 'protein_calculator.py')
+
+# Modules imported by protein_calculator, most of them only when the output that needs them is requested
+MODULES = ['numpy', 'jinja2', 'plotly.graph_objects', 'matplotlib.figure', 'pandas', 'protein_calculator']
+
+
+def time_command(command, repeat, cwd=None):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup time of protein_calculator.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs per measurement (default: 5)')
+    parser.add_argument('--output', type=str, default=None, help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    interpreter = time_command([sys.executable, '-c', 'pass'], args.repeat)
+    imports = {}
+    for module in MODULES:
+        seconds = time_command([sys.executable, '-c', f'import {module}'], args.repeat, cwd=TOOL_DIR)
+        imports[module] = round(seconds - interpreter, 4)
+
+    results = {
+        'python': sys.version.split()[0],
+        'interpreter_startup_s': round(interpreter, 4),
+        'import_s': imports,
+        'version_s': round(time_command([sys.executable, SCRIPT, '--version'], args.repeat), 4),
+        'help_s': round(time_command([sys.executable, SCRIPT, '--help'], args.repeat), 4),
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Measures the version commands of the astral and protein_calculator wrappers, each in a fresh interpreter.
+
+astral is replaced by a stub script on the PATH that prints the help message of ASTRAL after --startup seconds,
+the time a JVM takes to start, unless --astral is given. The astral version command is timed with an empty version
+cache (cold) and with a filled one (warm). The tool directories can be given to compare two versions of the tools,
+e.g. a checkout of an older commit.
+
+Usage: python benchmarks/bench_version.py [--astral-dir DIR] [--protein-dir DIR] [--astral PATH] [--startup S]
+                                          [--repeat N] [--output version.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ASTRAL_DIR = os.path.join(BENCHMARK_DIR, '..', 'astral')
+PROTEIN_DIR = os.path.join(BENCHMARK_DIR, '..', 'protein_calculator')
+
+ASTRAL_STUB = """#!/bin/sh
+sleep {startup}
+echo "================== ASTRAL ===================== " >&2
+echo "This is ASTRAL version 5.7.8" >&2
+echo "Usage: java -jar astral.5.7.8.jar -i <gene-trees-path>" >&2
+"""
+
+
+def time_command(command, repeat, env=None, before=None):
+    timings = []
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the version commands of astral and protein_calculator.')
+    parser.add_argument('--astral-dir', type=str, default=ASTRAL_DIR, help='Directory of version_command.py')
+    parser.add_argument('--protein-dir', type=str, default=PROTEIN_DIR, help='Directory of protein_calculator.py')
+    parser.add_argument('--astral', type=str, default=None, help='astral executable (default: a stub script)')
+    parser.add_argument('--startup', type=float, default=0.5,
+                        help='Seconds the stub takes before printing its help (default: 0.5)')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs per measurement (default: 5)')
+    parser.add_argument('--output', type=str, default=None, help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        bin_dir = os.path.join(work_dir, 'bin')
+        os.makedirs(bin_dir)
+        astral = os.path.join(bin_dir, 'astral')
+        if args.astral:
+            os.symlink(os.path.abspath(args.astral), astral)
+        else:
+            with open(astral, 'w') as stub:
+                stub.write(ASTRAL_STUB.format(startup=args.startup))
+            os.chmod(astral, 0o755)
+        cache_path = os.path.join(work_dir, 'tool_versions.json')
+        env = dict(os.environ, PATH=bin_dir + os.pathsep + os.environ.get('PATH', ''), TOOL_VERSION_CACHE=cache_path)
+
+        def clear_cache():
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+
+        astral_command = [sys.executable, os.path.join(os.path.abspath(args.astral_dir), 'version_command.py')]
+        version = subprocess.run(astral_command, env=env, stdout=subprocess.PIPE, text=True).stdout.strip()
+        results = {
+            'python': sys.version.split()[0],
+            'astral_dir': os.path.abspath(args.astral_dir),
+            'protein_dir': os.path.abspath(args.protein_dir),
+            'astral': args.astral or f'stub ({args.startup} s)',
+            'astral_version': version,
+            'astral_cold_s': time_command(astral_command, args.repeat, env, before=clear_cache),
+            'astral_warm_s': time_command(astral_command, args.repeat, env),
+            'protein_calculator_s': time_command(
+                [sys.executable, os.path.join(os.path.abspath(args.protein_dir), 'protein_calculator.py'),
+                 '--version'], args.repeat),
+        }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
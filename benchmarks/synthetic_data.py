@@ -0,0 +1,88 @@
+"""
+Generators of the synthetic inputs of the benchmarks: protein sequences, proteomes and ENA receipts.
+
+Everything is generated from a seed, so the inputs of two runs, e.g. of two versions of a tool, are identical.
+Files are written one record at a time, so a proteome of 10^6 sequences or a receipt of 10^5 samples does not have
+to fit in memory.
+"""
+import gzip
+import random
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+NUCLEOTIDES = 'ACGT'
+
+EXPERIMENT = """  {index}:
+    alias: exp_{index}
+    design_description: synthetic
+    instrument_model: NextSeq 500
+    library_layout: PAIRED
+    library_source: VIRAL RNA
+    library_strategy: AMPLICON
+    platform: ILLUMINA
+    sample_alias: sample_{index}
+    study_alias: study_{study}
+    title: Illumina NextSeq paired end sequencing
+"""
+TIMESTAMP = '2021-05-03T10:52:06.497+01:00'
+MANIFEST_TEMPLATE = 'ASSEMBLY_TYPE\tisolate\nCOVERAGE\t100\nPROGRAM\tbenchmark\nMINGAPLENGTH\t10\n'
+
+
+def random_protein(length, invalid_fraction=0.0, seed=0):
+    """
+    Returns a random protein sequence, with a fraction of its residues replaced by characters that are not amino
+    acids.
+    """
+    generator = random.Random(seed)
+    residues = generator.choices(AMINO_ACIDS, k=length)
+    for position in generator.sample(range(length), int(length * invalid_fraction)):
+        residues[position] = generator.choice('XBZ1*')
+    return ''.join(residues)
+
+
+def open_output(path):
+    return gzip.open(path, 'wt', compresslevel=1) if path.endswith('.gz') else open(path, 'w')
+
+
+def write_proteome(path, proteins, min_length=50, max_length=800, seed=0, line_length=60):
+    """
+    Writes a multi-FASTA file of random proteins with lengths uniform between min_length and max_length, gzipped
+    when path ends with .gz.
+
+    Returns:
+        int: The total number of residues.
+    """
+    generator = random.Random(seed)
+    residues = 0
+    with open_output(path) as handle:
+        for index in range(proteins):
+            sequence = ''.join(generator.choices(AMINO_ACIDS, k=generator.randint(min_length, max_length)))
+            residues += len(sequence)
+            lines = '\n'.join(sequence[start:start + line_length] for start in range(0, len(sequence), line_length))
+            handle.write(f'>protein_{index} synthetic\n{lines}\n')
+    return residues
+
+
+def write_receipt(path, samples, studies):
+    """
+    Writes a Webin receipt of samples sample_0.. spread over studies study_0.., with one experiment per sample.
+    """
+    with open(path, 'w') as handle:
+        handle.write('YAML -------------\nENA_experiment:\n')
+        handle.writelines(EXPERIMENT.format(index=index, study=index % studies) for index in range(samples))
+        handle.write('YAML -------------\n\nSubmission was done successfully\n\nStudy accession details:\n')
+        handle.writelines(f'study_{study}\tSTUDY{study:07d}\t{TIMESTAMP}\tadded\n' for study in range(studies))
+        handle.write('\nSample accession details:\n')
+        handle.writelines(f'sample_{index}\tSAMPLE{index:08d}\t{TIMESTAMP}\tadded\n' for index in range(samples))
+        handle.write('\nSaving updates in new tsv tables::\n')
+
+
+def write_consensus_fasta(path, samples, length=1000, seed=0, line_length=60):
+    """
+    Writes a multi-FASTA file with a random consensus sequence of every sample of write_receipt.
+    """
+    generator = random.Random(seed)
+    with open_output(path) as handle:
+        for index in range(samples):
+            sequence = ''.join(generator.choices(NUCLEOTIDES, k=length))
+            lines = '\n'.join(sequence[start:start + line_length] for start in range(0, len(sequence), line_length))
+            handle.write(f'>sample_{index}\n{lines}\n')
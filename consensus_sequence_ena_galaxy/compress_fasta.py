@@ -0,0 +1,175 @@
+"""
+Prepares the consensus FASTA files of a submission in the input directory of Webin-CLI.
+
+Plain FASTA files are gzip compressed, files that are already valid gzip are linked without recompression. The
+MD5 checksum of every compressed file is computed while it is written or validated, so no file is read twice.
+Files are processed concurrently: zlib and hashlib release the GIL on large buffers, so threads use all slots.
+
+Takes as input a JSON list of [path, name] pairs, with name the element identifier of the FASTA in Galaxy, and
+writes a tab separated table with per file: name, compressed file name, MD5 checksum and error message.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Size of the blocks in which files are read
+CHUNK_SIZE = 1 << 20
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def get_worker_count():
+    """
+    Returns the number of worker threads to use, taken from the GALAXY_SLOTS environment variable.
+    """
+    try:
+        return max(1, int(os.environ.get('GALAXY_SLOTS', 1)))
+    except ValueError:
+        return 1
+
+
+def target_name(name):
+    """
+    Returns the name of the compressed file of a FASTA, e.g. sample.fasta -> sample.fasta.gz.
+    """
+    return name if name.endswith('.gz') else name + '.gz'
+
+
+def is_gzip(path):
+    with open(path, 'rb') as handle:
+        return handle.read(2) == GZIP_MAGIC
+
+
+def read_chunks(handle):
+    while True:
+        chunk = handle.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def checksum_gzip(path):
+    """
+    Checks that a (multi-member) gzip file decompresses completely and returns its MD5 checksum.
+
+    Raises:
+        ValueError: If the file is corrupt or truncated.
+    """
+    md5 = hashlib.md5()
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    in_member = False
+    with open(path, 'rb') as handle:
+        for chunk in read_chunks(handle):
+            md5.update(chunk)
+            if not in_member and not chunk.strip(b'\x00'):
+                continue
+            data = chunk
+            in_member = True
+            while True:
+                # the output is limited, as a block of N's inflates a thousand times
+                try:
+                    output = decompressor.decompress(data, CHUNK_SIZE)
+                except zlib.error as error:
+                    raise ValueError(f'corrupt gzip file: {error}')
+                if decompressor.eof:
+                    # the next member starts in the unused data, trailing zero padding is allowed
+                    data = decompressor.unused_data
+                    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                    in_member = bool(data.strip(b'\x00'))
+                    if not in_member:
+                        break
+                else:
+                    data = decompressor.unconsumed_tail
+                    if not data and len(output) < CHUNK_SIZE:
+                        break
+    if in_member:
+        raise ValueError('truncated gzip file')
+    return md5.hexdigest()
+
+
+class HashingWriter:
+    """
+    Writes to a binary file while updating the MD5 checksum of everything written.
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.md5 = hashlib.md5()
+
+    def write(self, data):
+        self.md5.update(data)
+        return self.handle.write(data)
+
+    def flush(self):
+        self.handle.flush()
+
+
+def compress_file(path, target_path, level):
+    """
+    Gzip compresses a file and returns the MD5 checksum of the compressed file.
+    """
+    with open(path, 'rb') as source, open(target_path, 'wb') as target:
+        writer = HashingWriter(target)
+        with gzip.GzipFile(fileobj=writer, mode='wb', compresslevel=level, mtime=0) as compressed:
+            for chunk in read_chunks(source):
+                compressed.write(chunk)
+    return writer.md5.hexdigest()
+
+
+def prepare_fasta(path, name, output_dir, level):
+    """
+    Compresses or links one FASTA file into output_dir.
+
+    Returns:
+        tuple: The name, the compressed file name, the MD5 checksum and an error message (None if successful).
+    """
+    file_name = target_name(name)
+    target_path = os.path.join(output_dir, file_name)
+    try:
+        if is_gzip(path):
+            md5 = checksum_gzip(path)
+            os.symlink(os.path.abspath(path), target_path)
+        else:
+            md5 = compress_file(path, target_path, level)
+    except (OSError, ValueError) as error:
+        return name, file_name, None, str(error)
+    return name, file_name, md5, None
+
+
+def prepare_all(inputs, output_dir, workers=1, level=6):
+    """
+    Prepares all FASTA files with a pool of worker threads, the results are returned in input order.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda item: prepare_fasta(item[0], item[1], output_dir, level), inputs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compress FASTA files for Webin-CLI and compute their MD5 checksums.')
+    parser.add_argument('--inputs', type=str, required=True, help='JSON list of [path, name] pairs of the FASTA files')
+    parser.add_argument('--output-dir', type=str, required=True, help='Directory of the compressed files')
+    parser.add_argument('--checksums', type=str, required=True, help='Tab separated table of the checksums')
+    parser.add_argument('--workers', type=int, default=get_worker_count(),
+                        help='Number of files processed concurrently (default: GALAXY_SLOTS or 1)')
+    parser.add_argument('--level', type=int, default=6, choices=range(1, 10), metavar='{1..9}',
+                        help='gzip compression level (default: 6)')
+    args = parser.parse_args()
+
+    with open(args.inputs) as inputs_file:
+        inputs = json.load(inputs_file)
+    os.makedirs(args.output_dir, exist_ok=True)
+    results = prepare_all(inputs, args.output_dir, max(1, args.workers), args.level)
+    with open(args.checksums, 'w') as checksums_file:
+        checksums_file.write(''.join(f'{name}\t{file_name}\t{md5 or ""}\t{error or ""}\n'
+                                     for name, file_name, md5, error in results))
+    failed = [(name, error) for name, _, _, error in results if error]
+    for name, error in failed:
+        print(f'Could not prepare {name}: {error}')
+    print(f'Prepared {len(results) - len(failed)} of {len(results)} FASTA files in {args.output_dir}')
+
+
+if __name__ == '__main__':
+    main()
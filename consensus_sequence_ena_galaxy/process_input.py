@@ -1,126 +1,447 @@
+import argparse
 import gzip
+import hashlib
 import json
 import os
 import sys
 import shutil
 import yaml
 
-def get_section_string(f, start_line, end_line, return_string=False):
-    # consume starting lines
-    start_string = iter(f.readline, start_line)
-    start_string = ''.join(line for line in start_string)
-    # read YAML lines
-    yaml_string = iter(f.readline, end_line)
-    if return_string:
-        return ''.join(x for x in yaml_string)
-    else:
-        return [x for x in yaml_string]
-  
-def fill_from_yaml_data(yaml_only_dict, studies_samples_dict):
-    # fill experiment information (platform)  **** 
-    for index,exp in yaml_only_dict['ENA_experiment'].items():
-        study_alias = exp['study_alias']
-        sample_alias = exp['sample_alias']
-        if study_alias in studies_samples_dict.keys():
-            if sample_alias in studies_samples_dict[study_alias].keys():
-                studies_samples_dict[study_alias][sample_alias]['experiments'].append({'platform': exp['platform']})
+from compress_fasta import get_worker_count
+from validate_fasta import validate_all, validation_rules, write_report
+
+# Use the C accelerated YAML loader of libyaml when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# Lines that open the sections of the receipt
+YAML_DELIMITER = 'YAML -------------'
+STUDY_HEADER = 'Study accession details:'
+SAMPLE_HEADER = 'Sample accession details:'
+
+
+class ReceiptError(ValueError):
+    """
+    A malformed receipt, with the line number at which the problem was found.
+    """
+
+    def __init__(self, line_number, message):
+        super().__init__(f'Malformed receipt at line {line_number}: {message}')
+        self.line_number = line_number
+
+
+class YamlSectionReader:
+    """
+    File-like view on the YAML section of a receipt, read line by line from the receipt until the closing
+    delimiter. The YAML loader reads from it in chunks, so the section is never held as one string.
+
+    Args:
+        lines: Iterator over (line number, line) of the receipt, positioned after the opening delimiter.
+        start_line (int): Line number of the opening delimiter.
+    """
+
+    def __init__(self, lines, start_line):
+        self.lines = lines
+        self.start_line = start_line
+        self.line_number = start_line
+        self.buffer = ''
+        self.finished = False
+
+    def read(self, size=-1):
+        while not self.finished and (size < 0 or len(self.buffer) < size):
+            try:
+                self.line_number, line = next(self.lines)
+            except StopIteration:
+                raise ReceiptError(self.line_number, f"the YAML section opened at line {self.start_line} is not "
+                                                     f"closed by '{YAML_DELIMITER}'")
+            if line.rstrip('\r\n') == YAML_DELIMITER:
+                self.finished = True
             else:
-                studies_samples_dict[study_alias][sample_alias] = {'experiments': [{'platform': exp['platform']}]}
-        else:
-            studies_samples_dict[study_alias] = {sample_alias: {'experiments':[{'platform': exp['platform']}]}}
+                self.buffer += line
+        if size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+
+def load_yaml_section(lines, start_line):
+    reader = YamlSectionReader(lines, start_line)
+    try:
+        yaml_section = yaml.load(reader, Loader=SafeLoader)
+    except yaml.YAMLError as error:
+        mark = getattr(error, 'problem_mark', None)
+        line_number = start_line + mark.line + 1 if mark else reader.line_number
+        raise ReceiptError(line_number, f'invalid YAML: {getattr(error, "problem", None) or error}')
+    # consume the rest of the section, in case the loader stopped before the closing delimiter
+    reader.read()
+    if not isinstance(yaml_section, dict) or not isinstance(yaml_section.get('ENA_experiment'), dict):
+        raise ReceiptError(start_line, 'the YAML section has no ENA_experiment entries')
+    return yaml_section
+
+
+class Receipt:
+    """
+    The studies and samples of a receipt, indexed once so that every sample is resolved in constant time.
+
+    Attributes:
+        studies (dict): Study alias -> study accession, None until the study accession section is read.
+        samples (dict): Sample alias -> dict with the study alias, the sample accession and the experiments.
+        study_aliases (dict): Study accession -> study alias.
+        sample_aliases (dict): Sample accession -> sample alias.
+    """
+
+    def __init__(self):
+        self.studies = {}
+        self.samples = {}
+        self.study_aliases = {}
+        self.sample_aliases = {}
+
+    def add_experiment(self, study_alias, sample_alias, platform):
+        self.studies.setdefault(study_alias, None)
+        # a sample belongs to the study of its first experiment
+        sample = self.samples.setdefault(sample_alias, {'study': study_alias, 'accession': None, 'experiments': []})
+        sample['experiments'].append({'platform': platform})
+
+    def sample(self, sample_alias):
+        """
+        Returns the sample with the given alias, or None if the receipt has no experiments of it.
+        """
+        return self.samples.get(sample_alias)
+
+    def study_accession(self, sample):
+        return self.studies[sample['study']]
+
+
+def fill_from_yaml_data(yaml_only_dict, receipt):
+    # fill experiment information (platform)  ****
+    for index, exp in yaml_only_dict['ENA_experiment'].items():
+        receipt.add_experiment(exp['study_alias'], exp['sample_alias'], exp['platform'])
+
+
+def add_study_accession(receipt, alias, accession, line_number):
+    if alias in receipt.studies:
+        receipt.studies[alias] = accession
+        receipt.study_aliases[accession] = alias
+    else:
+        print(f'Study {alias} (line {line_number}) has no experiments in the receipt')
+
+
+def add_sample_accession(receipt, alias, accession, line_number):
+    sample = receipt.sample(alias)
+    if sample is not None:
+        sample['accession'] = accession
+        receipt.sample_aliases[accession] = alias
+
+
+# Handlers of the lines of the accession sections, which end at an empty line
+SECTION_HANDLERS = {STUDY_HEADER: add_study_accession, SAMPLE_HEADER: add_sample_accession}
 
 
 def load_receipt_data(input_file_path):
-    # should do some health check of the input file?
-    # load yaml section
-    loaded_data = {} 
-    yaml_delimiter = 'YAML -------------\n'
-    with open(input_file_path) as input_file:
-        yaml_only_section = yaml.safe_load(get_section_string(input_file, start_line=yaml_delimiter, end_line=yaml_delimiter, return_string=True))
-    fill_from_yaml_data(yaml_only_section, loaded_data)
-    # read study accessions
-    study_delimiter = 'Study accession details:\n'
-    end_line = '\n'
-    with open(input_file_path) as input_file:
-        studies_accession_lines = get_section_string(input_file, start_line=study_delimiter, end_line=end_line)
-    # loaded_data['studies'] = {}
-    for study_line in studies_accession_lines:
-        if study_line != '\n':
-            alias, accession, *_ = study_line.split('\t')
-            try:
-                loaded_data[alias]['accession'] = accession
-            except KeyError:
-                print(f"Experiment {exp} has unknown study or sample")
-            # loaded_data['studies'][alias]['accession'] = accession
-    samples_delimiter = 'Sample accession details:\n'
+    """
+    Parses the receipt in a single pass: every line is dispatched to the handler of the section it belongs to.
+
+    Returns:
+        Receipt: The studies and samples of the receipt with their accessions.
+
+    Raises:
+        ReceiptError: If a section is malformed or the YAML section is missing, with the offending line number.
+    """
+    receipt = Receipt()
+    yaml_line = None
+    handler = None
+    line_number = 0
     with open(input_file_path) as input_file:
-        samples_accession_lines = get_section_string(input_file, start_line=samples_delimiter, end_line=end_line)
-        ## need to iterate over all studies, because here I don't know which study is the sample from.
-    # loaded_data['samples'] = {}
-    for sample_line in samples_accession_lines:
-        if sample_line != '\n':
-            alias, accession, *_ = sample_line.split('\t')
-            for study in loaded_data.keys():
-                if alias in loaded_data[study].keys():
-                    loaded_data[study][alias]['accession'] = accession
-                    break
-    return loaded_data
+        lines = enumerate(input_file, start=1)
+        for line_number, line in lines:
+            line = line.rstrip('\r\n')
+            if handler is not None:
+                if not line.strip():
+                    handler = None
+                    continue
+                alias, accession, *_ = line.split('\t') + ['']
+                if not alias or not accession:
+                    raise ReceiptError(line_number, f'expected a tab separated alias and accession, got "{line}"')
+                handler(receipt, alias, accession, line_number)
+            elif line == YAML_DELIMITER:
+                if yaml_line is not None:
+                    raise ReceiptError(line_number, f'second YAML section, the first one starts at line {yaml_line}')
+                yaml_line = line_number
+                fill_from_yaml_data(load_yaml_section(lines, line_number), receipt)
+            elif line in SECTION_HANDLERS:
+                if yaml_line is None:
+                    raise ReceiptError(line_number, f'"{line}" found before the YAML section')
+                handler = SECTION_HANDLERS[line]
+    if yaml_line is None:
+        raise ReceiptError(line_number, 'no YAML section found')
+    return receipt
 
 
 """
 Takes as input:
     1. A receipt obtained from ENA submission tool: 
         a txt file that contains sections describing submission details.
-    2. A json file with the list of fasta that the user loaded
+    2. A json file with the list of fasta that the user loaded,
+        or a single multi-FASTA with the consensus sequences of all samples (--multi-fasta)
     3. Path to write generated manifests
     4. Manifest template path: the manifest with the global values set 
         (e.g COVERAGE, MINGAPLENGHT..)
+    5. Optional: the checksums table written by compress_fasta.py
 """
 
+# Positional arguments of earlier versions, still accepted in this order
+LEGACY_ARGUMENTS = ['receipt', 'fasta_list', 'manifests_dir', 'manifest_template', 'checksums']
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def manifest_content(template, sample_alias, platform, study_accession, sample_accession):
+    # the contents of the manifest template containing the global vars come first
+    # files should be available in the corresponding dir and named: sample_alias.fasta.gz
+    return (f"{template}"
+            f"ASSEMBLYNAME\tconsensus_{sample_alias}\n"
+            f"PLATFORM\t{platform}\n"
+            f"STUDY\t{study_accession}\n"
+            f"SAMPLE\t{sample_accession}\n"
+            f"FASTA\t{sample_alias}.fasta.gz\n")
+
+
+def load_checksums(checksums_path):
+    """
+    Loads the table written by compress_fasta.py: FASTA name -> (MD5 checksum, error message).
+    """
+    checksums = {}
+    with open(checksums_path) as checksums_file:
+        for line in checksums_file:
+            name, _, md5, error = line.rstrip('\n').split('\t')
+            checksums[name] = (md5, error)
+    return checksums
+
+
+def resolve_sample(receipt, sample_alias):
+    """
+    Returns the sample and its study accession, or None after reporting why the sample cannot be submitted.
+    """
+    sample = receipt.sample(sample_alias)
+    if sample is None:
+        print(f'No metadata found for sample {sample_alias}')
+        return None
+    study_accession = receipt.study_accession(sample)
+    if sample['accession'] is None or study_accession is None:
+        print(f'No accession found for sample {sample_alias}')
+        return None
+    return sample, study_accession
+
+
+def write_manifest(sample_alias, sample, study_accession, out_manifest_base, template):
+    ### TODO get a string that concatenates plaform information from multiple exp
+    platform = sample['experiments'][0]['platform']
+    manifest_path = os.path.join(out_manifest_base, sample_alias + '.manifest.txt')
+    with open(manifest_path, 'w') as output_handle:
+        output_handle.write(manifest_content(template, sample_alias, platform, study_accession, sample['accession']))
+    return manifest_path
+
+
+def write_manifests(receipt, fasta_files_list, out_manifest_base, template, checksums=None):
+    """
+    Writes the manifest of every FASTA file that has metadata in the receipt, in a single pass over the files.
+
+    With checksums, FASTA files that could not be compressed are skipped and the MD5 checksum of the compressed
+    file follows the manifest path.
+
+    Returns:
+        list: The (sample alias, manifest path, MD5 checksum or None) of every manifest, in the order of the FASTA
+        files.
+    """
+    manifests = []
+    for fasta_file in fasta_files_list:
+        if fasta_file.endswith('.fasta.gz'):
+            sample_alias = fasta_file[:-9]
+        else:
+            sample_alias = fasta_file[:-6]
+        print(f'Processing {sample_alias}')
+        resolved = resolve_sample(receipt, sample_alias)
+        if resolved is None:
+            continue
+        md5 = None
+        if checksums is not None:
+            md5, error = checksums.get(fasta_file, (None, 'not compressed'))
+            if error:
+                print(f'Skipping sample {sample_alias}: {error}')
+                continue
+        manifest_path = write_manifest(sample_alias, *resolved, out_manifest_base, template)
+        manifests.append((sample_alias, manifest_path, md5))
+    return manifests
+
+
+def header_sample_alias(receipt, header):
+    """
+    Maps a FASTA header to a sample alias of the receipt.
+
+    The sequence identifier (the first word of the header) or one of its '|' separated fields has to be the
+    alias or the accession of a sample.
+    """
+    identifier = header.split(maxsplit=1)[0] if header.strip() else ''
+    for candidate in [identifier] + identifier.split('|'):
+        if candidate in receipt.samples:
+            return candidate
+        if candidate in receipt.sample_aliases:
+            return receipt.sample_aliases[candidate]
+    return None
+
+
+def open_fasta(fasta_path):
+    with open(fasta_path, 'rb') as fasta:
+        gzipped = fasta.read(2) == GZIP_MAGIC
+    return gzip.open(fasta_path, 'rb') if gzipped else open(fasta_path, 'rb')
+
+
+def read_fasta_records(fasta_path):
+    """
+    Streams a (gzipped) multi-FASTA, yielding the header line and the sequence lines of one record at a time.
+    """
+    header, lines = None, []
+    with open_fasta(fasta_path) as fasta:
+        for line in fasta:
+            if line.startswith(b'>'):
+                if header is not None:
+                    yield header, lines
+                header, lines = line, []
+            elif header is not None:
+                lines.append(line)
+    if header is not None:
+        yield header, lines
+
+
+def split_multi_fasta(receipt, fasta_path, fasta_dir, out_manifest_base, template):
+    """
+    Writes every record of a multi-FASTA to the gzipped FASTA of its sample and writes the manifest of every
+    sample, in a single pass over the multi-FASTA.
+
+    Only the current record is held in memory. Every record is appended to the FASTA of its sample as a gzip
+    member of its own, so the records of a sample do not have to be consecutive.
+
+    Returns:
+        list: The (sample alias, manifest path, MD5 checksum of the gzipped FASTA) of every manifest, in the order
+        of the samples.
+    """
+    samples = {}  # sample alias -> (manifest path, MD5 of its gzipped FASTA)
+    skipped = set()
+    for header_line, lines in read_fasta_records(fasta_path):
+        header = header_line[1:].decode(errors='replace').strip()
+        sample_alias = header_sample_alias(receipt, header)
+        if sample_alias is None:
+            print(f'No metadata found for record {header}')
+            continue
+        if sample_alias in skipped:
+            continue
+        if sample_alias not in samples:
+            print(f'Processing {sample_alias}')
+            resolved = resolve_sample(receipt, sample_alias)
+            if resolved is None:
+                skipped.add(sample_alias)
+                continue
+            samples[sample_alias] = (write_manifest(sample_alias, *resolved, out_manifest_base, template),
+                                     hashlib.md5())
+            mode = 'wb'
+        else:
+            mode = 'ab'
+        record = header_line + b''.join(lines)
+        if not record.endswith(b'\n'):
+            record += b'\n'
+        member = gzip.compress(record, compresslevel=6, mtime=0)
+        samples[sample_alias][1].update(member)
+        with open(os.path.join(fasta_dir, sample_alias + '.fasta.gz'), mode) as sample_fasta:
+            sample_fasta.write(member)
+    return [(sample_alias, manifest_path, md5.hexdigest()) for sample_alias, (manifest_path, md5) in samples.items()]
+
+
+def drop_invalid_fasta(manifests, fasta_dir, template, report_path, workers=1):
+    """
+    Validates the FASTA file of every manifest and leaves out the samples whose FASTA fails, see validate_fasta.
+
+    Returns:
+        list: The manifests of the samples that passed.
+    """
+    rules = validation_rules(template)
+    paths = [os.path.join(fasta_dir, sample_alias + '.fasta.gz') for sample_alias, _, _ in manifests]
+    results = validate_all(paths, rules, workers)
+    write_report(report_path, [sample_alias for sample_alias, _, _ in manifests], results)
+    passed = []
+    for manifest, result in zip(manifests, results):
+        if result['status'] == 'failed':
+            print(f'Dropping sample {manifest[0]}: {result["messages"]}')
+        else:
+            passed.append(manifest)
+    print(f'{len(passed)} of {len(manifests)} samples passed the FASTA validation')
+    return passed
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Writes the Webin-CLI manifests of the consensus sequences of the samples in an ENA receipt.',
+        epilog='The positional form "receipt fasta_list manifests_dir manifest_template [checksums]" of earlier '
+               'versions is still accepted.')
+    parser.add_argument('legacy', nargs='*', help=argparse.SUPPRESS)
+    parser.add_argument('--receipt', type=str, help='Receipt of the ENA upload tool')
+    parser.add_argument('--fasta-list', type=str, help='JSON list of the names of the per-sample FASTA files')
+    parser.add_argument('--multi-fasta', type=str,
+                        help='(Gzipped) multi-FASTA with the consensus sequences of all samples, split per sample')
+    parser.add_argument('--fasta-dir', type=str, default='fasta',
+                        help='Directory of the per-sample FASTA files, split from --multi-fasta or compressed by '
+                             'compress_fasta.py (default: fasta)')
+    parser.add_argument('--manifests-dir', type=str, help='Directory of the generated manifests')
+    parser.add_argument('--manifest-template', type=str, help='Manifest with the values shared by all samples')
+    parser.add_argument('--checksums', type=str, help='Checksums table written by compress_fasta.py')
+    parser.add_argument('--submit-list', type=str, default='submit_list.tab',
+                        help='List of the manifests to submit (default: submit_list.tab)')
+    parser.add_argument('--validation-report', type=str, default=None,
+                        help='Validate the per-sample FASTA files, write the report to this path and leave the '
+                             'samples that fail out of the submit list')
+    parser.add_argument('--workers', type=int, default=get_worker_count(),
+                        help='Number of FASTA files validated at a time (default: GALAXY_SLOTS or 1)')
+    args = parser.parse_args(argv)
+    if args.legacy:
+        if len(args.legacy) not in (4, 5):
+            parser.error(f'expected 4 or 5 positional arguments: {" ".join(LEGACY_ARGUMENTS)}')
+        if any(getattr(args, name) is not None for name in LEGACY_ARGUMENTS):
+            parser.error('positional arguments cannot be combined with --receipt, --fasta-list, --manifests-dir, '
+                         '--manifest-template or --checksums')
+        for name, value in zip(LEGACY_ARGUMENTS, args.legacy):
+            setattr(args, name, value)
+    for name in ('receipt', 'manifests_dir', 'manifest_template'):
+        if getattr(args, name) is None:
+            parser.error(f'--{name.replace("_", "-")} is required')
+    if (args.fasta_list is None) == (args.multi_fasta is None):
+        parser.error('give either --fasta-list or --multi-fasta')
+    return args
 
 
 def main():
-    input_file_path = sys.argv[1]
-    fasta_names_list_path = sys.argv[2]
-    out_manifest_base = sys.argv[3] 
-    manifest_template = sys.argv[4]
+    args = parse_arguments()
     # load submitted data from receipt file
-    data_dict = load_receipt_data(input_file_path)
-    # iterate over the list of fasta files
-    with open(fasta_names_list_path, 'r') as fasta_files_json_file:
-        fasta_files_list = json.load(fasta_files_json_file)
-    with open('submit_list.tab', 'w') as written_manifests_out:
-        for fasta_file in fasta_files_list:
-            if fasta_file.endswith('.fasta.gz'):
-                sample_alias = fasta_file[:-9]
-            else:
-                sample_alias = fasta_file[:-6]
-            print(f'Processing {sample_alias}')
-            found_metadata = False
-            for study_alias in data_dict.keys():
-                if sample_alias in data_dict[study_alias].keys():
-                    sample_accession = data_dict[study_alias][sample_alias]['accession']
-                    study_accession = data_dict[study_alias]['accession']
-                    ### TODO get a string that concatenates plaform information from multiple exp
-                    platform = data_dict[study_alias][sample_alias]['experiments'][0]['platform']
-                    manifest_path = os.path.join(out_manifest_base, sample_alias + '.manifest.txt')
-                    with open(manifest_path, "w") as output_handle:
-                        # first dump the contents of manifest template
-                        # containing the global vars
-                        with open(manifest_template) as m_template:
-                            output_handle.write(m_template.read())
-                        output_handle.write("ASSEMBLYNAME\tconsensus_" + sample_alias + "\n")
-                        output_handle.write("PLATFORM\t" + platform + "\n")
-                        output_handle.write("STUDY\t" + study_accession + "\n")
-                        output_handle.write("SAMPLE\t" + sample_accession + "\n")
-                        # files should be available in the corresponding dir and named:
-                        #  sample_alias.fasta.gz 
-                        output_handle.write("FASTA\t" + sample_alias + '.fasta.gz' + "\n")
-                    found_metadata = True
-                    written_manifests_out.write(manifest_path + '\n')
-                    break
-            if not found_metadata:
-                print(f'No metadata found for sample {sample_alias}')
+    try:
+        receipt = load_receipt_data(args.receipt)
+    except ReceiptError as error:
+        sys.exit(f'Error: {error}')
+    # the template is read once and copied into every manifest
+    with open(args.manifest_template) as m_template:
+        template = m_template.read()
+    if args.multi_fasta:
+        os.makedirs(args.fasta_dir, exist_ok=True)
+        manifests = split_multi_fasta(receipt, args.multi_fasta, args.fasta_dir, args.manifests_dir, template)
+    else:
+        with open(args.fasta_list, 'r') as fasta_files_json_file:
+            fasta_files_list = json.load(fasta_files_json_file)
+        checksums = load_checksums(args.checksums) if args.checksums else None
+        manifests = write_manifests(receipt, fasta_files_list, args.manifests_dir, template, checksums)
+    if args.validation_report:
+        manifests = drop_invalid_fasta(manifests, args.fasta_dir, template, args.validation_report,
+                                       max(1, args.workers))
+    with open(args.submit_list, 'w') as written_manifests_out:
+        written_manifests_out.write(''.join(f'{manifest_path}\t{md5}\n' if md5 else manifest_path + '\n'
+                                            for _, manifest_path, md5 in manifests))
 
 
 if __name__ == '__main__':
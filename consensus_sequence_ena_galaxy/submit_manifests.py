@@ -0,0 +1,271 @@
+"""
+Submits (or validates) the manifests listed in submit_list.tab with Webin-CLI, several at a time.
+
+Every manifest is run in its own Webin-CLI process with its own log file in the logs directory. Runs that end
+with a retryable exit code are retried with an exponential backoff. The outcome of every manifest is appended
+to a state file, so running the same batch again only redoes the manifests that did not succeed. The state records
+the service a manifest went to, so a run on the test service or with a stub never counts for a production run.
+
+Webin-CLI reads the password from the WEBIN_PASSWORD environment variable (-passwordEnv), so it is never passed on
+a command line and does not show up in the process list.
+The Webin-CLI executable can be replaced with --executable or the WEBIN_CLI environment variable, e.g. by
+test-data/webin_cli_stub.py to try the retries and the state offline.
+"""
+import argparse
+import os
+import shlex
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from compress_fasta import get_worker_count
+
+# Columns of the state file, the last line of a manifest is its current state. State files without the service
+# column, of older versions, are ignored.
+STATE_COLUMNS = ['manifest', 'action', 'service', 'md5', 'status', 'attempts', 'exit_code']
+DONE = 'done'
+FAILED = 'failed'
+# Environment variable with the password of the Webin account, passed to Webin-CLI by name
+PASSWORD_ENV = 'WEBIN_PASSWORD'
+
+
+def read_submit_list(submit_list_path):
+    """
+    Returns the (manifest path, MD5 checksum) of every line of submit_list.tab, the checksum may be empty.
+    """
+    entries = []
+    with open(submit_list_path) as submit_list:
+        for line in submit_list:
+            fields = line.rstrip('\n').split('\t')
+            if fields[0]:
+                entries.append((fields[0], fields[1] if len(fields) > 1 else ''))
+    return entries
+
+
+def manifest_name(manifest_path):
+    name = os.path.basename(manifest_path)
+    for suffix in ('.manifest.txt', '.txt'):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+class SubmissionState:
+    """
+    The state file of a batch: per manifest, action, service and checksum whether it was done.
+
+    Outcomes are appended and flushed one line at a time, so the state survives an interrupted batch.
+    """
+
+    def __init__(self, state_path):
+        self.done = set()
+        if os.path.exists(state_path):
+            with open(state_path) as state_file:
+                for line in state_file:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) != len(STATE_COLUMNS) or fields == STATE_COLUMNS:
+                        continue
+                    key = tuple(fields[:4])
+                    if fields[4] == DONE:
+                        self.done.add(key)
+                    else:
+                        self.done.discard(key)
+        new_file = not os.path.exists(state_path) or os.path.getsize(state_path) == 0
+        self.out = open(state_path, 'a')
+        if new_file:
+            self.out.write('\t'.join(STATE_COLUMNS) + '\n')
+        self.lock = threading.Lock()
+
+    def is_done(self, key):
+        return key in self.done
+
+    def record(self, key, status, attempts, exit_code):
+        with self.lock:
+            self.out.write('\t'.join(list(key) + [status, str(attempts), str(exit_code)]) + '\n')
+            self.out.flush()
+            if status == DONE:
+                self.done.add(key)
+
+    def close(self):
+        self.out.close()
+
+
+class WebinSubmitter:
+    """
+    Runs Webin-CLI for one manifest at a time, with retries.
+
+    Args:
+        executable (str): The Webin-CLI command, split like a shell command line.
+        user_name (str): Webin submission account.
+        password_env (str): Environment variable holding the password of the account, read by Webin-CLI itself.
+        center_name (str): Center name of the submission.
+        input_dir (str): Directory of the files referenced by the manifests.
+        output_dir (str): Output directory of Webin-CLI.
+        logs_dir (str): Directory of the per-manifest logs.
+        validate (bool): Only validate the manifests instead of submitting them.
+        test (bool): Use the Webin test service.
+        retries (int): Number of retries of a run that ended with one of retry_exit_codes.
+        backoff (float): Seconds to wait before the first retry, doubled for every next retry.
+        retry_exit_codes (set): Exit codes of Webin-CLI that are worth a retry. Only internal or system errors (1)
+            by default, a validation error (3) fails the same way every time.
+    """
+
+    def __init__(self, executable, user_name, password_env, center_name, input_dir, output_dir, logs_dir,
+                 validate=False, test=False, retries=2, backoff=10.0, retry_exit_codes=(1,)):
+        self.executable = shlex.split(executable)
+        self.user_name = user_name
+        self.password_env = password_env
+        self.center_name = center_name
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.logs_dir = logs_dir
+        self.validate = validate
+        self.test = test
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_exit_codes = set(retry_exit_codes)
+
+    @property
+    def action(self):
+        return 'validate' if self.validate else 'submit'
+
+    @property
+    def service(self):
+        """
+        The service the manifests go to: production or test, or stub when the executable is not Webin-CLI.
+        """
+        if not any('webin-cli' in os.path.basename(part) for part in self.executable):
+            return 'stub'
+        return 'test' if self.test else 'production'
+
+    def command(self, manifest_path):
+        command = self.executable + ['-context', 'genome', '-userName', self.user_name,
+                                     '-passwordEnv', self.password_env, '-centerName', self.center_name,
+                                     '-manifest', manifest_path, '-inputDir', self.input_dir,
+                                     '-outputDir', self.output_dir]
+        if self.test:
+            command.append('-test')
+        command.append('-' + self.action)
+        return command
+
+    def log_path(self, manifest_path):
+        return os.path.join(self.logs_dir, manifest_name(manifest_path) + '.log')
+
+    def run(self, manifest_path):
+        """
+        Runs Webin-CLI for a manifest until it succeeds, fails with a non retryable exit code or runs out of
+        retries.
+
+        Returns:
+            tuple: The exit code of the last run, the number of runs and the ERROR lines of the last run.
+        """
+        command = self.command(manifest_path)
+        shown_command = ' '.join(shlex.quote(argument) for argument in command)
+        attempt = 0
+        while True:
+            attempt += 1
+            with open(self.log_path(manifest_path), 'a') as log:
+                log.write(f'## Attempt {attempt}: {shown_command}\n')
+                log.flush()
+                start = log.tell()
+                try:
+                    exit_code = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT).returncode
+                except OSError as error:
+                    log.write(f'ERROR: could not run {self.executable[0]}: {error}\n')
+                    exit_code = 127
+            if exit_code == 0 or exit_code not in self.retry_exit_codes or attempt > self.retries:
+                break
+            time.sleep(self.backoff * 2 ** (attempt - 1))
+        with open(self.log_path(manifest_path)) as log:
+            log.seek(start)
+            errors = [line.strip() for line in log if 'ERROR' in line]
+        return exit_code, attempt, errors
+
+
+def submit_all(entries, submitter, state, workers=1):
+    """
+    Runs the manifests that are not done yet with at most workers concurrent Webin-CLI processes.
+
+    Returns:
+        tuple: The number of manifests that were done before, that succeeded and that failed.
+    """
+    print_lock = threading.Lock()
+
+    def report(message):
+        with print_lock:
+            print(message, flush=True)
+
+    def submit(entry):
+        manifest_path, md5 = entry
+        key = (manifest_path, submitter.action, submitter.service, md5)
+        report(f'Submitting manifest {manifest_path}')
+        exit_code, attempts, errors = submitter.run(manifest_path)
+        if exit_code == 0:
+            state.record(key, DONE, attempts, exit_code)
+            report(f'Manifest {manifest_path}: {submitter.action} succeeded ({attempts} run(s))')
+            return True
+        state.record(key, FAILED, attempts, exit_code)
+        report(f'Manifest {manifest_path}: {submitter.action} failed with exit code {exit_code} '
+               f'({attempts} run(s))' + ''.join(f'\n    {error}' for error in errors))
+        return False
+
+    pending = []
+    skipped = 0
+    for manifest_path, md5 in entries:
+        if state.is_done((manifest_path, submitter.action, submitter.service, md5)):
+            report(f'Skipping manifest {manifest_path}: already done')
+            skipped += 1
+        else:
+            pending.append((manifest_path, md5))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(submit, pending))
+    return skipped, sum(outcomes), len(outcomes) - sum(outcomes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Submit or validate the manifests of submit_list.tab with '
+                                                 'Webin-CLI, several at a time.')
+    parser.add_argument('--submit-list', type=str, default='submit_list.tab', help='List of manifests to submit')
+    parser.add_argument('--user-name', type=str, required=True, help='Webin submission account')
+    parser.add_argument('--center-name', type=str, default='', help='Center name of the submission')
+    parser.add_argument('--input-dir', type=str, default='.', help='Directory of the files of the manifests')
+    parser.add_argument('--output-dir', type=str, default='outputs', help='Output directory of Webin-CLI')
+    parser.add_argument('--logs-dir', type=str, default='logs', help='Directory of the per-manifest logs')
+    parser.add_argument('--state', type=str, default='submission_state.tab',
+                        help='State file, manifests that are done in it are not run again')
+    parser.add_argument('--validate', action='store_true', help='Only validate the manifests')
+    parser.add_argument('--test', action='store_true', help='Use the Webin test service')
+    parser.add_argument('--workers', type=int, default=get_worker_count(),
+                        help='Number of concurrent Webin-CLI runs (default: GALAXY_SLOTS or 1)')
+    parser.add_argument('--retries', type=int, default=2, help='Retries of a failed run (default: 2)')
+    parser.add_argument('--backoff', type=float, default=10.0,
+                        help='Seconds before the first retry, doubled for every next retry (default: 10)')
+    parser.add_argument('--retry-exit-codes', type=str, default='1',
+                        help='Comma separated exit codes of Webin-CLI that are retried (default: 1, internal or '
+                             'system errors)')
+    parser.add_argument('--executable', type=str, default=os.environ.get('WEBIN_CLI', 'ena-webin-cli'),
+                        help='Webin-CLI command (default: WEBIN_CLI or ena-webin-cli)')
+    args = parser.parse_args()
+
+    try:
+        retry_exit_codes = {int(code) for code in args.retry_exit_codes.split(',') if code.strip()}
+    except ValueError:
+        parser.error(f'--retry-exit-codes must be comma separated integers, got "{args.retry_exit_codes}"')
+    os.makedirs(args.output_dir, exist_ok=True)
+    os.makedirs(args.logs_dir, exist_ok=True)
+    submitter = WebinSubmitter(args.executable, args.user_name, PASSWORD_ENV, args.center_name, args.input_dir,
+                               args.output_dir, args.logs_dir, validate=args.validate, test=args.test,
+                               retries=max(0, args.retries), backoff=args.backoff, retry_exit_codes=retry_exit_codes)
+    # process_input.py writes no list when the receipt could not be parsed
+    entries = read_submit_list(args.submit_list) if os.path.exists(args.submit_list) else []
+    state = SubmissionState(args.state)
+    try:
+        skipped, succeeded, failed = submit_all(entries, submitter, state, max(1, args.workers))
+    finally:
+        state.close()
+    print(f'{succeeded} manifest(s) succeeded, {failed} failed and {skipped} were already done')
+
+
+if __name__ == '__main__':
+    main()
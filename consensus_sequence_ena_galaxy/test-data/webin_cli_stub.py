@@ -0,0 +1,40 @@
+"""
+Stand-in for ena-webin-cli to try the retries and the submission state of submit_manifests.py offline:
+
+    WEBIN_PASSWORD=x python3 submit_manifests.py --user-name u --executable "python3 test-data/webin_cli_stub.py"
+        --backoff 0 --validate
+
+The first run of every manifest fails with an internal error (exit code 1), the next run succeeds. The runs are
+counted in a file per manifest in the output directory. Like Webin-CLI it refuses to run when the environment
+variable named by -passwordEnv is not set.
+"""
+import os
+import sys
+
+
+def option(name):
+    return sys.argv[sys.argv.index(name) + 1] if name in sys.argv else None
+
+
+def main():
+    manifest = option('-manifest')
+    password_env = option('-passwordEnv')
+    if not password_env or not os.environ.get(password_env):
+        print('ERROR: Invalid submission account user name or password.')
+        sys.exit(2)
+    action = 'validated' if '-validate' in sys.argv else 'submitted'
+    counter = os.path.join(option('-outputDir'), os.path.basename(manifest) + '.runs')
+    runs = 1
+    if os.path.exists(counter):
+        with open(counter) as counter_file:
+            runs += int(counter_file.read())
+    with open(counter, 'w') as counter_file:
+        counter_file.write(str(runs))
+    if runs == 1:
+        print(f'ERROR: An internal server error occurred while processing {manifest}.')
+        sys.exit(1)
+    print(f'INFO : The submission has been {action} successfully.')
+
+
+if __name__ == '__main__':
+    main()
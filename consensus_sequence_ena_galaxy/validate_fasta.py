@@ -0,0 +1,201 @@
+"""
+Pre-flight checks of the consensus FASTA files of a submission, run before Webin-CLI is started for them.
+
+Every (gzipped) FASTA is streamed once. The pass checks that the gzip stream is complete and computes, per
+record, the length, the number of N's and the assembly gaps: runs of at least MINGAPLENGTH N's. Samples whose
+file fails a check can be left out of the submission instead of failing after a Webin-CLI run.
+"""
+import gzip
+import os
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+# Default limits, conservative so that only files Webin-CLI would reject anyway are dropped
+MIN_SEQUENCE_LENGTH = 20
+MAX_N_FRACTION = 0.5
+# Limits that depend on the ASSEMBLY_TYPE of the manifest
+ASSEMBLY_TYPE_RULES = {
+    'COVID-19 outbreak': {'max_records': 1},
+}
+# Columns of the per-sample validation report
+REPORT_COLUMNS = ['sample', 'file', 'status', 'records', 'length', 'n_fraction', 'gaps', 'messages']
+
+IUPAC_NUCLEOTIDES = b'ACGTURYSWKMBDHVNacgturyswkmbdhvn'
+N_RUN = re.compile(rb'[Nn]+')
+
+
+def manifest_values(template):
+    """
+    Returns the fields of a manifest (template) as a dict, e.g. {'ASSEMBLY_TYPE': 'isolate', 'MINGAPLENGTH': '30'}.
+    """
+    values = {}
+    for line in template.splitlines():
+        field, _, value = line.partition('\t')
+        if field.strip():
+            values[field.strip().upper()] = value.strip()
+    return values
+
+
+def validation_rules(template, min_length=MIN_SEQUENCE_LENGTH, max_n_fraction=MAX_N_FRACTION):
+    """
+    Returns the rules of validate_fasta for the manifests written from the given template.
+    """
+    values = manifest_values(template)
+    try:
+        min_gap_length = int(values.get('MINGAPLENGTH', ''))
+    except ValueError:
+        min_gap_length = None
+    rules = {'min_length': min_length, 'max_n_fraction': max_n_fraction, 'min_gap_length': min_gap_length,
+             'max_records': None}
+    rules.update(ASSEMBLY_TYPE_RULES.get(values.get('ASSEMBLY_TYPE'), {}))
+    return rules
+
+
+class RecordStatistics:
+    """
+    Length, N count, gaps and terminal N's of one FASTA record, updated one sequence line at a time.
+    """
+
+    def __init__(self, header):
+        self.header = header
+        self.length = 0
+        self.n_count = 0
+        self.gaps = 0
+        self.invalid = 0
+        self.starts_with_n = False
+        # length of the run of N's at the end of the sequence so far
+        self.n_run = 0
+
+    def add_line(self, line, min_gap_length):
+        if not line:
+            return
+        self.invalid += len(line.translate(None, IUPAC_NUCLEOTIDES))
+        if self.length == 0:
+            self.starts_with_n = line[:1] in b'Nn'
+        for match in N_RUN.finditer(line):
+            run = match.end() - match.start()
+            if match.start() == 0:
+                run += self.n_run
+            elif self.n_run:
+                self.close_run(min_gap_length)
+            self.n_count += match.end() - match.start()
+            self.n_run = run
+            if match.end() != len(line):
+                self.close_run(min_gap_length)
+        if line[-1:] not in b'Nn' and self.n_run:
+            self.close_run(min_gap_length)
+        self.length += len(line)
+
+    def close_run(self, min_gap_length):
+        if min_gap_length and self.n_run >= min_gap_length:
+            self.gaps += 1
+        self.n_run = 0
+
+    @property
+    def ends_with_n(self):
+        return self.n_run > 0
+
+    def finish(self, min_gap_length):
+        """
+        Counts a gap at the end of the sequence, ends_with_n stays valid.
+        """
+        if min_gap_length and self.n_run >= min_gap_length:
+            self.gaps += 1
+
+
+def read_records(path, min_gap_length):
+    """
+    Streams a (gzipped) FASTA file and yields the statistics of every record.
+
+    Raises:
+        ValueError: If the file is not FASTA, or a corrupt or truncated gzip file.
+    """
+    with open(path, 'rb') as handle:
+        gzipped = handle.read(2) == b'\x1f\x8b'
+    record = None
+    try:
+        with (gzip.open(path, 'rb') if gzipped else open(path, 'rb')) as fasta:
+            for line in fasta:
+                line = line.strip()
+                if line.startswith(b'>'):
+                    if record is not None:
+                        record.finish(min_gap_length)
+                        yield record
+                    record = RecordStatistics(line[1:].decode(errors='replace'))
+                elif record is not None:
+                    record.add_line(line, min_gap_length)
+                elif line:
+                    raise ValueError('not a FASTA file: the first line is not a header')
+    except (EOFError, gzip.BadGzipFile, zlib.error) as error:
+        raise ValueError(f'corrupt or truncated gzip file: {error}')
+    if record is not None:
+        record.finish(min_gap_length)
+        yield record
+
+
+def validate_fasta(path, rules):
+    """
+    Checks one FASTA file against the rules of validation_rules.
+
+    Returns:
+        dict: The file, status ('ok', 'warning' or 'failed'), number of records, total length, N fraction, number
+        of gaps and the messages of the failed checks and warnings.
+    """
+    errors = []
+    warnings = []
+    records = length = n_count = gaps = 0
+    try:
+        for record in read_records(path, rules['min_gap_length']):
+            records += 1
+            length += record.length
+            n_count += record.n_count
+            gaps += record.gaps
+            name = record.header.split(maxsplit=1)[0] if record.header.strip() else f'record {records}'
+            if record.length == 0:
+                errors.append(f'{name} is empty')
+                continue
+            if record.length < rules['min_length']:
+                errors.append(f'{name} is shorter than {rules["min_length"]} bases ({record.length})')
+            if record.invalid:
+                errors.append(f'{name} has {record.invalid} invalid nucleotide character(s)')
+            if record.n_count == record.length:
+                errors.append(f'{name} only contains N')
+            elif record.n_count > rules['max_n_fraction'] * record.length:
+                errors.append(f'{name} has {record.n_count / record.length:.1%} N, more than '
+                              f'{rules["max_n_fraction"]:.0%}')
+            elif record.starts_with_n or record.ends_with_n:
+                warnings.append(f'{name} starts or ends with N')
+    except (OSError, ValueError) as error:
+        errors.append(str(error))
+    if not errors and records == 0:
+        errors.append('no FASTA records')
+    if rules['max_records'] is not None and records > rules['max_records']:
+        errors.append(f'{records} records, at most {rules["max_records"]} allowed for the assembly type')
+    return {
+        'file': path,
+        'status': 'failed' if errors else 'warning' if warnings else 'ok',
+        'records': records,
+        'length': length,
+        'n_fraction': round(n_count / length, 4) if length else 0.0,
+        'gaps': gaps,
+        'messages': '; '.join(errors + warnings),
+    }
+
+
+def validate_all(paths, rules, workers=1):
+    """
+    Validates the FASTA files with a pool of worker processes, the results are returned in input order.
+    """
+    if workers <= 1 or len(paths) <= 1:
+        return [validate_fasta(path, rules) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(validate_fasta, paths, [rules] * len(paths), chunksize=8))
+
+
+def write_report(report_path, samples, results):
+    with open(report_path, 'w') as report:
+        report.write('\t'.join(REPORT_COLUMNS) + '\n')
+        for sample_alias, result in zip(samples, results):
+            result = dict(result, sample=sample_alias, file=os.path.basename(result['file']))
+            report.write('\t'.join(str(result[column]).replace('\t', ' ') for column in REPORT_COLUMNS) + '\n')
@@ -0,0 +1,328 @@
+import json
+import os
+import re
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+
+from Calculate_protein_properties import PH_VALUES, AMINO_ACIDS, calculate_properties_batch
+from Sequence_functions import normalize_sequence, check_protein_sequence, read_fasta
+from Profile_functions import ProfileWriter, sliding_window_profile
+from Report_functions import SummaryReport
+
+# Columns of the combined results table, the net charge columns are appended per pH value
+TSV_COLUMNS = ['name', 'length', 'monoisotopic_mass', 'average_mass', 'formula', 'most_abundant_mass',
+               'extinction_coefficient_cystines', 'extinction_coefficient_reduced', 'absorbance_mono_cystines',
+               'absorbance_avg_cystines', 'absorbance_mono_reduced', 'absorbance_avg_reduced', 'pI', 'dn_dc_value']
+# Integer block with the count of every amino acid, after the net charge columns
+COMPOSITION_COLUMNS = [f'count_{amino_acid}' for amino_acid in AMINO_ACIDS]
+
+# Formats of the results table and the number of rows written at once
+OUTPUT_FORMATS = ['tsv', 'json', 'parquet']
+RECORD_BATCH_SIZE = 1024
+
+
+def get_worker_count():
+    """
+    Returns the number of worker processes to use, taken from the GALAXY_SLOTS environment variable.
+    """
+    try:
+        return max(1, int(os.environ.get('GALAXY_SLOTS', 1)))
+    except ValueError:
+        return 1
+
+
+def report_file_name(record, name):
+    """
+    Turns the index of a record and its FASTA header into a safe, unique file name for a per-protein report.
+
+    The record index prefix keeps records with the same first header token, or headers that only differ after
+    sanitizing or truncating, from overwriting each other's reports.
+    """
+    name = re.sub(r'[^A-Za-z0-9_.-]+', '_', name.split()[0] if name.strip() else 'protein')[:100]
+    return f'{record:06d}_{name}'
+
+
+def process_chunk(records, pH_values=PH_VALUES, report_writer=None, reports_dir=None, cache=None,
+                  profile_options=None, first_record=0):
+    """
+    Validates and calculates the properties of a chunk of FASTA records.
+
+    The properties of all valid records in the chunk are calculated together, see calculate_properties_batch.
+
+    Args:
+        records (list): (name, sequence) tuples with the FASTA header and raw sequence of each record.
+        pH_values (list): The pH values at which the net charge is reported.
+        report_writer (callable): Optional function writing a report, called as
+            report_writer(name, sequence, properties, path_prefix).
+        reports_dir (str): Directory in which the per-protein reports are written.
+        cache (ResultCache): Optional result cache, only sequences missing from the cache are calculated.
+        profile_options (dict): Optional window, step and pH of the sliding window profiles.
+        first_record (int): Index of the first record of the chunk in the input, used in the report file names.
+
+    Returns:
+        list: Per record a dict with the name, the calculated properties and an error message (None if the
+        sequence is valid). With profile_options, valid records also get their sliding window profile.
+    """
+    results = []
+    valid = []
+    for name, sequence in records:
+        sequence = normalize_sequence(sequence.upper())
+        error_message = check_protein_sequence(sequence)
+        results.append({'name': name, 'error': error_message})
+        if not error_message:
+            valid.append((len(results) - 1, sequence))
+
+    properties_list = [None] * len(valid)
+    keys = [cache.key(sequence, pH_values) for _, sequence in valid] if cache else []
+    if cache:
+        properties_list = [cache.get_properties(key) for key in keys]
+    missing = [i for i, properties in enumerate(properties_list) if properties is None]
+    calculated = calculate_properties_batch([valid[i][1] for i in missing], pH_values)
+    for i, properties in zip(missing, calculated):
+        properties_list[i] = properties
+        if cache:
+            cache.put_properties(keys[i], properties)
+
+    for (index, sequence), properties in zip(valid, properties_list):
+        result = results[index]
+        profile = None
+        if profile_options:
+            profile = sliding_window_profile(sequence, profile_options['window'], profile_options['step'],
+                                             profile_options['pH'])
+            result['profile'] = profile
+        if report_writer is not None:
+            path_prefix = os.path.join(reports_dir, report_file_name(first_record + index, result['name']))
+            if profile is None:
+                report_writer(result['name'], sequence, properties, path_prefix)
+            else:
+                report_writer(result['name'], sequence, properties, path_prefix, profile=profile)
+        result.update(properties)
+    return results
+
+
+def chunked(iterable, chunk_size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_results(records, workers=1, chunk_size=64, pH_values=PH_VALUES, report_writer=None, reports_dir=None,
+                 cache=None, profile_options=None):
+    """
+    Calculates the properties of all records, spread over a pool of worker processes.
+
+    Records are submitted in chunks and at most two chunks per worker are in flight at any time, so
+    memory use does not depend on the number of records. Results are yielded in input order.
+    """
+    chunks = chunked(records, chunk_size)
+    if workers <= 1:
+        for number, chunk in enumerate(chunks):
+            yield from process_chunk(chunk, pH_values, report_writer, reports_dir, cache, profile_options,
+                                     number * chunk_size)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for number, chunk in enumerate(chunks):
+            pending.append(executor.submit(process_chunk, chunk, pH_values, report_writer, reports_dir, cache,
+                                           profile_options, number * chunk_size))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def write_profiles(results, profile_writer):
+    """
+    Writes the sliding window profile of every result and removes it from the result, so that only one chunk of
+    profiles is held in memory and the results table stays unchanged.
+    """
+    for record, result in enumerate(results):
+        profile = result.pop('profile', None)
+        if profile is not None:
+            profile['record'] = record
+            profile_writer.write(result['name'], profile)
+        yield result
+
+
+def composition_counts(result):
+    """
+    Returns the count of every amino acid of a result, aligned with AMINO_ACIDS.
+    """
+    counts = dict.fromkeys(AMINO_ACIDS, 0)
+    for aa in result['amino_acid_composition']:
+        counts[aa['amino_acid']] = aa['count']
+    return [counts[amino_acid] for amino_acid in AMINO_ACIDS]
+
+
+def table_columns(pH_values=PH_VALUES):
+    return TSV_COLUMNS + [f'net_charge_pH_{pH}' for pH in pH_values] + COMPOSITION_COLUMNS + ['error']
+
+
+def table_row(result, pH_values=PH_VALUES):
+    """
+    Returns the values of one row of the results table, with None for the values of an invalid record.
+    """
+    if result['error']:
+        return [result['name']] + [None] * (len(TSV_COLUMNS) - 1 + len(pH_values) + len(COMPOSITION_COLUMNS)) + \
+            [result['error']]
+    values = {
+        'name': result['name'],
+        'length': result['length'],
+        'monoisotopic_mass': result['monoisotopic_mass'],
+        'average_mass': result['average_mass'],
+        'formula': result['isotopic_envelope']['formula'],
+        'most_abundant_mass': result['isotopic_envelope']['most_abundant_mass'],
+        'pI': result['pI'],
+        'dn_dc_value': result['dn_dc_value'],
+        **result['molar_absorbance_info']
+    }
+    charges = [nc['net_charge'] for nc in result['net_charge_at_different_pH']]
+    return [values[column] for column in TSV_COLUMNS] + charges + composition_counts(result) + [None]
+
+
+def add_to_summary(results, summary, reports_dir=None):
+    """
+    Adds every result to the summary report while passing it on, linking to its report when reports are written.
+    """
+    for record, result in enumerate(results):
+        summary.add(result, report_file_name(record, result['name']) if reports_dir and not result['error'] else None)
+        yield result
+
+
+def tsv_row(result, pH_values=PH_VALUES):
+    row = table_row(result, pH_values)
+    if not result['error']:
+        row[2] = f"{row[2]:.2f}"
+        row[3] = f"{row[3]:.2f}"
+        row[5] = f"{row[5]:.2f}"
+    return ['' if value is None else value for value in row]
+
+
+class TsvTableWriter:
+    def __init__(self, output_path, pH_values=PH_VALUES):
+        self.pH_values = pH_values
+        self.out = open(output_path, 'w')
+        self.out.write('\t'.join(table_columns(pH_values)) + '\n')
+
+    def write_batch(self, results):
+        lines = []
+        for result in results:
+            # the error message may span lines, keep one row per record
+            row = [str(value).replace('\n', ' ').replace('\t', ' ') for value in tsv_row(result, self.pH_values)]
+            lines.append('\t'.join(row) + '\n')
+        self.out.write(''.join(lines))
+
+    def close(self):
+        self.out.close()
+
+
+class JsonTableWriter:
+    def __init__(self, output_path, pH_values=PH_VALUES):
+        self.out = open(output_path, 'w')
+        self.out.write('[')
+        self.first = True
+
+    def write_batch(self, results):
+        for result in results:
+            self.out.write(('\n' if self.first else ',\n') + json.dumps(result))
+            self.first = False
+
+    def close(self):
+        self.out.write('\n]\n')
+        self.out.close()
+
+
+class ParquetTableWriter:
+    """
+    Writes the results table to a Parquet file, one row group per record batch. Needs the optional pyarrow package.
+    """
+
+    def __init__(self, output_path, pH_values=PH_VALUES):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.pH_values = pH_values
+        types = {'name': pa.string(), 'length': pa.int64(), 'formula': pa.string(),
+                 'extinction_coefficient_cystines': pa.int64(), 'extinction_coefficient_reduced': pa.int64(),
+                 'error': pa.string()}
+        types.update((column, pa.int32()) for column in COMPOSITION_COLUMNS)
+        self.schema = pa.schema([(column, types.get(column, pa.float64())) for column in table_columns(pH_values)])
+        self.writer = pq.ParquetWriter(output_path, self.schema)
+
+    def write_batch(self, results):
+        columns = list(zip(*(table_row(result, self.pH_values) for result in results)))
+        arrays = [self.pa.array(values, type=field.type) for values, field in zip(columns, self.schema)]
+        self.writer.write_batch(self.pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+TABLE_WRITERS = {'tsv': TsvTableWriter, 'json': JsonTableWriter, 'parquet': ParquetTableWriter}
+
+
+def write_results(results, output_path, output_format='tsv', pH_values=PH_VALUES, batch_size=RECORD_BATCH_SIZE):
+    """
+    Streams the results to one combined TSV, JSON or Parquet table.
+
+    Results are written in record batches of batch_size rows, so memory use does not depend on the number of
+    results.
+
+    Returns:
+        tuple: The number of processed records and the number of records that failed validation.
+    """
+    total = failed = 0
+    writer = TABLE_WRITERS[output_format](output_path, pH_values)
+    try:
+        for batch in chunked(results, batch_size):
+            writer.write_batch(batch)
+            total += len(batch)
+            failed += sum(1 for result in batch if result['error'])
+    finally:
+        writer.close()
+    return total, failed
+
+
+def run_batch(fasta_path, output_path, output_format='tsv', reports_dir=None, workers=1, report_writer=None,
+              pH_values=PH_VALUES, cache=None, profile_options=None, summary_path=None):
+    """
+    Calculates the properties of every record in a (gzipped) multi-FASTA file.
+
+    Args:
+        fasta_path (str): Path to the FASTA file.
+        output_path (str): Path of the combined results table.
+        output_format (str): One of OUTPUT_FORMATS.
+        reports_dir (str): Directory for the per-protein reports, or None to skip them.
+        workers (int): Number of worker processes.
+        report_writer (callable): Function writing a per-protein report, required when reports_dir is set.
+        pH_values (list): The pH values at which the net charge is reported.
+        cache (ResultCache): Optional cache of calculated properties.
+        profile_options (dict): The window, step, pH, format and path of the sliding window profiles of all
+            records, or None to skip them.
+        summary_path (str): Path of the paginated HTML summary report, or None to skip it.
+    """
+    if reports_dir:
+        os.makedirs(reports_dir, exist_ok=True)
+    else:
+        report_writer = None
+
+    results = iter_results(read_fasta(fasta_path), workers=workers, pH_values=pH_values,
+                           report_writer=report_writer, reports_dir=reports_dir, cache=cache,
+                           profile_options=profile_options)
+    with ExitStack() as outputs:
+        if profile_options:
+            profile_writer = outputs.enter_context(ProfileWriter(profile_options['path'], profile_options['format']))
+            results = write_profiles(results, profile_writer)
+        if summary_path:
+            summary = outputs.enter_context(SummaryReport(summary_path, reports_dir))
+            results = add_to_summary(results, summary, reports_dir)
+        total, failed = write_results(results, output_path, output_format, pH_values)
+    print(f"Processed {total} sequences ({failed} invalid) and saved the results to {output_path}.")
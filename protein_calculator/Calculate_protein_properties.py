@@ -1,80 +1,226 @@
-from references import amino_acid_data,charges
-from Bio.SeqUtils import IsoelectricPoint
-from Bio.Seq import Seq
+import numpy as np
+from references import amino_acid_data, residue_formulas
+from Isotope_functions import ELEMENTS, isotopic_envelopes
+from Titration_functions import ph_grid, ionizable_groups, net_charges, isoelectric_points
 
-def calculate_total_masses(amino_acid, count):
+# Default pH values at which the net charge is reported
+PH_VALUES = ph_grid(step=0.5)
+
+# Masses of the water molecule added to the sum of the residue masses. The monoisotopic mass uses the monoisotopic
+# water mass, so it is the mass of the lightest peak of the isotopic envelope.
+MONOISOTOPIC_WATER_MASS = 18.010565
+AVERAGE_WATER_MASS = 18.01528
+
+# Column order of the composition matrix: one column per amino acid in references.amino_acid_data
+AMINO_ACIDS = sorted(amino_acid_data)
+
+# Lookup table mapping every byte to its column in the composition matrix. Unknown bytes map to an
+# extra column that is dropped after counting.
+RESIDUE_INDEX = np.full(256, len(AMINO_ACIDS), dtype=np.intp)
+for _column, _amino_acid in enumerate(AMINO_ACIDS):
+    RESIDUE_INDEX[ord(_amino_acid)] = _column
+    RESIDUE_INDEX[ord(_amino_acid.lower())] = _column
+
+# Per-residue property vectors, aligned with AMINO_ACIDS
+MONOISOTOPIC_MASSES = np.array([amino_acid_data[aa]['Monoisotopic Weight (Da)'] for aa in AMINO_ACIDS])
+AVERAGE_MASSES = np.array([amino_acid_data[aa]['Average Weight (Da)'] for aa in AMINO_ACIDS])
+EXTINCTION_COEFFICIENTS = np.array([amino_acid_data[aa].get('Extinction Coefficient', 0) for aa in AMINO_ACIDS],
+                                   dtype=np.int64)
+DN_DC_VALUES = np.array([amino_acid_data[aa].get('dn/dc', 0) for aa in AMINO_ACIDS])
+CYSTEINE = AMINO_ACIDS.index('C')
+# Element counts of every residue and of the water molecule of the termini, columns aligned with ELEMENTS
+ELEMENT_COUNTS = np.array([[residue_formulas[aa].get(element, 0) for element in ELEMENTS] for aa in AMINO_ACIDS],
+                          dtype=np.int64)
+WATER_ELEMENTS = np.array([{'H': 2, 'O': 1}.get(element, 0) for element in ELEMENTS], dtype=np.int64)
+
+
+def residue_codes(sequence):
     """
-    Calculates the total monoisotopic and average masses for the given amino acid and count.
+    Maps a sequence to its column indices in the composition matrix.
 
     Args:
-        amino_acid (str): The amino acid letter.
-        count (int): The number of occurrences of the amino acid in the text.
+        sequence (str or bytes): The amino acid sequence.
+
+    Returns:
+        numpy.ndarray: One column index per residue, unknown residues get index len(AMINO_ACIDS).
+    """
+    if isinstance(sequence, str):
+        sequence = sequence.encode('ascii', errors='replace')
+    return RESIDUE_INDEX[np.frombuffer(sequence, dtype=np.uint8)]
+
+
+def composition_vector(sequence):
+    """
+    Counts every amino acid of the sequence with a single bincount.
 
     Returns:
-        tuple: A tuple containing the total monoisotopic mass and the total average mass.
+        numpy.ndarray: The counts, aligned with AMINO_ACIDS.
     """
-    data = amino_acid_data.get(amino_acid)
-    if data:
-        total_monoisotopic_mass = data['Monoisotopic Weight (Da)'] * count
-        total_average_mass = data['Average Weight (Da)'] * count
-        return total_monoisotopic_mass, total_average_mass
-    else:
-        return 0, 0
+    return np.bincount(residue_codes(sequence), minlength=len(AMINO_ACIDS) + 1)[:len(AMINO_ACIDS)]
 
 
-def calculate_extinction_coefficient(amino_acid, count, all_cysteines_form_cystines):
+def composition_matrix(sequences):
     """
-    Calculates the extinction coefficient for the given amino acid and count.
+    Builds the (n_sequences x n_amino_acids) composition matrix of a list of sequences.
+
+    All sequences are counted with one bincount over the concatenated residue codes, offset per sequence.
+    """
+    width = len(AMINO_ACIDS) + 1
+    if not sequences:
+        return np.zeros((0, len(AMINO_ACIDS)), dtype=np.int64)
+    encoded = [sequence.encode('ascii', errors='replace') if isinstance(sequence, str) else sequence
+               for sequence in sequences]
+    lengths = np.fromiter((len(sequence) for sequence in encoded), dtype=np.intp, count=len(encoded))
+    codes = RESIDUE_INDEX[np.frombuffer(b''.join(encoded), dtype=np.uint8)]
+    codes += np.repeat(np.arange(len(encoded), dtype=np.intp) * width, lengths)
+    counts = np.bincount(codes, minlength=len(encoded) * width).reshape(len(encoded), width)
+    return counts[:, :len(AMINO_ACIDS)].astype(np.int64)
+
+
+def calculate_bulk_properties(compositions):
+    """
+    Calculates the masses, extinction coefficients and dn/dc of many sequences at once.
 
     Args:
-        amino_acid (str): The amino acid letter.
-        count (int): The number of occurrences of the amino acid in the text.
-        all_cysteines_form_cystines (bool): If True, all cysteine residues appear as half cystines.
+        compositions (numpy.ndarray): The (n_sequences x n_amino_acids) composition matrix.
 
     Returns:
-        float: The extinction coefficient.
-    """
-    data = amino_acid_data.get(amino_acid)
-    if data and "Extinction Coefficient" in data:
-        if amino_acid == "C":
-            if all_cysteines_form_cystines:
-                return data["Extinction Coefficient"] * (count // 2)  # Half of the cysteines form cystines
-            else:
-                return 0  # All cysteines are reduced
-        else:
-            return data["Extinction Coefficient"] * count
-    else:
-        return 0
+        dict: Arrays of length n_sequences with the length, monoisotopic and average masses, the extinction
+        coefficients assuming all cysteines form cystines or are reduced and the dn/dc value.
+    """
+    lengths = compositions.sum(axis=1)
+    extinction_coefficient_reduced = compositions @ EXTINCTION_COEFFICIENTS - \
+        compositions[:, CYSTEINE] * EXTINCTION_COEFFICIENTS[CYSTEINE]
+    # Half of the cysteines form cystines
+    extinction_coefficient_cystines = extinction_coefficient_reduced + \
+        (compositions[:, CYSTEINE] // 2) * EXTINCTION_COEFFICIENTS[CYSTEINE]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dn_dc = np.where(lengths > 0, (compositions @ DN_DC_VALUES) / lengths, 0.0)
+    return {
+        'length': lengths,
+        'monoisotopic_mass': compositions @ MONOISOTOPIC_MASSES + MONOISOTOPIC_WATER_MASS,
+        'average_mass': compositions @ AVERAGE_MASSES + AVERAGE_WATER_MASS,
+        'extinction_coefficient_cystines': extinction_coefficient_cystines,
+        'extinction_coefficient_reduced': extinction_coefficient_reduced,
+        'dn_dc': dn_dc
+    }
+
+
+def elemental_compositions(compositions):
+    """
+    Returns the (n_sequences x n_elements) element counts of the sequences from their composition matrix.
+    """
+    return compositions @ ELEMENT_COUNTS + WATER_ELEMENTS
+
 
 # Function to calculate pI
 def get_isoelectric_point(sequence):
-    seq = Seq(sequence)
-    pI = IsoelectricPoint.IsoelectricPoint(seq).pi()
-    return pI
+    counts, pK_values = ionizable_groups([sequence], composition_vector(sequence)[np.newaxis, :], AMINO_ACIDS)
+    return float(isoelectric_points(counts, pK_values)[0])
 
 # Function to calculate net charge for different pH
-def get_net_charge(sequence):
-    seq = Seq(sequence)
-    pI = IsoelectricPoint.IsoelectricPoint(seq)
+def get_net_charge(sequence, pH_values=PH_VALUES):
+    counts, pK_values = ionizable_groups([sequence], composition_vector(sequence)[np.newaxis, :], AMINO_ACIDS)
+    charges = net_charges(counts, pK_values, pH_values)[0]
+    return {ph: float(charge) for ph, charge in zip(pH_values, charges)}
 
-    ph_values = [i / 2 for i in range(4, 25)]
-    charges = {ph: pI.charge_at_pH(ph) for ph in ph_values}
-
-    return charges
-
-def calculate_dn_dc(sequence, amino_acid_data):
+def calculate_dn_dc(sequence, amino_acid_data=amino_acid_data):
     """
     Calculates the dn/dc for the given amino acid sequence.
 
     Args:
         sequence (str): The amino acid sequence.
-        amino_acid_data (dict): amino acid information.
+        amino_acid_data (dict): amino acid information, kept for backwards compatibility. The values of
+            references.amino_acid_data are used.
 
     Returns:
         float: The calculated dn/dc value.
     """
-    total_dn_dc = 0.0
-    for aa in sequence:
-        if aa in amino_acid_data:
-            total_dn_dc += amino_acid_data[aa].get('dn/dc', 0)  # Fallback to 0 if dn/dc value is not available
-    return total_dn_dc / len(sequence)
+    return float(calculate_bulk_properties(composition_vector(sequence)[np.newaxis, :])['dn_dc'][0])
+
+
+def calculate_properties_batch(sequences, pH_values=PH_VALUES):
+    """
+    Calculates all protein properties reported by the tool for a list of validated sequences.
+
+    The composition based properties are calculated for the whole list with one matrix product, the pI and
+    net charges for the whole list and pH grid at once.
+
+    Args:
+        sequences (list): The normalized and validated protein sequences.
+        pH_values (list): The pH values at which the net charge is reported.
+
+    Returns:
+        list: One dict per sequence with the amino acid composition, masses, molar absorbance info, pI,
+        net charges, dn/dc value and isotopic envelope.
+    """
+    compositions = composition_matrix(sequences)
+    bulk = calculate_bulk_properties(compositions)
+    counts, pK_values = ionizable_groups(sequences, compositions, AMINO_ACIDS)
+    charges = net_charges(counts, pK_values, pH_values)
+    pIs = isoelectric_points(counts, pK_values)
+    envelopes = isotopic_envelopes(elemental_compositions(compositions))
+    results = []
+    for row, sequence in enumerate(sequences):
+        total_count = int(bulk['length'][row])
+        total_monoisotopic_mass = float(bulk['monoisotopic_mass'][row])
+        total_average_mass = float(bulk['average_mass'][row])
+        total_extinction_coefficient_cystines = int(bulk['extinction_coefficient_cystines'][row])
+        total_extinction_coefficient_reduced = int(bulk['extinction_coefficient_reduced'][row])
+
+        amino_acid_composition = []
+        for column in np.flatnonzero(compositions[row]):
+            amino_acid = AMINO_ACIDS[column]
+            count = int(compositions[row, column])
+            data = amino_acid_data[amino_acid]
+            percentage = (count / total_count) * 100
+            amino_acid_composition.append({
+                'amino_acid': amino_acid,
+                'long_name': data.get('Long', ''),
+                'mono_weight': round(data.get('Monoisotopic Weight (Da)', ''), 2),
+                'avg_weight': round(data.get('Average Weight (Da)', ''), 2),
+                'count': count,
+                'percentage': f"{percentage:.2f}%"
+            })
+
+        molar_absorbance_info = {
+            'extinction_coefficient_cystines': total_extinction_coefficient_cystines,
+            'extinction_coefficient_reduced': total_extinction_coefficient_reduced,
+            'absorbance_mono_cystines': round(total_extinction_coefficient_cystines / total_monoisotopic_mass, 4) if total_monoisotopic_mass != 0 else 0,
+            'absorbance_avg_cystines': round(total_extinction_coefficient_cystines / total_average_mass, 4) if total_average_mass != 0 else 0,
+            'absorbance_mono_reduced': round(total_extinction_coefficient_reduced / total_monoisotopic_mass, 4) if total_monoisotopic_mass != 0 else 0,
+            'absorbance_avg_reduced': round(total_extinction_coefficient_reduced / total_average_mass, 4) if total_average_mass != 0 else 0
+        }
+
+        net_charge_at_different_pH = [
+            {'pH': pH, 'net_charge': round(float(net_charge), 2)}
+            for pH, net_charge in zip(pH_values, charges[row])
+        ]
+
+        results.append({
+            'length': total_count,
+            'amino_acid_composition': amino_acid_composition,
+            'monoisotopic_mass': total_monoisotopic_mass,
+            'average_mass': total_average_mass,
+            'molar_absorbance_info': molar_absorbance_info,
+            'pI': round(float(pIs[row]), 2),
+            'net_charge_at_different_pH': net_charge_at_different_pH,
+            'dn_dc_value': round(float(bulk['dn_dc'][row]), 6),
+            'isotopic_envelope': envelopes[row]
+        })
+    return results
+
+
+def calculate_properties(sequence, pH_values=PH_VALUES):
+    """
+    Calculates all protein properties reported by the tool for a single, validated sequence.
+
+    Args:
+        sequence (str): The normalized and validated protein sequence.
+        pH_values (list): The pH values at which the net charge is reported.
+
+    Returns:
+        dict: The amino acid composition, masses, molar absorbance info, pI, net charges, dn/dc value and
+        isotopic envelope.
+    """
+    return calculate_properties_batch([sequence], pH_values)[0]
@@ -0,0 +1,211 @@
+import re
+
+import numpy as np
+from Calculate_protein_properties import (AVERAGE_MASSES, AVERAGE_WATER_MASS, MONOISOTOPIC_MASSES,
+                                         MONOISOTOPIC_WATER_MASS, residue_codes)
+from Profile_functions import NpyWriter
+from Sequence_functions import normalize_sequence, check_protein_sequence
+
+# In-silico digestion: the masses of all peptides of a sequence come from two prefix sums of the residue masses,
+# the mass of the peptide from residue i up to residue j is prefix[j] - prefix[i] plus a water molecule. The cost
+# of a peptide does not depend on its length or on the number of missed cleavages it spans.
+
+# Cleavage rules as regular expressions, a sequence is cleaved after the end of every match. Zero-width rules
+# such as Asp-N's cleave before a residue.
+ENZYMES = {
+    'trypsin': r'[KR](?!P)',
+    'trypsin/p': r'[KR]',
+    'lys-c': r'K(?!P)',
+    'glu-c': r'E(?!P)',
+    'asp-n': r'(?=D)',
+    'chymotrypsin': r'[FWY](?!P)',
+}
+DEFAULT_MISSED_CLEAVAGES = 2
+DEFAULT_MIN_PEPTIDE_LENGTH = 6
+DEFAULT_MAX_PEPTIDE_LENGTH = 50
+# Charge states of the m/z columns
+CHARGE_STATES = (1, 2, 3, 4)
+# Mass of the proton added per charge to the m/z of a peptide, the water masses are those of the whole-protein
+# properties, so protein and peptide masses agree
+PROTON_MASS = 1.007276
+
+# Record layout of a peptide: the index of its protein in the input, the 1-based first and last residue, the
+# number of missed cleavages, the masses and the m/z of the charge states
+PEPTIDE_DTYPE = np.dtype([('record', '<i8'), ('start', '<i8'), ('end', '<i8'), ('missed_cleavages', '<i4'),
+                          ('monoisotopic_mass', '<f8'), ('average_mass', '<f8')] +
+                         [(f'mz_{charge}', '<f8') for charge in CHARGE_STATES])
+DIGEST_FORMATS = ['tsv', 'npy']
+# Peptides formatted at once when writing a TSV table
+TSV_BATCH_SIZE = 100000
+
+# Per-residue masses, the appended 0 is the mass of unknown residues
+MONOISOTOPIC_RESIDUE_MASSES = np.append(MONOISOTOPIC_MASSES, 0.0)
+AVERAGE_RESIDUE_MASSES = np.append(AVERAGE_MASSES, 0.0)
+
+
+def cleavage_rule(enzyme=None, rule=None):
+    """
+    Returns the compiled cleavage rule of an enzyme in ENZYMES, or of a custom regular expression.
+
+    Raises:
+        ValueError: If the enzyme is unknown or the rule is not a valid regular expression.
+    """
+    if rule is None:
+        if enzyme not in ENZYMES:
+            raise ValueError(f"Unknown enzyme: {enzyme}, choose from {', '.join(ENZYMES)} or give a rule.")
+        rule = ENZYMES[enzyme]
+    try:
+        return re.compile(rule)
+    except re.error as error:
+        raise ValueError(f"Invalid cleavage rule {rule!r}: {error}")
+
+
+def cleavage_sites(sequence, rule):
+    """
+    Returns the 0-based cleavage sites of a sequence, including its start and end.
+    """
+    sites = {match.end() for match in rule.finditer(sequence.upper())}
+    return np.array(sorted(sites | {0, len(sequence)}), dtype=np.int64)
+
+
+def mass_prefix_sums(sequence):
+    """
+    Returns the prefix sums of the monoisotopic and average residue masses, prefix[i] is the mass of the first i
+    residues.
+    """
+    codes = residue_codes(sequence)
+    monoisotopic = np.zeros(len(codes) + 1)
+    np.cumsum(MONOISOTOPIC_RESIDUE_MASSES[codes], out=monoisotopic[1:])
+    average = np.zeros(len(codes) + 1)
+    np.cumsum(AVERAGE_RESIDUE_MASSES[codes], out=average[1:])
+    return monoisotopic, average
+
+
+def digest(sequence, rule, missed_cleavages=DEFAULT_MISSED_CLEAVAGES, min_length=DEFAULT_MIN_PEPTIDE_LENGTH,
+           max_length=DEFAULT_MAX_PEPTIDE_LENGTH, record=0):
+    """
+    Digests a sequence in silico and calculates the masses and m/z of its peptides.
+
+    Args:
+        sequence (str): The validated protein sequence.
+        rule (re.Pattern): The cleavage rule, see cleavage_rule.
+        missed_cleavages (int): Maximum number of cleavage sites within a peptide.
+        min_length (int): Minimum number of residues of a peptide.
+        max_length (int): Maximum number of residues of a peptide, or None for no maximum.
+        record (int): Index of the sequence, stored in the record field.
+
+    Returns:
+        numpy.ndarray: One PEPTIDE_DTYPE record per peptide, ordered by start and end.
+    """
+    sites = cleavage_sites(sequence, rule)
+    monoisotopic, average = mass_prefix_sums(sequence)
+    starts, ends, missed = [], [], []
+    # a peptide with m missed cleavages runs from site i to site i + m + 1
+    for m in range(min(missed_cleavages, len(sites) - 2) + 1):
+        starts.append(sites[:len(sites) - 1 - m])
+        ends.append(sites[1 + m:])
+        missed.append(np.full(len(sites) - 1 - m, m, dtype=np.int32))
+    starts, ends, missed = np.concatenate(starts), np.concatenate(ends), np.concatenate(missed)
+    lengths = ends - starts
+    keep = lengths >= min_length
+    if max_length is not None:
+        keep &= lengths <= max_length
+    starts, ends, missed = starts[keep], ends[keep], missed[keep]
+    order = np.lexsort((ends, starts))
+    starts, ends, missed = starts[order], ends[order], missed[order]
+
+    peptides = np.empty(len(starts), dtype=PEPTIDE_DTYPE)
+    peptides['record'] = record
+    peptides['start'] = starts + 1
+    peptides['end'] = ends
+    peptides['missed_cleavages'] = missed
+    peptides['monoisotopic_mass'] = monoisotopic[ends] - monoisotopic[starts] + MONOISOTOPIC_WATER_MASS
+    peptides['average_mass'] = average[ends] - average[starts] + AVERAGE_WATER_MASS
+    for charge in CHARGE_STATES:
+        peptides[f'mz_{charge}'] = (peptides['monoisotopic_mass'] + charge * PROTON_MASS) / charge
+    return peptides
+
+
+class DigestWriter:
+    """
+    Streams the peptides of one or more sequences to a TSV table or a .npy array.
+
+    The TSV table has the name of the protein and the sequence of every peptide, the .npy array stores the index
+    of the protein in the record field.
+
+    Args:
+        path (str): Path of the output file.
+        output_format (str): One of DIGEST_FORMATS.
+    """
+
+    def __init__(self, path, output_format='tsv'):
+        if output_format not in DIGEST_FORMATS:
+            raise ValueError(f"Unknown digest format: {output_format}")
+        self.output_format = output_format
+        if output_format == 'npy':
+            self.writer = NpyWriter(path, PEPTIDE_DTYPE)
+        else:
+            self.writer = open(path, 'w')
+            self.writer.write('\t'.join(['name', 'peptide'] + list(PEPTIDE_DTYPE.names[1:])) + '\n')
+
+    def write(self, name, sequence, peptides):
+        if self.output_format == 'npy':
+            self.writer.write(peptides)
+            return
+        prefix = name.replace('\t', ' ').replace('\n', ' ') + '\t'
+        row_format = '%s\t%d\t%d\t%d\t%.5f\t%.4f' + '\t%.5f' * len(CHARGE_STATES)
+        for start in range(0, len(peptides), TSV_BATCH_SIZE):
+            batch = peptides[start:start + TSV_BATCH_SIZE]
+            columns = [batch[column].tolist() for column in PEPTIDE_DTYPE.names[1:]]
+            sequences = [sequence[first - 1:last] for first, last in zip(columns[0], columns[1])]
+            rows = map(row_format.__mod__, zip(sequences, *columns))
+            self.writer.write(prefix + ('\n' + prefix).join(rows) + '\n')
+
+    def close(self):
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def digest_records(records, rule, missed_cleavages=DEFAULT_MISSED_CLEAVAGES, min_length=DEFAULT_MIN_PEPTIDE_LENGTH,
+                   max_length=DEFAULT_MAX_PEPTIDE_LENGTH):
+    """
+    Validates and digests a stream of (name, sequence) FASTA records one at a time, invalid records are skipped.
+
+    Yields:
+        tuple: The name, normalized sequence and peptides of every valid record. The record field of the peptides
+        is the index of the record in the input, which is its row in the results table.
+    """
+    for record, (name, sequence) in enumerate(records):
+        sequence = normalize_sequence(sequence.upper())
+        if check_protein_sequence(sequence):
+            continue
+        yield name, sequence, digest(sequence, rule, missed_cleavages, min_length, max_length, record)
+
+
+def write_digest(records, digest_options):
+    """
+    Digests the (name, sequence) records and streams their peptides to the digest output, holding the peptides of
+    one protein at a time.
+
+    Args:
+        records (iterable): (name, sequence) tuples, e.g. from Sequence_functions.read_fasta.
+        digest_options (dict): The compiled rule, missed cleavages, minimum and maximum peptide length, format and
+            path of the digest.
+
+    Returns:
+        tuple: The number of digested proteins and of peptides.
+    """
+    proteins = peptides = 0
+    with DigestWriter(digest_options['path'], digest_options['format']) as writer:
+        for name, sequence, digested in digest_records(records, digest_options['rule'],
+                                                       digest_options['missed_cleavages'],
+                                                       digest_options['min_length'], digest_options['max_length']):
+            writer.write(name, sequence, digested)
+            proteins += 1
+            peptides += len(digested)
+    return proteins, peptides
@@ -0,0 +1,157 @@
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+from references import isotopes
+
+# Isotopic envelopes are calculated in the Fourier domain. The isotope distribution of one atom of an element is a
+# polynomial in the number of extra neutrons, the distribution of a molecule is the product of these polynomials
+# raised to the number of atoms. After a Fourier transform the product is a pointwise product, computed for all
+# elements at once as exp(counts @ log(transforms)), so an envelope costs a few operations per point whatever the
+# number of atoms. The mean mass of every aggregated peak comes from the transform of the mass-weighted
+# distribution, the derivative of the product: P * sum(counts * Q / P_element).
+
+# Column order of the element counts, the order of the Hill notation
+ELEMENTS = ['C', 'H', 'N', 'O', 'S', 'Se']
+# Peaks below this fraction of the most abundant peak are pruned from an envelope
+DEFAULT_THRESHOLD = 0.001
+# Number of envelopes kept in memory, repeated compositions are not calculated again
+ENVELOPE_CACHE_SIZE = 4096
+# Points of the envelope beyond its mean, in standard deviations; the abundance outside is below double precision
+TAIL_DEVIATIONS = 12
+# Points of the envelopes calculated at once, larger groups of molecules are split to bound the memory use
+CHUNK_POINTS = 2 ** 18
+
+# Per element, the mass of its lightest isotope and the extra neutrons, abundances and mass defects of its isotopes
+# relative to it
+LIGHTEST_MASSES = np.array([isotopes[element][0][0] for element in ELEMENTS])
+_OFFSETS = [np.array([round(mass - isotopes[element][0][0]) for mass, _ in isotopes[element]]) for element in ELEMENTS]
+_ABUNDANCES = [np.array([abundance for _, abundance in isotopes[element]]) for element in ELEMENTS]
+_DEFECTS = [np.array([mass for mass, _ in isotopes[element]]) - isotopes[element][0][0] - offsets
+            for element, offsets in zip(ELEMENTS, _OFFSETS)]
+MAX_OFFSETS = np.array([offsets[-1] for offsets in _OFFSETS])
+MEAN_OFFSETS = np.array([offsets @ abundances for offsets, abundances in zip(_OFFSETS, _ABUNDANCES)])
+OFFSET_VARIANCES = np.array([(offsets - mean) ** 2 @ abundances
+                             for offsets, abundances, mean in zip(_OFFSETS, _ABUNDANCES, MEAN_OFFSETS)])
+
+_envelope_cache = OrderedDict()
+
+
+def format_formula(counts):
+    """
+    Returns the elemental formula in Hill notation, e.g. C63H98N18O13S, from counts aligned with ELEMENTS.
+    """
+    return ''.join(f"{element}{count if count > 1 else ''}" for element, count in zip(ELEMENTS, counts) if count)
+
+
+@lru_cache(maxsize=None)
+def _transforms(length):
+    """
+    Returns the logarithm of the Fourier transform of the isotope distribution of every element, and the
+    transform of its mass-weighted distribution divided by it, for envelopes of length points.
+    """
+    distributions = np.zeros((len(ELEMENTS), length))
+    weighted = np.zeros((len(ELEMENTS), length))
+    for row, (offsets, abundances, defects) in enumerate(zip(_OFFSETS, _ABUNDANCES, _DEFECTS)):
+        distributions[row, offsets] = abundances
+        weighted[row, offsets] = abundances * defects
+    transforms = np.fft.rfft(distributions, axis=1)
+    # no transform has a zero on the unit circle, the smallest magnitude is 0.2 (selenium)
+    return np.log(transforms), np.fft.rfft(weighted, axis=1) / transforms
+
+
+def _complex_exp(values):
+    # numpy's complex exp is several times slower than the real exp, cos and sin of the two parts
+    magnitudes = np.exp(values.real)
+    return magnitudes * np.cos(values.imag) + 1j * (magnitudes * np.sin(values.imag))
+
+
+def envelope_length(counts):
+    """
+    Returns the number of points of the envelopes of the element counts, a power of two covering the mean number
+    of extra neutrons plus TAIL_DEVIATIONS standard deviations.
+    """
+    mean = counts @ MEAN_OFFSETS
+    deviation = np.sqrt(counts @ OFFSET_VARIANCES)
+    needed = np.minimum(counts @ MAX_OFFSETS, np.ceil(mean + TAIL_DEVIATIONS * deviation) + 8) + 1
+    return np.maximum(2 ** np.ceil(np.log2(needed)), 16).astype(np.int64)
+
+
+def calculate_envelopes(counts, threshold=DEFAULT_THRESHOLD):
+    """
+    Calculates the isotopic envelopes of molecules from their element counts.
+
+    Envelopes are aggregated per number of extra neutrons, the mass of a peak is the abundance-weighted mean mass
+    of the isotopic species it contains. Molecules are grouped by envelope length, every group is calculated with
+    one matrix product and one inverse FFT.
+
+    Args:
+        counts (numpy.ndarray): The (n_molecules x n_elements) element counts, aligned with ELEMENTS.
+        threshold (float): Peaks below this fraction of the most abundant peak are pruned.
+
+    Returns:
+        list: Per molecule a dict with its formula, the mass of the most abundant peak and the masses of the
+        peaks with their abundances in % of the most abundant peak.
+    """
+    counts = np.asarray(counts, dtype=np.int64).reshape(-1, len(ELEMENTS))
+    envelopes = [None] * len(counts)
+    lengths = envelope_length(counts)
+    for length in np.unique(lengths).tolist():
+        log_transforms, weighted_ratios = _transforms(length)
+        group_rows = np.flatnonzero(lengths == length)
+        chunk_size = max(1, CHUNK_POINTS // length)
+        for first in range(0, len(group_rows), chunk_size):
+            rows = group_rows[first:first + chunk_size]
+            group = counts[rows].astype(np.float64)
+            transforms = _complex_exp(group @ log_transforms)
+            probabilities = np.fft.irfft(transforms, n=length, axis=1)
+            defects = np.fft.irfft(transforms * (group @ weighted_ratios), n=length, axis=1)
+            maxima = probabilities.max(axis=1, keepdims=True)
+            keep = probabilities >= threshold * maxima
+            masses = (group @ LIGHTEST_MASSES)[:, np.newaxis] + np.arange(length) + \
+                np.divide(defects, probabilities, out=np.zeros_like(defects), where=keep)
+            masses = np.round(masses, 5)
+            most_abundant = masses[np.arange(len(rows)), probabilities.argmax(axis=1)].tolist()
+            # the kept peaks of all molecules of the chunk, split per molecule
+            peak_masses = masses[keep].tolist()
+            peak_abundances = np.round(probabilities / maxima * 100, 3)[keep].tolist()
+            ends = np.cumsum(keep.sum(axis=1)).tolist()
+            start = 0
+            for row, end, mass in zip(rows.tolist(), ends, most_abundant):
+                envelopes[row] = {
+                    'formula': format_formula(counts[row].tolist()),
+                    'most_abundant_mass': mass,
+                    'masses': peak_masses[start:end],
+                    'abundances': peak_abundances[start:end]
+                }
+                start = end
+    return envelopes
+
+
+def isotopic_envelopes(counts, threshold=DEFAULT_THRESHOLD):
+    """
+    Returns the isotopic envelopes of molecules from their element counts, see calculate_envelopes.
+
+    Envelopes are cached per elemental composition, so repeated compositions (the same protein in a batch, or
+    sequences that only differ by the order of their residues) are calculated once.
+    """
+    counts = np.asarray(counts, dtype=np.int64).reshape(-1, len(ELEMENTS))
+    envelopes = [None] * len(counts)
+    missing = {}
+    for row, composition in enumerate(counts):
+        key = (threshold, composition.tobytes())
+        envelope = _envelope_cache.get(key)
+        if envelope is None:
+            missing.setdefault(key, []).append(row)
+        else:
+            _envelope_cache.move_to_end(key)
+            envelopes[row] = envelope
+    if missing:
+        calculated = calculate_envelopes(counts[[rows[0] for rows in missing.values()]], threshold)
+        for (key, rows), envelope in zip(missing.items(), calculated):
+            _envelope_cache[key] = envelope
+            for row in rows:
+                envelopes[row] = envelope
+        while len(_envelope_cache) > ENVELOPE_CACHE_SIZE:
+            _envelope_cache.popitem(last=False)
+    return envelopes
@@ -0,0 +1,285 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from Calculate_protein_properties import AVERAGE_WATER_MASS, MONOISOTOPIC_WATER_MASS, residue_codes
+from Digestion_functions import AVERAGE_RESIDUE_MASSES, MONOISOTOPIC_RESIDUE_MASSES, digest
+from Profile_functions import NpyWriter
+from Sequence_functions import normalize_sequence, check_protein_sequence, read_fasta
+
+# Mass index of a proteome: the masses of all proteins, and optionally of their peptides, sorted and stored as
+# .npy arrays that are memory mapped when the index is queried. A query is two binary searches in the sorted
+# masses, so it touches a few pages of the index whatever the size of the proteome.
+
+MASS_TYPES = ['monoisotopic', 'average']
+DEFAULT_TOLERANCE_PPM = 10.0
+# Bumped when the layout of the index files changes, part of the key of every index
+INDEX_FORMAT = 1
+
+# Record layout of an index entry, in the order of the sorted masses: the index of the protein in the FASTA
+# file, the 1-based first and last residue and the number of missed cleavages of a peptide, -1 for a protein
+ENTRY_DTYPE = np.dtype([('record', '<i8'), ('start', '<i8'), ('end', '<i8'), ('missed_cleavages', '<i4')])
+UNSORTED_DTYPE = np.dtype([('mass', '<f8')] + ENTRY_DTYPE.descr)
+PROTEIN_ENTRY = -1
+# Entries copied at once from the unsorted to the sorted arrays
+SORT_CHUNK_SIZE = 1000000
+# Bytes read at once when hashing the FASTA file
+HASH_CHUNK_SIZE = 1024 * 1024
+
+MATCH_COLUMNS = ['query', 'observed_mass', 'name', 'type', 'sequence', 'start', 'end', 'missed_cleavages',
+                 'mass', 'error_ppm']
+
+
+def index_key(fasta_path, mass_type, digest_options=None, version=''):
+    """
+    Returns the key of the index of a FASTA file: a hash of its content, the mass type, the digestion
+    parameters and the tool version, so any change of the proteome or the parameters builds a new index.
+    """
+    digest_hash = hashlib.sha256()
+    with open(fasta_path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(HASH_CHUNK_SIZE), b''):
+            digest_hash.update(chunk)
+    parameters = [str(INDEX_FORMAT), version, mass_type]
+    if digest_options:
+        parameters += [digest_options['rule'].pattern, str(digest_options['missed_cleavages']),
+                       str(digest_options['min_length']), str(digest_options['max_length'])]
+    digest_hash.update('\n'.join(parameters).encode('utf-8'))
+    return digest_hash.hexdigest()
+
+
+def _write_blob(handle, offsets, text):
+    data = text.encode('utf-8')
+    handle.write(data)
+    offsets.append(offsets[-1] + len(data))
+
+
+def build_mass_index(path, records, mass_type='monoisotopic', digest_options=None, meta=None):
+    """
+    Builds the mass index of a stream of (name, sequence) FASTA records in the directory path.
+
+    Every valid record gets an entry with the mass of the whole protein, and with digest_options an entry per
+    peptide. The entries are streamed to disk while the records are read, then sorted by mass. Sorting holds
+    the masses and the sort order in memory, 16 bytes per entry. The index is built in a temporary directory
+    next to path and renamed when complete, so a concurrent job never sees a partial index.
+
+    Args:
+        path (str): Directory of the index, should not exist yet.
+        records (iterable): (name, sequence) tuples, e.g. from Sequence_functions.read_fasta.
+        mass_type (str): One of MASS_TYPES.
+        digest_options (dict): The compiled rule, missed cleavages, minimum and maximum peptide length, or None
+            to index the whole proteins only.
+        meta (dict): Extra information stored in meta.json, e.g. the key of the index.
+
+    Returns:
+        MassIndex: The index.
+    """
+    if mass_type not in MASS_TYPES:
+        raise ValueError(f"Unknown mass type: {mass_type}")
+    residue_masses, water_mass = ((MONOISOTOPIC_RESIDUE_MASSES, MONOISOTOPIC_WATER_MASS)
+                                  if mass_type == 'monoisotopic' else (AVERAGE_RESIDUE_MASSES, AVERAGE_WATER_MASS))
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    build_dir = tempfile.mkdtemp(dir=parent, prefix='.build-')
+    try:
+        name_offsets, sequence_offsets = [0], [0]
+        proteins = 0
+        unsorted_path = os.path.join(build_dir, 'unsorted.npy')
+        with NpyWriter(unsorted_path, UNSORTED_DTYPE) as writer, \
+                open(os.path.join(build_dir, 'names.bin'), 'wb') as names, \
+                open(os.path.join(build_dir, 'sequences.bin'), 'wb') as sequences:
+            for record, (name, sequence) in enumerate(records):
+                sequence = normalize_sequence(sequence.upper())
+                # invalid records are stored without entries, so the record field stays the index in the input
+                _write_blob(names, name_offsets, name)
+                _write_blob(sequences, sequence_offsets, sequence)
+                if check_protein_sequence(sequence):
+                    continue
+                protein = np.array([(residue_masses[residue_codes(sequence)].sum() + water_mass, record, 1,
+                                     len(sequence), PROTEIN_ENTRY)], dtype=UNSORTED_DTYPE)
+                writer.write(protein)
+                proteins += 1
+                if digest_options:
+                    peptides = digest(sequence, digest_options['rule'], digest_options['missed_cleavages'],
+                                      digest_options['min_length'], digest_options['max_length'], record)
+                    entries = np.empty(len(peptides), dtype=UNSORTED_DTYPE)
+                    entries['mass'] = peptides[f'{mass_type}_mass']
+                    for field in ENTRY_DTYPE.names:
+                        entries[field] = peptides[field]
+                    writer.write(entries)
+            count = writer.count
+
+        unsorted = np.load(unsorted_path, mmap_mode='r')
+        order = np.argsort(unsorted['mass'], kind='stable')
+        with NpyWriter(os.path.join(build_dir, 'masses.npy'), '<f8') as masses, \
+                NpyWriter(os.path.join(build_dir, 'entries.npy'), ENTRY_DTYPE) as entries:
+            for start in range(0, count, SORT_CHUNK_SIZE):
+                chunk = unsorted[order[start:start + SORT_CHUNK_SIZE]]
+                masses.write(chunk['mass'])
+                entries.write(chunk[list(ENTRY_DTYPE.names)])
+        del unsorted, order
+        os.remove(unsorted_path)
+        np.save(os.path.join(build_dir, 'name_offsets.npy'), np.array(name_offsets, dtype=np.int64))
+        np.save(os.path.join(build_dir, 'sequence_offsets.npy'), np.array(sequence_offsets, dtype=np.int64))
+
+        meta = dict(meta or {}, format=INDEX_FORMAT, mass_type=mass_type, records=len(name_offsets) - 1,
+                    proteins=proteins, entries=count, peptides=count - proteins)
+        if digest_options:
+            meta['digestion'] = {'rule': digest_options['rule'].pattern,
+                                 'missed_cleavages': digest_options['missed_cleavages'],
+                                 'min_length': digest_options['min_length'],
+                                 'max_length': digest_options['max_length']}
+        # mkdtemp creates the directory for the current user only, the index may be shared between jobs
+        os.chmod(build_dir, 0o755)
+        # meta.json is written last, a directory without it is not a complete index
+        with open(os.path.join(build_dir, 'meta.json'), 'w') as handle:
+            json.dump(meta, handle, indent=2)
+            handle.write('\n')
+        try:
+            os.rename(build_dir, path)
+        except OSError:
+            # another job built the same index in the meantime
+            if not os.path.exists(os.path.join(path, 'meta.json')):
+                raise
+            shutil.rmtree(build_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+    return MassIndex(path)
+
+
+class MassIndex:
+    """
+    Read-only view of a mass index built by build_mass_index, with its arrays memory mapped.
+
+    Args:
+        path (str): Directory of the index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as handle:
+            self.meta = json.load(handle)
+        self.masses = np.load(os.path.join(path, 'masses.npy'), mmap_mode='r')
+        self.entries = np.load(os.path.join(path, 'entries.npy'), mmap_mode='r')
+        self.name_offsets = np.load(os.path.join(path, 'name_offsets.npy'), mmap_mode='r')
+        self.sequence_offsets = np.load(os.path.join(path, 'sequence_offsets.npy'), mmap_mode='r')
+        self.names = self._blob('names.bin')
+        self.sequences = self._blob('sequences.bin')
+
+    def _blob(self, file_name):
+        # plain mmap objects rather than numpy memmaps, slicing them is a cheap bytes copy
+        with open(os.path.join(self.path, file_name), 'rb') as handle:
+            if os.fstat(handle.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.masses)
+
+    def name(self, record):
+        return self.names[self.name_offsets[record]:self.name_offsets[record + 1]].decode('utf-8')
+
+    def sequence(self, record, start=1, end=None):
+        """
+        Returns the residues start to end (1-based, inclusive) of a record, the whole sequence by default.
+        """
+        first = int(self.sequence_offsets[record])
+        last = int(self.sequence_offsets[record + 1]) if end is None else first + end
+        return self.sequences[first + start - 1:last].decode('utf-8')
+
+    def search(self, masses, tolerance_ppm=DEFAULT_TOLERANCE_PPM):
+        """
+        Finds the entries within tolerance_ppm of every mass with two binary searches per mass.
+
+        Returns:
+            tuple: Arrays with the first and one past the last position in the sorted entries per mass.
+        """
+        masses = np.asarray(masses, dtype=np.float64)
+        tolerances = np.abs(masses) * tolerance_ppm * 1e-6
+        return (np.searchsorted(self.masses, masses - tolerances, side='left'),
+                np.searchsorted(self.masses, masses + tolerances, side='right'))
+
+
+def open_mass_index(index_dir, fasta_path, mass_type='monoisotopic', digest_options=None, version=''):
+    """
+    Opens the index of a FASTA file in index_dir, building it first if there is none for this content and
+    these parameters yet.
+
+    Returns:
+        tuple: The MassIndex and whether it was built.
+    """
+    key = index_key(fasta_path, mass_type, digest_options, version)
+    path = os.path.join(index_dir, key)
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        return MassIndex(path), False
+    return build_mass_index(path, read_fasta(fasta_path), mass_type, digest_options,
+                            meta={'key': key, 'version': version}), True
+
+
+def read_query_masses(path):
+    """
+    Reads the observed masses from the first column of a text or tabular file, skipping empty lines, comment
+    lines starting with # and a header line.
+
+    Raises:
+        ValueError: If a line other than the header does not start with a number.
+    """
+    masses = []
+    with open(path) as handle:
+        for line_number, line in enumerate(handle, 1):
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            try:
+                masses.append(float(fields[0]))
+            except ValueError:
+                if masses or line_number > 1:
+                    raise ValueError(f"Line {line_number} of {path} does not start with a mass: {line.strip()}")
+    return np.array(masses, dtype=np.float64)
+
+
+def write_matches(index, masses, path, tolerance_ppm=DEFAULT_TOLERANCE_PPM):
+    """
+    Writes a TSV table with every entry of the index within tolerance_ppm of each observed mass, ordered by
+    query and by absolute error.
+
+    Returns:
+        tuple: The number of masses with at least one match and the number of matches.
+    """
+    lower, upper = index.search(masses, tolerance_ppm)
+    matched = matches = 0
+    with open(path, 'w') as handle:
+        handle.write('\t'.join(MATCH_COLUMNS) + '\n')
+        for query, (observed, first, last) in enumerate(zip(masses.tolist(), lower.tolist(), upper.tolist()), 1):
+            if first == last:
+                continue
+            candidates = np.asarray(index.masses[first:last])
+            errors = (candidates - observed) / observed * 1e6
+            order = np.argsort(np.abs(errors), kind='stable')
+            entries = np.asarray(index.entries[first:last])[order]
+            records = entries['record']
+            # offsets of the names and peptide sequences, gathered for all matches of the query at once
+            name_starts = index.name_offsets[records].tolist()
+            name_ends = index.name_offsets[records + 1].tolist()
+            sequence_starts = (index.sequence_offsets[records] + entries['start'] - 1).tolist()
+            sequence_ends = (index.sequence_offsets[records] + entries['end']).tolist()
+            rows = []
+            for name_start, name_end, sequence_start, sequence_end, start, end, missed, mass, error in zip(
+                    name_starts, name_ends, sequence_starts, sequence_ends, entries['start'].tolist(),
+                    entries['end'].tolist(), entries['missed_cleavages'].tolist(), candidates[order].tolist(),
+                    errors[order].tolist()):
+                name = index.names[name_start:name_end].decode('utf-8').replace('\t', ' ')
+                if missed == PROTEIN_ENTRY:
+                    rows.append(f"{query}\t{observed}\t{name}\tprotein\t\t{start}\t{end}\t\t{mass:.5f}\t{error:.3f}\n")
+                else:
+                    peptide = index.sequences[sequence_start:sequence_end].decode('utf-8')
+                    rows.append(f"{query}\t{observed}\t{name}\tpeptide\t{peptide}\t{start}\t{end}\t{missed}\t"
+                                f"{mass:.5f}\t{error:.3f}\n")
+            handle.writelines(rows)
+            matched += 1
+            matches += len(rows)
+    return matched, matches
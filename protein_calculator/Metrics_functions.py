@@ -0,0 +1,91 @@
+import contextlib
+import json
+import resource
+import sys
+import time
+import tracemalloc
+
+MB = 1024 * 1024
+
+
+class StageMetrics:
+    """
+    Wall time, CPU time and peak memory of the stages of a run, written as a JSON file with --profile.
+
+    The peak memory of a stage is the peak of the memory traced by tracemalloc while it runs, which covers the
+    Python objects and NumPy arrays but not the memory of native libraries such as the plotting backends. The
+    peak RSS of the whole process is reported as well. Stages may be nested, the peak of an enclosing stage
+    includes the peaks of the stages it contains.
+
+    Args:
+        trace_memory (bool): Trace the memory allocations with tracemalloc, which slows Python code down.
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = []
+        # per running stage, the highest peak of the stages nested in it
+        self._peaks = []
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            tracemalloc.reset_peak()
+            self._peaks.append(0)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            record = {'stage': name, 'wall_s': round(time.perf_counter() - wall_start, 6),
+                      'cpu_s': round(time.process_time() - cpu_start, 6)}
+            if self.trace_memory:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                record['start_mb'] = round(current / MB, 3)
+                record['peak_mb'] = round(peak / MB, 3)
+            self.stages.append(record)
+
+    def add(self, name, wall_seconds):
+        """
+        Adds a stage that was timed before the metrics were set up, e.g. the module imports.
+        """
+        self.stages.append({'stage': name, 'wall_s': round(wall_seconds, 6)})
+
+    def write(self, path, **info):
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        metrics = dict(info, total_wall_s=round(time.perf_counter() - self._wall_start, 6),
+                       total_cpu_s=round(time.process_time() - self._cpu_start, 6),
+                       # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+                       peak_rss_mb=round(peak_rss / (MB if sys.platform == 'darwin' else 1024), 1),
+                       stages=self.stages)
+        if self.trace_memory:
+            metrics['traced_peak_mb'] = round(max([0] + [stage.get('peak_mb', 0) for stage in self.stages]), 3)
+        with open(path, 'w') as handle:
+            json.dump(metrics, handle, indent=2)
+            handle.write('\n')
+
+
+class NoMetrics:
+    """
+    Stand-in for StageMetrics when --profile is not given, its stages cost a method call.
+    """
+
+    _stage = contextlib.nullcontext()
+
+    def stage(self, name):
+        return self._stage
+
+    def add(self, name, wall_seconds):
+        pass
+
+
+NO_METRICS = NoMetrics()
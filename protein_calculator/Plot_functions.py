@@ -0,0 +1,153 @@
+import io
+import math
+from xml.sax.saxutils import escape
+
+# Backends that can render the static titration curve image, with the format of the image they produce
+PLOT_BACKENDS = {'matplotlib': 'png', 'svg': 'svg'}
+
+# MIME type of every image format, used to embed the image in the report
+IMAGE_MIME_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# Style of the titration curve, matching the Plotly figure
+LINE_COLOR = '#3ABBBA'
+BACKGROUND_COLOR = '#E5ECF6'
+TEXT_COLOR = '#2A3F5F'
+WIDTH = 700
+HEIGHT = 500
+
+
+def nice_ticks(low, high, max_ticks=8):
+    """
+    Returns evenly spaced, round tick values covering the interval [low, high].
+    """
+    if high <= low:
+        low, high = low - 1, high + 1
+    raw_step = (high - low) / max_ticks
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    step = next(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= raw_step)
+    first = math.ceil(low / step) * step
+    ticks = []
+    tick = first
+    while tick <= high + step * 1e-9:
+        ticks.append(round(tick, 10))
+        tick += step
+    return ticks
+
+
+def format_tick(value):
+    return f"{value:g}".replace('-', '−')
+
+
+def render_titration_svg(pH_values, net_charges, title="Titration Curve", x_label="pH", y_label="Net Charges"):
+    """
+    Renders the titration curve (or any other line plot) as a standalone SVG image, without any plotting library.
+
+    Returns:
+        str: The SVG document.
+    """
+    left, right, top, bottom = 80, 80, 60, 80
+    plot_width = WIDTH - left - right
+    plot_height = HEIGHT - top - bottom
+
+    x_min, x_max = min(pH_values), max(pH_values)
+    y_min, y_max = min(net_charges), max(net_charges)
+    y_padding = (y_max - y_min) * 0.05 or 1
+    y_min, y_max = y_min - y_padding, y_max + y_padding
+    if x_max == x_min:
+        x_min, x_max = x_min - 1, x_max + 1
+
+    def x_position(x):
+        return left + (x - x_min) / (x_max - x_min) * plot_width
+
+    def y_position(y):
+        return top + (y_max - y) / (y_max - y_min) * plot_height
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" '
+        f'viewBox="0 0 {WIDTH} {HEIGHT}" font-family="Open Sans, verdana, arial, sans-serif" fill="{TEXT_COLOR}">',
+        f'<rect width="{WIDTH}" height="{HEIGHT}" fill="white"/>',
+        f'<rect x="{left}" y="{top}" width="{plot_width}" height="{plot_height}" fill="{BACKGROUND_COLOR}"/>',
+    ]
+    for tick in nice_ticks(x_min, x_max, max_ticks=6):
+        x = x_position(tick)
+        parts.append(f'<line x1="{x:.1f}" y1="{top}" x2="{x:.1f}" y2="{top + plot_height}" stroke="white"/>')
+        parts.append(f'<text x="{x:.1f}" y="{top + plot_height + 20}" font-size="12" '
+                     f'text-anchor="middle">{format_tick(tick)}</text>')
+    for tick in nice_ticks(y_min, y_max):
+        y = y_position(tick)
+        parts.append(f'<line x1="{left}" y1="{y:.1f}" x2="{left + plot_width}" y2="{y:.1f}" stroke="white"/>')
+        parts.append(f'<text x="{left - 8}" y="{y + 4:.1f}" font-size="12" '
+                     f'text-anchor="end">{format_tick(tick)}</text>')
+
+    points = ' '.join(f'{x_position(x):.2f},{y_position(y):.2f}' for x, y in zip(pH_values, net_charges))
+    parts.append(f'<polyline points="{points}" fill="none" stroke="{LINE_COLOR}" stroke-width="2"/>')
+    parts.append(f'<text x="{WIDTH / 2}" y="{top / 2 + 6}" font-size="17" text-anchor="middle">'
+                 f'{escape(title)}</text>')
+    parts.append(f'<text x="{left + plot_width / 2}" y="{HEIGHT - 25}" font-size="14" text-anchor="middle">'
+                 f'{escape(x_label)}</text>')
+    parts.append(f'<text x="25" y="{top + plot_height / 2}" font-size="14" text-anchor="middle" '
+                 f'transform="rotate(-90 25 {top + plot_height / 2})">{escape(y_label)}</text>')
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+def render_titration_png(pH_values, net_charges, title="Titration Curve", x_label="pH", y_label="Net Charges"):
+    """
+    Renders the titration curve (or any other line plot) as a PNG image in memory with the matplotlib Agg backend.
+
+    Returns:
+        bytes: The PNG image.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure(figsize=(WIDTH / 100, HEIGHT / 100), dpi=100)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.plot(pH_values, net_charges, color=LINE_COLOR, linewidth=2)
+    axes.set_facecolor(BACKGROUND_COLOR)
+    axes.grid(color='white', linewidth=1)
+    axes.set_axisbelow(True)
+    for spine in axes.spines.values():
+        spine.set_visible(False)
+    axes.tick_params(colors=TEXT_COLOR, length=0)
+    axes.set_xlim(min(pH_values), max(pH_values))
+    axes.set_xlabel(x_label, color=TEXT_COLOR)
+    axes.set_ylabel(y_label, color=TEXT_COLOR)
+    axes.set_title(title, color=TEXT_COLOR)
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png', metadata={'Software': None})
+    return buffer.getvalue()
+
+
+def render_titration_image(net_charge_at_different_pH, backend='matplotlib'):
+    """
+    Renders the static titration curve image with the chosen backend.
+
+    Args:
+        net_charge_at_different_pH (list): The net charge at different pH values.
+        backend (str): One of PLOT_BACKENDS.
+
+    Returns:
+        bytes: The image, in the format given by PLOT_BACKENDS[backend].
+    """
+    pH_values = [nc['pH'] for nc in net_charge_at_different_pH]
+    net_charges = [nc['net_charge'] for nc in net_charge_at_different_pH]
+    if backend == 'svg':
+        return render_titration_svg(pH_values, net_charges).encode('utf-8')
+    if backend == 'matplotlib':
+        return render_titration_png(pH_values, net_charges)
+    raise ValueError(f"Unknown plot backend: {backend}")
+
+
+def render_line_image(x_values, y_values, backend='matplotlib', title='', x_label='', y_label=''):
+    """
+    Renders a line plot with the chosen backend.
+
+    Returns:
+        tuple: The image and its format.
+    """
+    if backend == 'svg':
+        return render_titration_svg(x_values, y_values, title, x_label, y_label).encode('utf-8'), 'svg'
+    return render_titration_png(x_values, y_values, title, x_label, y_label), 'png'
@@ -0,0 +1,173 @@
+import struct
+
+import numpy as np
+from references import kyte_doolittle
+from Calculate_protein_properties import AMINO_ACIDS, DN_DC_VALUES, residue_codes
+from Titration_functions import side_chain_charges
+
+# Sliding window profiles are calculated from prefix sums of the per-residue property values: the sum over a
+# window is the difference of two prefix sums, so a whole profile costs O(n) whatever the window size.
+
+# Default window, step and pH of the sliding window profiles
+DEFAULT_WINDOW = 9
+DEFAULT_STEP = 1
+DEFAULT_PH = 7.0
+
+# Record layout of a profile: the index of the sequence in the input, the 1-based first and last residue of
+# the window and the mean hydropathy, net charge and mean dn/dc of the window
+PROFILE_DTYPE = np.dtype([('record', '<i8'), ('start', '<i8'), ('end', '<i8'), ('hydropathy', '<f8'),
+                          ('net_charge', '<f8'), ('dn_dc', '<f8')])
+PROFILE_FORMATS = ['tsv', 'npy']
+# Windows formatted at once when writing a TSV table
+TSV_BATCH_SIZE = 100000
+
+# Properties plotted in the report, with their axis title
+PROFILE_PLOTS = [('hydropathy', 'Hydropathy (Kyte-Doolittle)'), ('net_charge', 'Net Charge'), ('dn_dc', 'dn/dc')]
+
+# Per-residue hydropathy, aligned with AMINO_ACIDS
+HYDROPATHY_VALUES = np.array([kyte_doolittle.get(aa, 0.0) for aa in AMINO_ACIDS])
+
+
+def window_bounds(length, window, step=DEFAULT_STEP):
+    """
+    Returns the 0-based start (inclusive) and end (exclusive) of every window along a sequence.
+
+    A sequence shorter than the window gets a single window covering the whole sequence.
+    """
+    if window <= 0 or step <= 0:
+        raise ValueError(f"The window and step should be positive, got {window} and {step}.")
+    starts = np.arange(0, max(length - window, 0) + 1, step, dtype=np.int64)
+    ends = np.minimum(starts + window, length)
+    return starts, ends
+
+
+def window_sums(values, starts, ends):
+    prefix_sums = np.concatenate(([0.0], np.cumsum(values)))
+    return prefix_sums[ends] - prefix_sums[starts]
+
+
+def sliding_window_profile(sequence, window=DEFAULT_WINDOW, step=DEFAULT_STEP, pH=DEFAULT_PH, record=0):
+    """
+    Calculates the hydropathy, net charge and dn/dc profile of a sequence with a sliding window.
+
+    The net charge of a window is the sum of the side chain charges at the given pH, the termini are not
+    included. Hydropathy and dn/dc are averaged over the residues of the window.
+
+    Args:
+        sequence (str): The validated protein sequence.
+        window (int): Number of residues per window.
+        step (int): Number of residues between the starts of consecutive windows.
+        pH (float): pH value at which the net charge is calculated.
+        record (int): Index of the sequence, stored in the record field.
+
+    Returns:
+        numpy.ndarray: One PROFILE_DTYPE record per window.
+    """
+    codes = residue_codes(sequence)
+    starts, ends = window_bounds(len(codes), window, step)
+    sizes = np.maximum(ends - starts, 1)
+
+    profile = np.empty(len(starts), dtype=PROFILE_DTYPE)
+    profile['record'] = record
+    profile['start'] = starts + 1
+    profile['end'] = ends
+    # the appended 0 is the value of unknown residues
+    profile['hydropathy'] = window_sums(np.append(HYDROPATHY_VALUES, 0.0)[codes], starts, ends) / sizes
+    profile['net_charge'] = window_sums(np.append(side_chain_charges(AMINO_ACIDS, pH), 0.0)[codes], starts, ends)
+    profile['dn_dc'] = window_sums(np.append(DN_DC_VALUES, 0.0)[codes], starts, ends) / sizes
+    return profile
+
+
+def plot_points(profile, column, max_points=2000):
+    """
+    Returns the window centers and values of one profile column, thinned out to at most max_points points.
+    """
+    stride = max(1, -(-len(profile) // max_points))
+    thinned = profile[::stride]
+    return ((thinned['start'] + thinned['end']) / 2).tolist(), thinned[column].tolist()
+
+
+class NpyWriter:
+    """
+    Streams records to a .npy file without holding them in memory.
+
+    A header with room for any record count is written first and rewritten with the final count on close, so
+    the file can be read with numpy.load (or memory mapped) as one structured array.
+
+    Args:
+        path (str): Path of the .npy file.
+        dtype (numpy.dtype): The structured dtype of the records.
+    """
+
+    def __init__(self, path, dtype):
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self.header_length = len(self._header(10 ** 18))
+        self.handle = open(path, 'wb')
+        self.handle.write(self._header(0, self.header_length))
+
+    def _header(self, count, total_length=None):
+        header = repr({'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False,
+                       'shape': (count,)})
+        # magic string, version and header length take 10 bytes, the header is padded to a multiple of 64 bytes
+        total_length = total_length or -(-(10 + len(header) + 1) // 64) * 64
+        header = header.ljust(total_length - 11) + '\n'
+        return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+    def write(self, records):
+        records = np.ascontiguousarray(records, dtype=self.dtype)
+        self.handle.write(records.tobytes())
+        self.count += len(records)
+
+    def close(self):
+        self.handle.seek(0)
+        self.handle.write(self._header(self.count, self.header_length))
+        self.handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ProfileWriter:
+    """
+    Streams the sliding window profiles of one or more sequences to a TSV table or a .npy array.
+
+    The TSV table has a name column, the .npy array stores the index of the sequence in the record field.
+
+    Args:
+        path (str): Path of the output file.
+        output_format (str): One of PROFILE_FORMATS.
+    """
+
+    def __init__(self, path, output_format='tsv'):
+        if output_format not in PROFILE_FORMATS:
+            raise ValueError(f"Unknown profile format: {output_format}")
+        self.output_format = output_format
+        if output_format == 'npy':
+            self.writer = NpyWriter(path, PROFILE_DTYPE)
+        else:
+            self.writer = open(path, 'w')
+            self.writer.write('\t'.join(['name'] + list(PROFILE_DTYPE.names[1:])) + '\n')
+
+    def write(self, name, profile):
+        if self.output_format == 'npy':
+            self.writer.write(profile)
+            return
+        prefix = name.replace('\t', ' ').replace('\n', ' ') + '\t'
+        for start in range(0, len(profile), TSV_BATCH_SIZE):
+            batch = profile[start:start + TSV_BATCH_SIZE]
+            columns = [batch[column].tolist() for column in PROFILE_DTYPE.names[1:]]
+            rows = map('%d\t%d\t%.4f\t%.4f\t%.6f'.__mod__, zip(*columns))
+            self.writer.write(prefix + ('\n' + prefix).join(rows) + '\n')
+
+    def close(self):
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,98 @@
+import os
+from functools import lru_cache
+
+# Templates are loaded from the tool directory, so the job directory needs no copy of them
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+# Number of proteins per page of the batch summary report
+SUMMARY_PAGE_SIZE = 500
+
+
+@lru_cache(maxsize=None)
+def get_environment():
+    """
+    Creates the Jinja2 environment once per process.
+
+    Compiled templates are kept in a bytecode cache in the temporary directory of the user, so a new job does not
+    compile them again. Templates are not checked for changes after loading, the persistent worker keeps them warm.
+    """
+    from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+    return Environment(loader=FileSystemLoader(TEMPLATE_DIR), bytecode_cache=FileSystemBytecodeCache(),
+                       auto_reload=False)
+
+
+@lru_cache(maxsize=None)
+def get_template(template_name):
+    """
+    Loads and compiles a template once per process.
+    """
+    return get_environment().get_template(template_name)
+
+
+def render_report(data, report_path):
+    """
+    Renders the results.html template with the given data and streams it to report_path.
+    """
+    get_template('results.html').stream(data).dump(report_path, encoding='utf-8')
+
+
+class SummaryReport:
+    """
+    Streams the batch summary report, one HTML page of proteins at a time.
+
+    The report is a single HTML file with one table body per page of SUMMARY_PAGE_SIZE proteins, of which one
+    is shown at a time. Every page is rendered and written as soon as it is full, so the report of thousands of
+    proteins is never held in memory.
+
+    Args:
+        report_path (str): Path of the summary report.
+        reports_dir (str): Directory of the per-protein reports to link to, or None.
+        page_size (int): Number of proteins per page.
+    """
+
+    def __init__(self, report_path, reports_dir=None, page_size=SUMMARY_PAGE_SIZE):
+        self.macros = get_template('summary.html').module
+        self.report_dir = os.path.dirname(os.path.abspath(report_path))
+        self.reports_dir = reports_dir
+        self.page_size = page_size
+        self.rows = []
+        self.pages = 0
+        self.total = 0
+        self.failed = 0
+        self.out = open(report_path, 'w', encoding='utf-8')
+        self.out.write(str(self.macros.header()))
+
+    def add(self, result, report_name=None):
+        """
+        Adds the row of one protein, report_name is the file name prefix of its report in reports_dir.
+        """
+        row = {'name': result['name'], 'error': result['error']}
+        if not result['error']:
+            row.update(result, **result['molar_absorbance_info'])
+            if self.reports_dir and report_name:
+                row['report'] = os.path.relpath(os.path.join(self.reports_dir, f"{report_name}_report.html"),
+                                                self.report_dir)
+        self.rows.append(row)
+        self.total += 1
+        if result['error']:
+            self.failed += 1
+        if len(self.rows) == self.page_size:
+            self.write_page()
+
+    def write_page(self):
+        if self.rows:
+            self.pages += 1
+            self.out.write(str(self.macros.page(self.pages, self.rows)))
+            self.rows = []
+
+    def close(self):
+        self.write_page()
+        self.out.write(str(self.macros.footer(self.total, self.failed, self.pages)))
+        self.out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,193 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+# Default maximum size of the cache directory in MB
+DEFAULT_MAX_SIZE = 500
+# Layout of the cached properties, part of every key so entries without newer properties are not returned
+CACHE_FORMAT = 3
+# File in the cache directory holding the running size of the cache in bytes, shared by all jobs using the cache
+SIZE_FILE = 'cache_size'
+# Age in seconds after which a temporary file is taken to be left behind by a crashed job and removed. Younger ones
+# may still be written by another job and are never touched.
+TEMP_FILE_MAX_AGE = 3600
+
+
+class ResultCache:
+    """
+    On-disk, content-addressed cache of calculated protein properties and titration curves.
+
+    Entries are keyed on a hash of the normalized sequence, the pH grid, the tool version and the cache format,
+    so a new tool version never returns stale results. Files are written atomically, so the cache directory can be
+    shared between Galaxy job workers on the same node. The directory is kept below max_size MB by evicting the
+    least recently used files. Every write adds to a running size kept in SIZE_FILE, so the directory is only
+    scanned when the cache may have outgrown its maximum size, not on every run.
+
+    Args:
+        cache_dir (str): Directory of the cache, created if it does not exist.
+        version (str): Version of the tool, part of every key.
+        max_size (float): Maximum size of the cache directory in MB.
+    """
+
+    def __init__(self, cache_dir, version, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.version = version
+        self.max_size = max_size * 1024 * 1024
+        os.makedirs(cache_dir, exist_ok=True)
+        # whether this process added entries; worker processes write to copies of the cache, which shows as a change
+        # of the running size
+        self.written = False
+        self.initial_size = self._update_size()
+        if self.initial_size is None:
+            self.initial_size = self._scan()
+
+    def key(self, sequence, pH_values):
+        content = f"{self.version}\n{CACHE_FORMAT}\n{','.join(str(pH) for pH in pH_values)}\n{sequence}"
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.cache_dir, key[:2], key + suffix)
+
+    def _read(self, key, suffix, mode='r'):
+        path = self._path(key, suffix)
+        try:
+            with open(path, mode) as handle:
+                content = handle.read()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        # mark the entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return content
+
+    def _write(self, key, suffix, content, mode='w'):
+        path = self._path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(handle, mode) as temp_file:
+                temp_file.write(content)
+            size = os.path.getsize(temp_path)
+            try:
+                size -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.written = True
+        self._update_size(size)
+
+    def _update_size(self, added=0, total=None):
+        """
+        Adds added bytes to the running size in SIZE_FILE, or replaces it by total, under an exclusive lock, and
+        returns the new size. The size of a new cache, or of one written by an older version of the tool, is
+        unknown (None) until the next full scan sets it.
+        """
+        with open(os.path.join(self.cache_dir, SIZE_FILE), 'a+') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            if total is None:
+                handle.seek(0)
+                try:
+                    total = int(handle.read()) + added
+                except ValueError:
+                    return None
+            handle.seek(0)
+            handle.truncate()
+            handle.write(str(total))
+            return total
+
+    def get_properties(self, key):
+        """
+        Returns the cached property dict, or None on a cache miss.
+        """
+        content = self._read(key, '.json')
+        if content is None:
+            return None
+        try:
+            return json.loads(content)
+        except ValueError:
+            return None
+
+    def put_properties(self, key, properties):
+        self._write(key, '.json', json.dumps(properties))
+
+    def get_plot(self, key, image_suffix='.png'):
+        """
+        Returns the cached titration curve JSON and image, or None on a cache miss.
+
+        Args:
+            key (str): The cache key.
+            image_suffix (str): Suffix of the image file, images rendered by different plot backends are cached
+                separately.
+        """
+        titration_json = self._read(key, '.plot.json')
+        image = self._read(key, image_suffix, 'rb')
+        if titration_json is None or image is None:
+            return None
+        return titration_json, image
+
+    def put_plot(self, key, titration_json, image, image_suffix='.png'):
+        self._write(key, '.plot.json', titration_json)
+        self._write(key, image_suffix, image, 'wb')
+
+    def evict(self):
+        """
+        Removes the least recently used files until the cache is smaller than its maximum size.
+
+        Nothing is done when nothing was written to the cache since it was opened, or when the running size shows the
+        cache is still below its maximum size, so a run that only reads from the cache does not touch its files.
+        """
+        total_size = self._update_size()
+        if not self.written and total_size == self.initial_size:
+            return
+        if total_size is not None and total_size <= self.max_size:
+            return
+        self._scan()
+
+    def _scan(self):
+        """
+        Scans the whole cache directory, removes the least recently used files above the maximum size and resets the
+        running size. Returns the size of the cache in bytes.
+
+        Temporary files of entries that are being written are skipped, so the scan never removes a file another job
+        is about to move into place; only those older than TEMP_FILE_MAX_AGE are cleaned up.
+        """
+        files = []
+        total_size = 0
+        orphan_time = time.time() - TEMP_FILE_MAX_AGE
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if root == self.cache_dir and name == SIZE_FILE:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if name.endswith('.tmp'):
+                    if stat.st_mtime < orphan_time:
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+
+        for _, size, path in sorted(files):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        return self._update_size(total=total_size)
@@ -1,42 +1,100 @@
-import re
+import gzip
+from collections import Counter
+
+import numpy as np
+
+
+# One letter codes of the amino acids accepted in a protein sequence
+PROTEIN_LETTERS = b'ACDEFGHIKLMNOPQRSTUVWY'
+DNA_LETTERS = b'ACGT'
+MIN_SEQ_LENGTH = 10
+# Positions listed per invalid character in the error message
+MAX_REPORTED_POSITIONS = 10
+
+# Lookup table marking every byte that is not a (lower or upper case) amino acid letter
+INVALID_BYTES = np.ones(256, dtype=bool)
+INVALID_BYTES[np.frombuffer(PROTEIN_LETTERS + PROTEIN_LETTERS.lower(), dtype=np.uint8)] = False
+VALID_CHARACTERS = frozenset((PROTEIN_LETTERS + PROTEIN_LETTERS.lower()).decode('ascii'))
 
 
 def normalize_sequence(sequence):
-    return re.sub(r'\s+', '', sequence)
+    return ''.join(sequence.split())
+
+
+def invalid_characters(sequence):
+    """
+    Finds every character that is not an amino acid letter.
+
+    The valid letters are deleted with bytes.translate in a single pass, only when something is left the
+    positions are looked up.
+
+    Returns:
+        list: (position, character) tuples, with 1-based positions.
+    """
+    if sequence.isascii():
+        encoded = sequence.encode('ascii')
+        if not encoded.translate(None, PROTEIN_LETTERS + PROTEIN_LETTERS.lower()):
+            return []
+        positions = np.flatnonzero(INVALID_BYTES[np.frombuffer(encoded, dtype=np.uint8)])
+        return [(int(position) + 1, sequence[position]) for position in positions]
+    return [(position + 1, char) for position, char in enumerate(sequence) if char not in VALID_CHARACTERS]
+
+
+def is_dna_sequence(sequence):
+    if not sequence or not sequence.isascii():
+        return False
+    return not sequence.encode('ascii').translate(None, DNA_LETTERS + DNA_LETTERS.lower())
+
+
+def invalid_characters_message(invalid):
+    positions_per_char = {}
+    for position, char in invalid:
+        positions_per_char.setdefault(char, []).append(position)
+
+    descriptions = []
+    for char, positions in positions_per_char.items():
+        description = ', '.join(str(position) for position in positions[:MAX_REPORTED_POSITIONS])
+        if len(positions) > MAX_REPORTED_POSITIONS:
+            description += f" and {len(positions) - MAX_REPORTED_POSITIONS} more"
+        descriptions.append(f"\"{char}\" at position{'s' if len(positions) > 1 else ''} {description}")
+    return (f"Protein sequence contains {len(invalid)} invalid character{'s' if len(invalid) > 1 else ''}: "
+            f"{'; '.join(descriptions)}. \n Please enter a valid Protein Sequence.")
 
 
 # Check for validity of protein sequence
-def check_protein_sequence(sequence):
-    protein_pattern = re.compile("^[ACDEFGHIKLMNOPQRSTUVWY]+$", re.IGNORECASE)
-    DNA_pattern = re.compile(r'^[ACTG]+$', re.IGNORECASE)
+def check_protein_sequence(sequence, min_seq_length=MIN_SEQ_LENGTH, max_seq_length=None):
+    """
+    Checks whether the sequence is a valid protein sequence.
+
+    Args:
+        sequence (str): The normalized sequence.
+        min_seq_length (int): Minimum number of residues.
+        max_seq_length (int): Maximum number of residues, or None for no maximum.
+
+    Returns:
+        str: An error message listing every problem of the same kind at once, or None if the sequence is valid.
+    """
     seq_length = len(sequence)
-    min_seq_length = 10
-    max_seq_length = 3000
 
     # Check if sequence is a valid DNA sequence
-    if DNA_pattern.match(sequence):
+    if is_dna_sequence(sequence):
         error_message = f"Sequence is a DNA sequence. Please enter a valid Protein Sequence."
         return error_message
 
     # Check if sequence is a valid protein sequence
-    for char in sequence:
-        if not protein_pattern.match(char):
-            error_message = (
-                f"Protein sequence contains invalid character: \"{char}\". \n Please enter a valid Protein "
-                f"Sequence.")
-            return error_message
+    invalid = invalid_characters(sequence)
+    if invalid:
+        return invalid_characters_message(invalid)
 
     # Check if sequence is a valid protein sequence of minimum 10 amino acids
     if seq_length < min_seq_length:
-        error_message = (f"Protein sequence should have a minimum length of 10 residues, the input sequence has a "
-                         f"length of {seq_length}.")
+        error_message = (f"Protein sequence should have a minimum length of {min_seq_length} residues, the input "
+                         f"sequence has a length of {seq_length}.")
         return error_message
 
-    # Check if sequence is a valid protein sequence of max 3000 amino acids
-    if seq_length > max_seq_length:
+    if max_seq_length is not None and seq_length > max_seq_length:
         error_message = (f"Protein sequence exceeds the maximum allowed length of {max_seq_length} amino acids. "
-                         f"Please shorten the sequence and try again. If longer sequences are required, please contact "
-                         f"the tool developer for further assistance.")
+                         f"Please shorten the sequence and try again.")
         return error_message
 
     return None
@@ -44,19 +102,32 @@ def check_protein_sequence(sequence):
 
 # Format the protein sequence in a nice way in the Results page
 def format_sequence(sequence, line_length=55, show_residue_number=False):
-    sequence = normalize_sequence(sequence)
+    """
+    Splits the sequence in blocks of 10 residues, with as many blocks per line as fit in line_length.
 
-    # Insert spaces every 10 residues
-    formatted_sequence = ' '.join(sequence[i:i + 10] for i in range(0, len(sequence), 10))
+    Args:
+        sequence (str): The protein sequence.
+        line_length (int): Maximum number of characters per line, excluding the residue number.
+        show_residue_number (bool): Whether to end every line with the number of the last residue on it.
+    """
+    sequence = normalize_sequence(sequence)
+    # every block takes 10 residues plus a separating space
+    residues_per_line = 10 * max(1, (line_length + 1) // 11)
 
     lines = []
-    residue_count = 0  # To track the number of residues processed
-
-    for match in re.finditer(r'(.{1,' + str(line_length) + r'})(?: |$)', formatted_sequence):
-        line = match.group(1)
-        residue_count += len(re.sub(r' ', '', line))  # Count residues in this line (ignoring spaces)
+    start = 0
+    while start < len(sequence):
+        remaining = len(sequence) - start
+        # the last line may hold a partial block, as long as it fits
+        if remaining + (remaining - 1) // 10 <= line_length:
+            line_residues = sequence[start:]
+        else:
+            line_residues = sequence[start:start + residues_per_line]
+        start += len(line_residues)
+        line = ' '.join(line_residues[i:i + 10] for i in range(0, len(line_residues), 10))
 
         if show_residue_number:
+            residue_count = start
             line_rest = line_length - len(line)
             line += (" " * line_rest) + f" {residue_count}"
         lines.append(line)
@@ -74,10 +145,47 @@ def letter_count(text):
     Returns:
       dict: A dictionary with keys as letters and values as their counts.
     """
-    frequency = {}
-    for letter in text.upper():
-        if letter in frequency:
-            frequency[letter] += 1
-        else:
-            frequency[letter] = 1
-    return frequency
+    text = text.upper()
+    if not text.isascii():
+        return dict(Counter(text))
+    counts = np.bincount(np.frombuffer(text.encode('ascii'), dtype=np.uint8), minlength=128)
+    return {chr(code): int(counts[code]) for code in np.flatnonzero(counts)}
+
+
+def open_text(path):
+    """
+    Opens a plain or gzip compressed text file for reading, based on the gzip magic number.
+    """
+    with open(path, 'rb') as handle:
+        magic = handle.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(path, 'rt')
+    return open(path, 'r')
+
+
+def read_fasta(path):
+    """
+    Streams the records of a (gzipped) multi-FASTA file, holding only the current record in memory.
+
+    Args:
+      path (str): Path to the plain or gzip compressed FASTA file.
+
+    Yields:
+      tuple: The header (without ">") and the concatenated sequence of each record.
+    """
+    header = None
+    chunks = []
+    with open_text(path) as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('>'):
+                if header is not None:
+                    yield header, ''.join(chunks)
+                header = line[1:].strip()
+                chunks = []
+            elif header is not None:
+                chunks.append(line)
+    if header is not None:
+        yield header, ''.join(chunks)
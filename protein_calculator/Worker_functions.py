@@ -0,0 +1,70 @@
+import json
+import os
+import signal
+import socketserver
+import sys
+
+
+def handle_line(handler, line):
+    """
+    Decodes one JSON request, passes it to the handler and encodes the response.
+
+    Errors never stop the worker: they are returned as {"ok": false, "error": "..."}.
+    """
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError('A request should be a JSON object.')
+        response = {'ok': True, **handler(request)}
+    except Exception as error:
+        response = {'ok': False, 'error': str(error)}
+    return json.dumps(response) + '\n'
+
+
+def serve_stream(handler, input_stream=None, output_stream=None):
+    """
+    Serves JSON-lines requests from a stream (stdin by default) until it is closed.
+
+    Args:
+        handler (callable): Function turning a request dict into a response dict.
+        input_stream: Stream to read one JSON request per line from.
+        output_stream: Stream to write one JSON response per line to.
+    """
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+    for line in input_stream:
+        if not line.strip():
+            continue
+        output_stream.write(handle_line(handler, line))
+        output_stream.flush()
+
+
+def serve_socket(handler, socket_path):
+    """
+    Serves JSON-lines requests on a local Unix socket, one connection at a time, until interrupted or terminated.
+
+    Every connection can send any number of requests, each answered with one response line.
+    """
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                line = line.decode('utf-8')
+                if not line.strip():
+                    continue
+                self.wfile.write(handle_line(handler, line).encode('utf-8'))
+                self.wfile.flush()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    with socketserver.UnixStreamServer(socket_path, RequestHandler) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
@@ -5,194 +5,578 @@
 ################################################################################################
 
 import argparse
-import pandas as pd
-from json import dumps
-from plotly import utils, express as px
-from Calculate_protein_properties import (get_isoelectric_point, calculate_dn_dc, calculate_total_masses,
-                                          calculate_extinction_coefficient, get_net_charge)
-from Sequence_functions import normalize_sequence, check_protein_sequence, format_sequence, letter_count
-from references import amino_acid_data
-from jinja2 import Environment, FileSystemLoader
-import base64
+import importlib.util
+import os
+import sys
+import time
 
 VERSION = '1.0.2'
 
-def main():
-    parser = argparse.ArgumentParser(description='Process some sequences.')
-    parser.add_argument('--name', type=str, required=True, help='Name of the protein')
-    parser.add_argument('--sequence', type=str, required=True, help='Sequence to be processed')
-    parser.add_argument('-v', '--version', action='version', version=f'%(prog)s {VERSION}', help='Show the version of the tool and exit')
+# Galaxy's version_command only passes --version: answer it before numpy and the calculation modules are imported
+if __name__ == '__main__' and sys.argv[1:] in (['--version'], ['-v']):
+    print(f'{os.path.basename(sys.argv[0])} {VERSION}')
+    sys.exit(0)
 
-    args = parser.parse_args()
+# start of the imports, reported as a stage with --profile
+IMPORT_START = time.perf_counter()
 
-    name = args.name
-    sequence = args.sequence.upper()
+from json import dumps
+from Calculate_protein_properties import calculate_properties
+from Titration_functions import ph_grid
+from Sequence_functions import normalize_sequence, check_protein_sequence, format_sequence, read_fasta
+from Batch_functions import OUTPUT_FORMATS, get_worker_count, run_batch, write_results
+from Result_cache import ResultCache, DEFAULT_MAX_SIZE
+from Plot_functions import PLOT_BACKENDS, IMAGE_MIME_TYPES, render_titration_image, render_line_image
+from Profile_functions import (DEFAULT_WINDOW, DEFAULT_STEP, DEFAULT_PH, PROFILE_FORMATS, PROFILE_PLOTS,
+                               ProfileWriter, sliding_window_profile, plot_points)
+from Digestion_functions import (DEFAULT_MISSED_CLEAVAGES, DEFAULT_MIN_PEPTIDE_LENGTH, DEFAULT_MAX_PEPTIDE_LENGTH,
+                                 DIGEST_FORMATS, ENZYMES, cleavage_rule, write_digest)
+from Mass_index import DEFAULT_TOLERANCE_PPM, MASS_TYPES, open_mass_index, read_query_masses, write_matches
+from Report_functions import render_report
+from Worker_functions import serve_stream, serve_socket
+from Metrics_functions import NO_METRICS, StageMetrics
+import base64
+from functools import partial
 
-    # Normaliseer de sequentie om spaties en enters te verwijderen en controleer de geldigheid van de sequentie
-    sequence = normalize_sequence(sequence)
-    error_message = check_protein_sequence(sequence)
+# Heavy modules (plotly, jinja2, matplotlib) are only imported by the functions producing the outputs that need
+# them, so batch tables and the persistent worker start fast.
 
-    if error_message:
-        print(f"Error: {error_message}")
-        return
+def format_mass(mass):
+    """
+    Formats a mass for the report, using a space as thousands separator above 9999 Da.
+    """
+    if mass > 9999:
+        return f"{mass:,.2f}".replace(",", " ")
+    return f"{mass:.2f}"
 
-    sequence_formatted = format_sequence(sequence, show_residue_number=True, line_length=55)
-
-    # Voer berekeningen uit
-    frequency = letter_count(sequence)
-    amino_acid_composition = []
-    total_monoisotopic_mass = 18.0152
-    total_average_mass = 18.0152
-    total_extinction_coefficient_cystines = 0
-    total_extinction_coefficient_reduced = 0
-    total_count = sum(frequency.values())
-
-    for amino_acid in sorted(frequency.keys()):
-        count = frequency[amino_acid]
-        monoisotopic_mass, average_mass = calculate_total_masses(amino_acid, count)
-        total_monoisotopic_mass += monoisotopic_mass
-        total_average_mass += average_mass
-        total_extinction_coefficient_cystines += calculate_extinction_coefficient(amino_acid, count, True)
-        total_extinction_coefficient_reduced += calculate_extinction_coefficient(amino_acid, count, False)
-        data = amino_acid_data.get(amino_acid)
-        percentage = (count / total_count) * 100
-        amino_acid_composition.append({
-            'amino_acid': amino_acid,
-            'long_name': data.get('Long', ''),
-            'mono_weight': round(data.get('Monoisotopic Weight (Da)', ''), 2),
-            'avg_weight': round(data.get('Average Weight (Da)', ''), 2),
-            'count': count,
-            'percentage': f"{percentage:.2f}%"
-        })
 
-    number_info = {'number': total_count}
+def build_titration_curve(net_charge_at_different_pH):
+    """
+    Builds the Plotly titration curve figure from the net charges at different pH values.
+    """
+    import plotly.graph_objects as go
 
-    # Clean up of total_monoisotopic_mass and total_average_mass
-    if total_monoisotopic_mass > 9999:
-        temp_str = f"{total_monoisotopic_mass:,.2f}"
-        rounded_total_monoisotopic_mass = temp_str.replace(",", " ")
-    else:
-        rounded_total_monoisotopic_mass = f"{total_monoisotopic_mass:.2f}"
+    pH_values = [nc['pH'] for nc in net_charge_at_different_pH]
+    net_charges = [nc['net_charge'] for nc in net_charge_at_different_pH]
+    titration_curve = go.Figure(go.Scatter(x=pH_values, y=net_charges, mode='lines', line={'color': '#3ABBBA'},
+                                           hovertemplate='pH=%{x}<br>Net Charges=%{y}<extra></extra>'))
+    titration_curve.update_layout(title_text="Titration Curve", title_x=0.5, xaxis_title="pH",
+                                  yaxis_title="Net Charges")
+    return titration_curve
 
-    if total_average_mass > 9999:
-        temp_str = f"{total_average_mass:,.2f}"
-        rounded_total_average_mass = temp_str.replace(",", " ")
-    else:
-        rounded_total_average_mass = f"{total_average_mass:.2f}"
 
-    molecular_weight_info = {
-        'mono_weight': rounded_total_monoisotopic_mass,
-        'avg_weight': rounded_total_average_mass
-    }
+def write_interactive_plot(titration_curve, html_path):
+    """
+    Writes the interactive titration curve as a standalone HTML file.
+    """
+    html_content = titration_curve.to_html(full_html=True)
 
-    molar_absorbance_info = {
-        'extinction_coefficient_cystines': total_extinction_coefficient_cystines,
-        'extinction_coefficient_reduced': total_extinction_coefficient_reduced,
-        'absorbance_mono_cystines': round(total_extinction_coefficient_cystines / total_monoisotopic_mass, 4) if total_monoisotopic_mass != 0 else 0,
-        'absorbance_avg_cystines': round(total_extinction_coefficient_cystines / total_average_mass, 4) if total_average_mass != 0 else 0,
-        'absorbance_mono_reduced': round(total_extinction_coefficient_reduced / total_monoisotopic_mass, 4) if total_monoisotopic_mass != 0 else 0,
-        'absorbance_avg_reduced': round(total_extinction_coefficient_reduced / total_average_mass, 4) if total_average_mass != 0 else 0
-    }
+    # ensure the file starts with <!DOCTYPE html>, as otherwise Galaxy will not render it as an HTML file
+    if not html_content.lstrip().startswith("<!DOCTYPE html>"):
+        html_content = f"<!DOCTYPE html>\n{html_content}"
+
+    with open(html_path, "w", encoding="utf-8") as file:
+        file.write(html_content)
 
-    pI = round(get_isoelectric_point(sequence), 2)
-    net_charge_at_different_pH = []
-    pH_values = []
-    net_charges = []
-    charges = get_net_charge(sequence)
 
-    for pH, net_charge in charges.items():
-        net_charge_at_different_pH.append({
-            'pH': pH,
-            'net_charge': round(net_charge, 2)
+def write_titration_outputs(titration_curve, net_charge_at_different_pH, html_path, image_path,
+                            plot_backend='matplotlib', metrics=NO_METRICS):
+    """
+    Writes the interactive titration curve and its static image, rendered in memory by the plot backend.
+
+    Returns:
+        bytes: The static image, to embed in the HTML report.
+    """
+    with metrics.stage('interactive_plot'):
+        write_interactive_plot(titration_curve, html_path)
+
+    with metrics.stage('titration_image'):
+        image = render_titration_image(net_charge_at_different_pH, plot_backend)
+        with open(image_path, "wb") as image_file:
+            image_file.write(image)
+    return image
+
+
+def write_cached_titration_outputs(cache, key, net_charge_at_different_pH, html_path, image_path,
+                                   plot_backend='matplotlib', metrics=NO_METRICS):
+    """
+    Writes the titration curve outputs, reusing the cached figure and image when available.
+
+    Returns:
+        tuple: The Plotly titration curve, its JSON and the static image as a Base64 string.
+    """
+    image_suffix = f".{plot_backend}.{PLOT_BACKENDS[plot_backend]}"
+    plot = cache.get_plot(key, image_suffix) if cache else None
+    if plot is None:
+        with metrics.stage('titration_curve'):
+            titration_curve = build_titration_curve(net_charge_at_different_pH)
+        image = write_titration_outputs(titration_curve, net_charge_at_different_pH, html_path, image_path,
+                                        plot_backend, metrics)
+        with metrics.stage('titration_json'):
+            titration_json = titration_curve_json(titration_curve)
+        if cache:
+            cache.put_plot(key, titration_json, image, image_suffix)
+        return titration_curve, titration_json, base64.b64encode(image).decode("utf-8")
+
+    # cache hit: only the interactive plot is written, the image is not rendered again
+    import plotly.io as pio
+
+    titration_json, image = plot
+    with metrics.stage('titration_curve'):
+        titration_curve = pio.from_json(titration_json)
+    with metrics.stage('interactive_plot'):
+        write_interactive_plot(titration_curve, html_path)
+    with open(image_path, "wb") as image_file:
+        image_file.write(image)
+    return titration_curve, titration_json, base64.b64encode(image).decode("utf-8")
+
+
+def titration_curve_json(titration_curve):
+    from plotly import utils
+
+    return dumps(titration_curve, cls=utils.PlotlyJSONEncoder)
+
+
+def build_profile_plots(profile, plot_backend='matplotlib'):
+    """
+    Renders the hydropathy, net charge and dn/dc profiles for the report.
+
+    Returns:
+        list: Per profile a dict with its title and the image as a Base64 string.
+    """
+    profile_plots = []
+    for column, label in PROFILE_PLOTS:
+        x_values, y_values = plot_points(profile, column)
+        image, image_format = render_line_image(x_values, y_values, plot_backend, f"{label} Profile",
+                                                'Residue (window center)', label)
+        profile_plots.append({
+            'title': label,
+            'image_base64': base64.b64encode(image).decode("utf-8"),
+            'image_mime': IMAGE_MIME_TYPES[image_format]
         })
-        pH_values.append(pH)
-        net_charges.append(net_charge)
+    return profile_plots
+
+
+def build_envelope_plot(envelope, plot_backend='matplotlib'):
+    """
+    Renders the isotopic envelope for the report as a stick spectrum.
+
+    Returns:
+        dict: The image as a Base64 string and its MIME type.
+    """
+    # every peak is drawn as a vertical line from the baseline
+    x_values = [mass for mass in envelope['masses'] for _ in range(3)]
+    y_values = [value for abundance in envelope['abundances'] for value in (0, abundance, 0)]
+    image, image_format = render_line_image(x_values, y_values, plot_backend, 'Isotopic Envelope', 'Mass (Da)',
+                                            'Relative abundance (%)')
+    return {'image_base64': base64.b64encode(image).decode("utf-8"), 'image_mime': IMAGE_MIME_TYPES[image_format]}
+
+
+def build_report_data(name, sequence, properties, titration_image_base64, image_format='png', profile_plots=None,
+                      profile_options=None, envelope_plot=None):
+    """
+    Collects the data to render in the results.html template.
+
+    The titration curve is only embedded once, as a static image. The interactive curve is a separate output.
+    The sliding window profile plots and their options are only shown when profile_plots is given, the isotopic
+    envelope plot when envelope_plot is given.
+    """
+    envelope = properties['isotopic_envelope']
+    return {
+        "name": name,
+        "sequence": format_sequence(sequence, show_residue_number=True, line_length=55),
+        "sequence2": sequence,
+        "amino_acid_composition": properties['amino_acid_composition'],
+        "number_info": {'number': properties['length']},
+        "molecular_weight_info": {
+            'mono_weight': format_mass(properties['monoisotopic_mass']),
+            'avg_weight': format_mass(properties['average_mass'])
+        },
+        "isotopic_envelope_info": {
+            'formula': envelope['formula'],
+            'most_abundant_mass': format_mass(envelope['most_abundant_mass']),
+            'peaks': [{'mass': f"{mass:.4f}", 'abundance': f"{abundance:.2f}"}
+                      for mass, abundance in zip(envelope['masses'], envelope['abundances'])]
+        },
+        "envelope_plot": envelope_plot,
+        "molar_absorbance_info": properties['molar_absorbance_info'],
+        "pI": properties['pI'],
+        "net_charge_at_different_pH": properties['net_charge_at_different_pH'],
+        "titration_image_base64": titration_image_base64,
+        "titration_image_mime": IMAGE_MIME_TYPES[image_format],
+        "dn_dc_value": properties['dn_dc_value'],
+        "profile_plots": profile_plots,
+        "profile_info": profile_options
+    }
+
+
+def write_protein_report(name, sequence, properties, path_prefix, plot_backend='matplotlib', profile=None,
+                         profile_options=None):
+    """
+    Writes the report, titration curve image and interactive titration curve of one protein in batch mode.
+    """
+    image_format = PLOT_BACKENDS[plot_backend]
+    titration_curve = build_titration_curve(properties['net_charge_at_different_pH'])
+    image = write_titration_outputs(titration_curve, properties['net_charge_at_different_pH'],
+                                    f"{path_prefix}_plot.html", f"{path_prefix}_plot.{image_format}", plot_backend)
+    profile_plots = build_profile_plots(profile, plot_backend) if profile is not None else None
+    envelope_plot = build_envelope_plot(properties['isotopic_envelope'], plot_backend)
+    data = build_report_data(name, sequence, properties, base64.b64encode(image).decode("utf-8"), image_format,
+                             profile_plots, profile_options, envelope_plot)
+    render_report(data, f"{path_prefix}_report.html")
+
+
+def run_single(name, sequence, pH_values, plot_backend='matplotlib', cache=None, output_dir='.',
+               print_results=True, profile_options=None, metrics=NO_METRICS):
+    """
+    Calculates the properties of one validated sequence and writes the report and titration curve outputs.
+
+    Args:
+        name (str): Name of the protein.
+        sequence (str): The normalized and validated sequence.
+        pH_values (list): The pH values at which the net charge is reported.
+        plot_backend (str): Renderer of the static titration curve, see Plot_functions.PLOT_BACKENDS.
+        cache (ResultCache): Optional result cache.
+        output_dir (str): Directory in which report.html and the plots are written.
+        print_results (bool): Print the results to stdout, as the tool always did.
+        profile_options (dict): The window, step, pH, format and optional path of the sliding window profile,
+            written to profile.<format> by default and plotted in the report, or None to skip the profile.
+        metrics (StageMetrics): Collects the time and memory of every stage with --profile.
+
+    Returns:
+        tuple: The calculated properties and the paths of the written outputs.
+    """
+    # Voer berekeningen uit, tenzij de resultaten al in de cache zitten
+    with metrics.stage('properties'):
+        key = cache.key(sequence, pH_values) if cache else None
+        properties = cache.get_properties(key) if cache else None
+        if properties is None:
+            properties = calculate_properties(sequence, pH_values)
+            if cache:
+                cache.put_properties(key, properties)
 
     # Plotly Titration Curve
-    df = pd.DataFrame({"pH": pH_values, "Net Charges": net_charges})
-    colors = ['#3ABBBA', '#5A2A82', '#FF681E']
-    titration_curve = px.line(df, x="pH", y="Net Charges", color_discrete_sequence=colors)
-    titration_curve.update_layout(title_text="Titration Curve", title_x=0.5)
+    image_format = PLOT_BACKENDS[plot_backend]
+    html_path = os.path.join(output_dir, "plot.html")
+    image_path = os.path.join(output_dir, f"plot.{image_format}")
+    report_path = os.path.join(output_dir, "report.html")
+    titration_curve, titration_json, titration_image_base64 = write_cached_titration_outputs(
+        cache, key, properties['net_charge_at_different_pH'], html_path, image_path, plot_backend, metrics)
+    if cache:
+        with metrics.stage('cache_eviction'):
+            cache.evict()
+
+    outputs = [report_path, image_path, html_path]
+    profile_plots = None
+    if profile_options:
+        with metrics.stage('sliding_window_profile'):
+            profile = sliding_window_profile(sequence, profile_options['window'], profile_options['step'],
+                                             profile_options['pH'])
+            default_path = os.path.join(output_dir, f"profile.{profile_options['format']}")
+            profile_path = profile_options.get('path') or default_path
+            with ProfileWriter(profile_path, profile_options['format']) as profile_writer:
+                profile_writer.write(name, profile)
+        with metrics.stage('profile_plots'):
+            profile_plots = build_profile_plots(profile, plot_backend)
+        outputs.append(profile_path)
+
+    with metrics.stage('envelope_plot'):
+        envelope_plot = build_envelope_plot(properties['isotopic_envelope'], plot_backend)
+
+    with metrics.stage('report_data'):
+        data = build_report_data(name, sequence, properties, titration_image_base64, image_format, profile_plots,
+                                 profile_options, envelope_plot)
+
+    if print_results:
+        with metrics.stage('print_results'):
+            # Print Results
+            print(f'Name: {name}')
+            print(f'Sequence: {data["sequence"]}')
+            print(f'Amino Acid Composition:')
+            print(f'{"Amino Acid (Short)":<20} {"Amino Acid (Long)":<20} {"Monoisotopic Weight (Da)":<25} {"Average Weight (Da)":<25} {"# Counts":<10} {"% of Total":<10}')
+            for aa in data['amino_acid_composition']:
+                print(f'{aa["amino_acid"]:<20} {aa["long_name"]:<20} {aa["mono_weight"]:<25} {aa["avg_weight"]:<25} {aa["count"]:<10} {aa["percentage"]:<10}')
+            print(f'Molecular Weight Info: {data["molecular_weight_info"]}')
+            print(f'Molecular Formula: {data["isotopic_envelope_info"]["formula"]}')
+            print(f'Most Abundant Mass: {data["isotopic_envelope_info"]["most_abundant_mass"]}')
+            print(f'Molar Absorbance Info: {data["molar_absorbance_info"]}')
+            print(f'pI: {data["pI"]}')
+            print(f'Net Charge at Different pH: {data["net_charge_at_different_pH"]}')
+            print(f'Titration Curve JSON: {titration_json}')
+            print(f'dn/dc Value: {data["dn_dc_value"]}')
 
-    # write the interactive plot to an HTML file
-    file_path = "plot.html"
-    titration_curve.write_html(file_path)
+    #############################
+    #  Render HTML using Jinja2 #
+    #############################
 
-    # ensure the file starts with <!DOCTYPE html>, as otherwise Galaxy will not render it as an HTML file
-    with open(file_path, "r", encoding="utf-8") as file:
-        html_content = file.read()
+    with metrics.stage('report'):
+        render_report(data, report_path)
 
-    # add <!DOCTYPE html> at the beginning if it's missing
-    if not html_content.lstrip().startswith("<!DOCTYPE html>"):
-        html_content = f"<!DOCTYPE html>\n{html_content}"
+    return properties, outputs
 
-    # overwrite the file with the updated content
-    with open(file_path, "w", encoding="utf-8") as file:
-        file.write(html_content)
 
-    # save the titration curve as a PNG image
-    titration_png = "plot.png"
-    titration_curve.write_image(titration_png, format="png")
-
-    # convert the PNG file to a Base64 string
-    with open(titration_png, "rb") as png_file:
-        titration_png_base64 = base64.b64encode(png_file.read()).decode("utf-8")
-
-    # save titration json
-    titration_json = dumps(titration_curve, cls=utils.PlotlyJSONEncoder)
-
-    # calculate dn/dc value
-    dn_dc_value = round(calculate_dn_dc(sequence, amino_acid_data), 6)
-
-    # Print Results
-    print(f'Name: {name}')
-    print(f'Sequence: {sequence_formatted}')
-    print(f'Amino Acid Composition:')
-    print(f'{"Amino Acid (Short)":<20} {"Amino Acid (Long)":<20} {"Monoisotopic Weight (Da)":<25} {"Average Weight (Da)":<25} {"# Counts":<10} {"% of Total":<10}')
-    for aa in amino_acid_composition:
-        print(f'{aa["amino_acid"]:<20} {aa["long_name"]:<20} {aa["mono_weight"]:<25} {aa["avg_weight"]:<25} {aa["count"]:<10} {aa["percentage"]:<10}')
-    print(f'Molecular Weight Info: {molecular_weight_info}')
-    print(f'Molar Absorbance Info: {molar_absorbance_info}')
-    print(f'pI: {pI}')
-    print(f'Net Charge at Different pH: {net_charge_at_different_pH}')
-    print(f'Titration Curve JSON: {titration_json}')
-    print(f'dn/dc Value: {dn_dc_value}')
+def handle_worker_request(request, default_pH_values, default_plot_backend='matplotlib', cache=None):
+    """
+    Handles one request of the persistent worker, see Worker_functions.
 
-    #############################
-    #  Render HTML using Jinja2 #
-    #############################
+    A request is a JSON object with a "name" and "sequence", and optionally an "output_dir", "ph_step",
+    "plot_backend" and a "window" (with "window_step", "window_ph" and "window_format") for the sliding window
+    profile. The response holds the calculated properties and the paths of the written outputs.
+    """
+    name = request.get('name')
+    sequence = request.get('sequence')
+    if not name or not sequence:
+        raise ValueError('Both "name" and "sequence" are required.')
 
-    # Set up the Jinja2 environment
-    env = Environment(loader=FileSystemLoader('templates'))
-
-    # Load the results.html template
-    template = env.get_template('results.html')
-
-    # Data to render in the template
-    data = {
-        "name":name,
-        "sequence":sequence_formatted,
-        "sequence2":sequence,
-        "amino_acid_composition":amino_acid_composition,
-        "number_info":number_info,
-        "molecular_weight_info":molecular_weight_info,
-        "molar_absorbance_info":molar_absorbance_info,
-        "pI":pI,
-        "net_charge_at_different_pH":net_charge_at_different_pH,
-        "titration_json":titration_json,
-        "titration_png_base64":titration_png_base64,
-        "titration_curve":titration_curve,
-        "dn_dc_value":dn_dc_value
-    }
+    sequence = normalize_sequence(sequence.upper())
+    error_message = check_protein_sequence(sequence)
+    if error_message:
+        raise ValueError(error_message)
+
+    pH_values = ph_grid(step=float(request['ph_step'])) if 'ph_step' in request else default_pH_values
+    plot_backend = request.get('plot_backend', default_plot_backend)
+    if plot_backend not in PLOT_BACKENDS:
+        raise ValueError(f"Unknown plot backend: {plot_backend}")
+    output_dir = request.get('output_dir', '.')
+    os.makedirs(output_dir, exist_ok=True)
+
+    profile_options = None
+    if request.get('window'):
+        profile_options = {
+            'window': int(request['window']),
+            'step': int(request.get('window_step', DEFAULT_STEP)),
+            'pH': float(request.get('window_ph', DEFAULT_PH)),
+            'format': request.get('window_format', 'tsv')
+        }
+        if profile_options['format'] not in PROFILE_FORMATS:
+            raise ValueError(f"Unknown profile format: {profile_options['format']}")
+
+    properties, outputs = run_single(name, sequence, pH_values, plot_backend, cache, output_dir,
+                                     print_results=False, profile_options=profile_options)
+    return {'name': name, 'properties': properties, 'outputs': outputs}
+
+
+def run_mass_query(args, digest_options=None, metrics=NO_METRICS):
+    """
+    Matches the observed masses of --query-masses against the mass index of --fasta, which is built in
+    --index-dir when there is no index of the same FASTA content and parameters yet.
+    """
+    try:
+        masses = read_query_masses(args.query_masses)
+    except ValueError as error:
+        print(f"Error: {error}")
+        sys.exit(1)
+    with metrics.stage('mass_index'):
+        index, built = open_mass_index(args.index_dir, args.fasta, args.mass_type, digest_options, VERSION)
+    with metrics.stage('mass_query'):
+        matched, matches = write_matches(index, masses, args.query_output, args.tolerance_ppm)
+    meta = index.meta
+    print(f"{'Built' if built else 'Reused'} the mass index of {meta['proteins']} proteins and {meta['peptides']} "
+          f"peptides in {index.path}.")
+    print(f"{matched} of {len(masses)} masses matched {matches} entries within {args.tolerance_ppm:g} ppm, saved "
+          f"to {args.query_output}.")
+
+
+def main():
+    import_seconds = time.perf_counter() - IMPORT_START
+    parser = argparse.ArgumentParser(description='Process some sequences.')
+    parser.add_argument('--name', type=str, help='Name of the protein')
+    parser.add_argument('--sequence', type=str, help='Sequence to be processed')
+    parser.add_argument('--fasta', type=str,
+                        help='(Gzipped) multi-FASTA file to process in batch mode, instead of --name/--sequence')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Results table with one row per protein, always written in batch mode (default: '
+                             'results.<format>) and only when given for a single sequence')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='tsv',
+                        help='Format of the results table: tsv, json or parquet (needs pyarrow) (default: tsv)')
+    parser.add_argument('--reports', type=str, default=None,
+                        help='Directory to write a report for every protein in batch mode (default: no reports)')
+    parser.add_argument('--summary', type=str, default=None,
+                        help='Paginated HTML summary report of all proteins written in batch mode (default: none)')
+    parser.add_argument('--workers', type=int, default=get_worker_count(),
+                        help='Number of worker processes in batch mode (default: $GALAXY_SLOTS or 1)')
+    parser.add_argument('--ph-step', type=float, default=0.5,
+                        help='Resolution of the pH grid (from pH 2 to 12) at which the net charge is reported (default: 0.5)')
+    parser.add_argument('--plot-backend', choices=sorted(PLOT_BACKENDS), default='matplotlib',
+                        help='Renderer of the static titration curve: matplotlib (PNG) or svg (SVG, no plotting '
+                             'library needed) (default: matplotlib)')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='Directory of the result cache, can be shared between jobs (default: no cache)')
+    parser.add_argument('--cache-max-size', type=float, default=DEFAULT_MAX_SIZE,
+                        help=f'Maximum size of the result cache in MB (default: {DEFAULT_MAX_SIZE})')
+    parser.add_argument('--window', type=int, default=None,
+                        help=f'Calculate sliding window profiles of hydropathy, net charge and dn/dc with windows of '
+                             f'this many residues, e.g. {DEFAULT_WINDOW} (default: no profiles)')
+    parser.add_argument('--window-step', type=int, default=DEFAULT_STEP,
+                        help=f'Number of residues between consecutive windows (default: {DEFAULT_STEP})')
+    parser.add_argument('--window-ph', type=float, default=DEFAULT_PH,
+                        help=f'pH at which the net charge profile is calculated (default: {DEFAULT_PH})')
+    parser.add_argument('--window-format', choices=PROFILE_FORMATS, default='tsv',
+                        help='Format of the profile: a TSV table or a NumPy .npy array (default: tsv)')
+    parser.add_argument('--window-output', type=str, default=None,
+                        help='Path of the profile file (default: profile.tsv or profile.npy)')
+    parser.add_argument('--digest', choices=list(ENZYMES) + ['custom'], default=None,
+                        help='Digest the protein(s) in silico with this enzyme, or with --cleavage-rule for custom '
+                             '(default: no digestion)')
+    parser.add_argument('--cleavage-rule', type=str, default=None,
+                        help='Regular expression of a custom cleavage rule, the sequence is cleaved after every '
+                             'match, e.g. "[KR](?!P)" for trypsin')
+    parser.add_argument('--missed-cleavages', type=int, default=DEFAULT_MISSED_CLEAVAGES,
+                        help=f'Maximum number of missed cleavages of a peptide (default: {DEFAULT_MISSED_CLEAVAGES})')
+    parser.add_argument('--min-peptide-length', type=int, default=DEFAULT_MIN_PEPTIDE_LENGTH,
+                        help=f'Minimum number of residues of a peptide (default: {DEFAULT_MIN_PEPTIDE_LENGTH})')
+    parser.add_argument('--max-peptide-length', type=int, default=DEFAULT_MAX_PEPTIDE_LENGTH,
+                        help=f'Maximum number of residues of a peptide, 0 for no maximum '
+                             f'(default: {DEFAULT_MAX_PEPTIDE_LENGTH})')
+    parser.add_argument('--digest-format', choices=DIGEST_FORMATS, default='tsv',
+                        help='Format of the peptide table: a TSV table or a NumPy .npy array (default: tsv)')
+    parser.add_argument('--digest-output', type=str, default=None,
+                        help='Path of the peptide table (default: digest.tsv or digest.npy)')
+    parser.add_argument('--query-masses', type=str, default=None,
+                        help='Match the observed masses in the first column of this file against the proteins of '
+                             '--fasta, and their peptides with --digest, instead of calculating their properties')
+    parser.add_argument('--tolerance-ppm', type=float, default=DEFAULT_TOLERANCE_PPM,
+                        help=f'Mass tolerance of a match in ppm (default: {DEFAULT_TOLERANCE_PPM:g})')
+    parser.add_argument('--mass-type', choices=MASS_TYPES, default='monoisotopic',
+                        help='Masses of the index: monoisotopic or average (default: monoisotopic)')
+    parser.add_argument('--index-dir', type=str, default='mass_index',
+                        help='Directory of the mass indexes, can be shared between jobs so the index of a '
+                             'proteome is only built once (default: mass_index)')
+    parser.add_argument('--query-output', type=str, default='matches.tsv',
+                        help='Path of the table of matches (default: matches.tsv)')
+    parser.add_argument('--serve', action='store_true',
+                        help='Run as a persistent worker, reading JSON-lines requests from stdin and writing one '
+                             'JSON response per line to stdout')
+    parser.add_argument('--socket', type=str, default=None,
+                        help='Run as a persistent worker listening on this Unix socket path instead of stdin')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='Write the wall time, CPU time and peak memory of every stage to this JSON file '
+                             '(default: no profiling)')
+    parser.add_argument('--profile-stats', type=str, default=None,
+                        help='Write a cProfile dump of the run to this file, to read with pstats (default: none)')
+    parser.add_argument('-v', '--version', action='version', version=f'%(prog)s {VERSION}', help='Show the version of the tool and exit')
+
+    args = parser.parse_args()
+    if args.ph_step <= 0:
+        parser.error('--ph-step should be positive')
+    if args.window is not None and (args.window <= 0 or args.window_step <= 0):
+        parser.error('--window and --window-step should be positive')
+    if args.output_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        parser.error('--output-format parquet needs the pyarrow package')
+    if args.digest and (args.missed_cleavages < 0 or args.min_peptide_length < 1 or args.max_peptide_length < 0):
+        parser.error('--missed-cleavages and --max-peptide-length should not be negative, --min-peptide-length '
+                     'should be positive')
+    if (args.digest == 'custom') != bool(args.cleavage_rule):
+        parser.error('--cleavage-rule is required with --digest custom, and only used with it')
+    if args.query_masses and (not args.fasta or args.tolerance_ppm <= 0):
+        parser.error('--query-masses needs --fasta and a positive --tolerance-ppm')
+    if (args.profile or args.profile_stats) and (args.serve or args.socket):
+        parser.error('--profile and --profile-stats cannot be used with --serve or --socket')
+
+    metrics = StageMetrics() if args.profile else NO_METRICS
+    metrics.add('imports', import_seconds)
+    profiler = None
+    if args.profile_stats:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        run(args, parser, metrics)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile_stats)
+        if args.profile:
+            metrics.write(args.profile, tool='protein_calculator', version=VERSION,
+                          mode='query' if args.query_masses else 'batch' if args.fasta else 'single',
+                          plot_backend=args.plot_backend, python=sys.version.split()[0])
+
+
+def run(args, parser, metrics=NO_METRICS):
+    """
+    Runs the tool for the parsed command line arguments, with the stages timed by metrics.
+    """
+    pH_values = ph_grid(step=args.ph_step)
+    profile_options = None
+    if args.window:
+        profile_options = {'window': args.window, 'step': args.window_step, 'pH': args.window_ph,
+                           'format': args.window_format,
+                           'path': args.window_output or f'profile.{args.window_format}'}
+    digest_options = None
+    if args.digest:
+        try:
+            rule = cleavage_rule(args.digest, args.cleavage_rule)
+        except ValueError as error:
+            parser.error(str(error))
+        digest_options = {'rule': rule, 'missed_cleavages': args.missed_cleavages,
+                          'min_length': args.min_peptide_length, 'max_length': args.max_peptide_length or None,
+                          'format': args.digest_format,
+                          'path': args.digest_output or f'digest.{args.digest_format}'}
+    cache = ResultCache(args.cache_dir, VERSION, args.cache_max_size) if args.cache_dir else None
+
+    if args.serve or args.socket:
+        handler = partial(handle_worker_request, default_pH_values=pH_values, default_plot_backend=args.plot_backend,
+                          cache=cache)
+        if args.socket:
+            serve_socket(handler, args.socket)
+        else:
+            serve_stream(handler)
+        return
+
+    if args.query_masses:
+        run_mass_query(args, digest_options, metrics)
+        return
+
+    if args.fasta:
+        report_writer = partial(write_protein_report, plot_backend=args.plot_backend, profile_options=profile_options)
+        # the records stream through reading, calculation and writing at once, so the batch is a single stage
+        with metrics.stage('batch'):
+            run_batch(args.fasta, args.output or f'results.{args.output_format}', output_format=args.output_format,
+                      reports_dir=args.reports, workers=args.workers, report_writer=report_writer,
+                      pH_values=pH_values, cache=cache, profile_options=profile_options, summary_path=args.summary)
+        if cache:
+            with metrics.stage('cache_eviction'):
+                cache.evict()
+        if digest_options:
+            # second pass over the FASTA file, the peptides of one protein are held in memory at a time
+            with metrics.stage('digestion'):
+                proteins, peptides = write_digest(read_fasta(args.fasta), digest_options)
+            print(f"Digested {proteins} proteins into {peptides} peptides and saved them to {digest_options['path']}.")
+        return
+
+    if not args.name or not args.sequence:
+        parser.error('--name and --sequence are required unless --fasta is given')
+
+    name = args.name
+    sequence = args.sequence.upper()
+
+    # Normaliseer de sequentie om spaties en enters te verwijderen en controleer de geldigheid van de sequentie
+    with metrics.stage('validation'):
+        sequence = normalize_sequence(sequence)
+        error_message = check_protein_sequence(sequence)
+
+    if error_message:
+        if args.output:
+            write_results([{'name': name, 'error': error_message}], args.output, args.output_format, pH_values)
+        print(f"Error: {error_message}")
+        return
 
-    # Render the template with data
-    output = template.render(data)
+    properties, _ = run_single(name, sequence, pH_values, args.plot_backend, cache, profile_options=profile_options,
+                               metrics=metrics)
+    if args.output:
+        with metrics.stage('results_table'):
+            write_results([{'name': name, 'error': None, **properties}], args.output, args.output_format, pH_values)
 
-    # Save or display the rendered output
-    with open('report.html', 'w') as f:
-        f.write(output)
+    if digest_options:
+        with metrics.stage('digestion'):
+            _, peptides = write_digest([(name, sequence)], digest_options)
 
     print("HTML rendered and saved to report.html.")
+    if profile_options:
+        print(f"Sliding window profile saved to {profile_options['path']}.")
+    if digest_options:
+        print(f"Digested into {peptides} peptides and saved them to {digest_options['path']}.")
 
 if __name__ == '__main__':
     main()
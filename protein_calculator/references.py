@@ -37,7 +37,7 @@ amino_acid_data = {
 # extinction coeff were obtained from: https://web.expasy.org/protparam/protparam-doc.html
 # pK values were obtained from: https://www.vanderbilt.edu/AnS/Chemistry/Rizzo/stuff/AA/AminoAcids.html
 
-#The pI and net_charges are calculated using the Bio.SeqUtils.IsoelectricPoint module (https://biopython.org/docs/1.76/api/Bio.SeqUtils.IsoelectricPoint.html)
+#The pI and net_charges are calculated as in the Bio.SeqUtils.IsoelectricPoint module (https://biopython.org/docs/1.76/api/Bio.SeqUtils.IsoelectricPoint.html), see Titration_functions.py
 #* Bjellqvist, B.,Hughes, G.J., Pasquali, Ch., Paquet, N., Ravier, F.,
 #Sanchez, J.-Ch., Frutiger, S. & Hochstrasser, D.F.
 #The focusing positions of polypeptides in immobilized pH gradients can be
@@ -78,3 +78,51 @@ charges = {
     'Nterm': 1,
     'Cterm': -1
 }
+
+# pK values of the ionizable groups used for the pI and net charges, identical to the values used by
+# Bio.SeqUtils.IsoelectricPoint (Bjellqvist et al., see above). The sign of each group is taken from charges.
+ionizable_pK_values = {
+    'Nterm': 7.5, 'K': 10.0, 'R': 12.0, 'H': 5.98,
+    'Cterm': 3.55, 'D': 4.05, 'E': 4.45, 'C': 9.0, 'Y': 10.0
+}
+
+# Residue specific pK values of the N-terminal amino group and C-terminal carboxyl group
+pK_nterminal = {'A': 7.59, 'M': 7.0, 'S': 6.93, 'P': 8.36, 'T': 6.82, 'V': 7.44, 'E': 7.7}
+pK_cterminal = {'D': 4.55, 'E': 4.75}
+
+# Hydropathy index of every amino acid, used for the sliding window hydropathy profile. Values from
+# Kyte, J. & Doolittle, R.F. A simple method for displaying the hydropathic character of a protein.
+# J. Mol. Biol. 1982, 157, 105-132. Pyrrolysine and selenocysteine are not part of the scale and count as 0.
+kyte_doolittle = {
+    'A': 1.8, 'R': -4.5, 'N': -3.5, 'D': -3.5, 'C': 2.5, 'Q': -3.5, 'E': -3.5, 'G': -0.4, 'H': -3.2, 'I': 4.5,
+    'L': 3.8, 'K': -3.9, 'M': 1.9, 'F': 2.8, 'P': -1.6, 'S': -0.8, 'T': -0.7, 'W': -0.9, 'Y': -1.3, 'V': 4.2
+}
+
+# Elemental formula of every amino acid residue (the amino acid minus one water molecule), the formula of a
+# protein is the sum of its residues plus one water molecule.
+residue_formulas = {
+    'A': {'C': 3, 'H': 5, 'N': 1, 'O': 1}, 'R': {'C': 6, 'H': 12, 'N': 4, 'O': 1},
+    'N': {'C': 4, 'H': 6, 'N': 2, 'O': 2}, 'D': {'C': 4, 'H': 5, 'N': 1, 'O': 3},
+    'C': {'C': 3, 'H': 5, 'N': 1, 'O': 1, 'S': 1}, 'E': {'C': 5, 'H': 7, 'N': 1, 'O': 3},
+    'Q': {'C': 5, 'H': 8, 'N': 2, 'O': 2}, 'G': {'C': 2, 'H': 3, 'N': 1, 'O': 1},
+    'H': {'C': 6, 'H': 7, 'N': 3, 'O': 1}, 'I': {'C': 6, 'H': 11, 'N': 1, 'O': 1},
+    'L': {'C': 6, 'H': 11, 'N': 1, 'O': 1}, 'K': {'C': 6, 'H': 12, 'N': 2, 'O': 1},
+    'M': {'C': 5, 'H': 9, 'N': 1, 'O': 1, 'S': 1}, 'F': {'C': 9, 'H': 9, 'N': 1, 'O': 1},
+    'O': {'C': 12, 'H': 19, 'N': 3, 'O': 2}, 'P': {'C': 5, 'H': 7, 'N': 1, 'O': 1},
+    'S': {'C': 3, 'H': 5, 'N': 1, 'O': 2}, 'T': {'C': 4, 'H': 7, 'N': 1, 'O': 2},
+    'U': {'C': 3, 'H': 5, 'N': 1, 'O': 1, 'Se': 1}, 'W': {'C': 11, 'H': 10, 'N': 2, 'O': 1},
+    'Y': {'C': 9, 'H': 9, 'N': 1, 'O': 2}, 'V': {'C': 5, 'H': 9, 'N': 1, 'O': 1}
+}
+
+# Stable isotopes of the elements of proteins as (mass in Da, abundance) pairs, lightest first. Masses and
+# representative isotopic compositions from the NIST Atomic Weights and Isotopic Compositions database
+# (https://www.nist.gov/pml/atomic-weights-and-isotopic-compositions-relative-atomic-masses).
+isotopes = {
+    'C': [(12.0, 0.9893), (13.0033548378, 0.0107)],
+    'H': [(1.00782503207, 0.999885), (2.0141017778, 0.000115)],
+    'N': [(14.0030740048, 0.99636), (15.0001088982, 0.00364)],
+    'O': [(15.99491461956, 0.99757), (16.99913170, 0.00038), (17.9991610, 0.00205)],
+    'S': [(31.97207100, 0.9499), (32.97145876, 0.0075), (33.96786690, 0.0425), (35.96708076, 0.0001)],
+    'Se': [(73.9224764, 0.0089), (75.9192136, 0.0937), (76.9199140, 0.0763), (77.9173091, 0.2377),
+           (79.9165213, 0.4961), (81.9166994, 0.0873)]
+}